@@ -7,12 +7,54 @@ class Settings:
     cors_origins: list = ["http://localhost:3000"]
     host: str = "0.0.0.0"
     port: int = 8000
+    log_level: str = os.getenv("LOG_LEVEL", "INFO")
     
+    # データベース設定
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "8"))
+    db_busy_timeout: int = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))  # ミリ秒
+    # 書き込みスレッドが1回のコミットにまとめる最大書き込み数
+    db_write_batch_size: int = int(os.getenv("DB_WRITE_BATCH_SIZE", "64"))
+    # メモリ上にキャッシュするデバイスの最大件数（0でキャッシュしない）
+    device_cache_size: int = int(os.getenv("DEVICE_CACHE_SIZE", "10000"))
+
     # DPP設定
     dpp_interface: str = os.getenv("DPP_INTERFACE", "test")
+    # プロビジョニングに使用するインターフェース（カンマ区切り、未指定時は DPP_INTERFACE のみ）
+    dpp_interfaces: list = [name.strip() for name in os.getenv("DPP_INTERFACES", "").split(",") if name.strip()]
     dpp_timeout: int = int(os.getenv("DPP_TIMEOUT", "30"))
     hostapd_socket_dir: str = os.getenv("HOSTAPD_SOCKET_DIR", "/var/run/hostapd")
+    # hostapdへのコマンド送信方式: "inprocess"（HostapdClientを直接使用）または "subprocess"（CLIを起動）
+    dpp_mode: str = os.getenv("DPP_MODE", "inprocess")
+    # DPP_AUTH_INITの応答ではなくhostapdのDPPイベント（DPP-CONF-SENT など）で結果を判定する
+    dpp_wait_events: bool = os.getenv("DPP_WAIT_EVENTS", "true").lower() == "true"
+    # インターフェースごとのプロビジョニングワーカー数（hostapdは1インターフェースにつき1つのDPP交換のみ処理できる）
+    # DPP_WAIT_EVENTSが有効な場合、ローカルのインターフェースでは1に制限する
+    dpp_workers_per_interface: int = int(os.getenv("DPP_WORKERS_PER_INTERFACE", "1"))
+    # インターフェースごとに保持する制御ソケット接続の最大数（同時実行可能なコマンド数）
+    hostapd_max_connections: int = int(os.getenv("HOSTAPD_MAX_CONNECTIONS", "4"))
+    # 同じチャンネルのジョブを続けて処理する間に、他チャンネルのジョブを待たせる最大時間（秒）
+    dpp_channel_max_wait: float = float(os.getenv("DPP_CHANNEL_MAX_WAIT", "10"))
+    # DPP失敗時の再試行（最大試行回数に達したデバイスは"dead_letter"になる）
+    dpp_max_attempts: int = int(os.getenv("DPP_MAX_ATTEMPTS", "3"))
+    dpp_retry_base_delay: float = float(os.getenv("DPP_RETRY_BASE_DELAY", "2"))  # 秒
+    dpp_retry_max_delay: float = float(os.getenv("DPP_RETRY_MAX_DELAY", "60"))  # 秒
+    # hostapdのステーション一覧とデバイスの接続状態（online / offline）を照合する間隔（秒、0で無効）
+    station_sync_interval: float = float(os.getenv("STATION_SYNC_INTERVAL", "30"))
+    # onlineのままのデバイスの last_seen をDBに書き込む頻度（照合N回ごと、0で書き込まない）
+    station_last_seen_write_every: int = int(os.getenv("STATION_LAST_SEEN_WRITE_EVERY", "10"))
     
+    # 各APのhostapdの隣で動かすプロビジョニングエージェント（"名前=URL" のカンマ区切り）
+    provisioning_agents: dict = dict(
+        entry.strip().split("=", 1) for entry in os.getenv("PROVISIONING_AGENTS", "").split(",") if "=" in entry
+    )
+    # エージェントの死活監視の間隔（秒）と、停止とみなすまでの連続失敗回数
+    agent_heartbeat_interval: float = float(os.getenv("AGENT_HEARTBEAT_INTERVAL", "10"))
+    agent_max_failures: int = int(os.getenv("AGENT_MAX_FAILURES", "3"))
+    # エージェントへのリクエストに付与する X-Agent-Token
+    agent_token: str = os.getenv("AGENT_TOKEN", "")
+    # https:// のエージェントの証明書を検証するCA証明書（未指定の場合はシステムの証明書ストア）
+    agent_ca_file: str = os.getenv("AGENT_CA_FILE", "")
+
     # CLIスクリプトのパス
     cli_script_path: str = os.getenv(
         "CLI_SCRIPT_PATH",
@@ -20,4 +62,13 @@ class Settings:
     )
 
 
+    @property
+    def provisioning_interfaces(self) -> list:
+        """このホストのhostapdでプロビジョニングに使用するインターフェース"""
+        if self.dpp_interfaces:
+            return self.dpp_interfaces
+        # エージェントを使用する場合、DPP_INTERFACES を指定しなければローカルのhostapdは使わない
+        return [] if self.provisioning_agents else [self.dpp_interface]
+
+
 settings = Settings()
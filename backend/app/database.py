@@ -1,67 +1,673 @@
+import asyncio
+import base64
+import functools
+import json
 import sqlite3
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from . import metrics
+from .config import settings
+from .device_cache import DeviceCache
+from .events import device_events
 
 DATABASE_FILE = "devices.db"
 
-# ログ設定
-logging.basicConfig(level=logging.INFO)
+# ログの出力形式とレベルは main.py で設定する
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_FILE)
+# 接続ごとにキャッシュするプリペアドステートメントの数
+_STATEMENT_CACHE_SIZE = 256
+
+# APIで取得可能なデバイスのフィールド
+DEVICE_FIELDS = [
+    'id', 'mac_address', 'channel', 'key', 'date', 'name', 'ssid', 'status', 'password', 'room', 'desc', 'last_seen',
+    'profile_id'
+]
+
+# IDで取得するデバイスのキャッシュ（書き込みはコミット後に反映する）
+_device_cache = DeviceCache(DEVICE_FIELDS, settings.device_cache_size)
+
+# デバイスに設定できるステータス
+DEVICE_STATUSES = ['scanned', 'configuring', 'configured', 'error', 'dead_letter', 'online', 'offline']
+
+# プロビジョニング済みのデバイスのステータス（"online" / "offline" はhostapdのステーション一覧との照合結果）
+PROVISIONED_STATUSES = ('configured', 'online', 'offline')
+
+# 認証情報プロファイルで使用できるAKM
+CREDENTIAL_AKMS = ('psk', 'sae', 'psk+sae')
+
+# PUT /api/devices/{id} で更新できるフィールド
+_UPDATABLE_FIELDS = ('name', 'ssid', 'password', 'room', 'desc', 'status')
+
+# よく使うSQL文（同一文字列を使うことで接続ごとのステートメントキャッシュが再利用される）
+_SELECT_DEVICES_SQL = '''
+    SELECT id, mac_address, channel, key, date, name, ssid, status, password, room, desc, last_seen, profile_id
+    FROM devices
+'''
+# 書き込んだ行をそのまま返し、書き込み後の再読み込みを省く（SQLite 3.35以降）
+_RETURNING_DEVICE_SQL = f" RETURNING {', '.join(DEVICE_FIELDS)}"
+_INSERT_DEVICE_COLUMNS_SQL = '''
+    INSERT INTO devices (
+        mac_address, channel, key, date, name, ssid, status, password, room, desc, profile_id, created_at, updated_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_INSERT_DEVICE_SQL = _INSERT_DEVICE_COLUMNS_SQL + _RETURNING_DEVICE_SQL
+_UPDATE_PROVISIONING_SQL = '''
+    UPDATE devices SET channel = ?, ssid = ?, password = ?, profile_id = ?, room = ?, status = ?, updated_at = ?
+    WHERE id = ?
+''' + _RETURNING_DEVICE_SQL
+
+
+_QUERY_SECONDS = metrics.histogram(
+    "qrdia_db_query_duration_seconds", "database関数ごとの読み取り時間（接続の取得待ちを含む）", ["function"]
+)
+_POOL_WAIT_SECONDS = metrics.histogram(
+    "qrdia_db_pool_wait_seconds", "読み取り用接続プールから接続を取得するまでの待ち時間"
+)
+_WRITE_SECONDS = metrics.histogram(
+    "qrdia_db_write_duration_seconds", "database関数ごとの書き込み時間（書き込みキューの待ちとコミットを含む）", ["function"]
+)
+_COMMIT_SECONDS = metrics.histogram(
+    "qrdia_db_commit_duration_seconds", "書き込みスレッドが1回のトランザクションをコミットするまでの時間"
+)
+_WRITE_BATCH_SIZE = metrics.histogram(
+    "qrdia_db_write_batch_size", "1回のコミットにまとめられた書き込み数", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+
+def _timed(fn: Callable) -> Callable:
+    """読み取り関数の所要時間を記録する"""
+    histogram = _QUERY_SECONDS.labels(function=fn.__name__)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with histogram.time():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def _connect(database_file: str, **kwargs) -> sqlite3.Connection:
+    """WALモードのSQLite接続を開く"""
+    conn = sqlite3.connect(
+        database_file,
+        timeout=settings.db_busy_timeout / 1000,
+        check_same_thread=False,
+        cached_statements=_STATEMENT_CACHE_SIZE,
+        **kwargs
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(settings.db_busy_timeout)}")
     return conn
 
+
+class ConnectionPool:
+    """WALモードで開いたSQLite接続を使い回す接続プール（読み取り用）"""
+
+    def __init__(self, database_file: str, size: int):
+        self.database_file = database_file
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._connections) < self.size:
+                conn = _connect(self.database_file)
+                self._connections.append(conn)
+                return conn
+        # 上限に達している場合は返却を待つ
+        with _POOL_WAIT_SECONDS.time():
+            return self._idle.get()
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+
+# on_commit: コミット成功後に実行するコールバックの一覧
+WriteOp = Callable[..., object]
+
+
+class WriteQueue:
+    """
+    書き込みを専用スレッドで直列化し、キューに溜まった書き込みを1回のコミットにまとめる（グループコミット）
+    各書き込みはSAVEPOINTで区切り、失敗した書き込みだけを取り消す
+    """
+
+    def __init__(self, database_file: str, max_batch: int):
+        self.database_file = database_file
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[Tuple[WriteOp, tuple, Future]]]" = queue.Queue()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+
+    def start(self):
+        # トランザクションは明示的に管理する
+        self._conn = _connect(self.database_file, isolation_level=None)
+        self._thread.start()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._conn.close()
+
+    def submit(self, op: WriteOp, *args) -> Future:
+        """op(conn, on_commit, *args) を書き込みスレッドで実行する"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("書き込みスレッドから書き込みを投入することはできません")
+        future: Future = Future()
+        self._queue.put((op, args, future))
+        return future
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch: List[Tuple[WriteOp, tuple, Future]]):
+        conn = self._conn
+        results = []
+        on_commit: List[Callable[[], None]] = []
+        _WRITE_BATCH_SIZE.observe(len(batch))
+        start = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op, args, future in batch:
+                callbacks: List[Callable[[], None]] = []
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    result = op(conn, callbacks, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    results.append((future, None, e))
+                    continue
+                conn.execute("RELEASE write_op")
+                results.append((future, result, None))
+                on_commit.extend(callbacks)
+            conn.execute("COMMIT")
+            _COMMIT_SECONDS.observe(time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"書き込みのコミットに失敗しました: {str(e)}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        # 書き込みの完了を待つ呼び出し元が直後に読み取ってもキャッシュが更新済みになるよう、先にコールバックを実行する
+        for callback in on_commit:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"コミット後の処理でエラーが発生しました: {str(e)}")
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_pool: Optional[ConnectionPool] = None
+_writer: Optional[WriteQueue] = None
+_read_executor: Optional[ThreadPoolExecutor] = None
+_database_lock = threading.Lock()
+# (mac_address, key) の一意インデックスを作成できたか（重複のある既存のデータベースではFalse）
+_mac_key_unique = True
+
+
+def open_database():
+    """読み取り用の接続プールと書き込みスレッドを開始（FastAPIのlifespanで呼び出す）"""
+    global _pool, _writer, _read_executor
+    with _database_lock:
+        if _pool is None:
+            _pool = ConnectionPool(DATABASE_FILE, settings.db_pool_size)
+            _read_executor = ThreadPoolExecutor(
+                max_workers=settings.db_pool_size, thread_name_prefix="db-read"
+            )
+            _writer = WriteQueue(DATABASE_FILE, settings.db_write_batch_size)
+            _writer.start()
+
+
+def close_database():
+    """書き込みスレッドを停止し、全接続を閉じる"""
+    global _pool, _writer, _read_executor
+    with _database_lock:
+        pool, writer, read_executor = _pool, _writer, _read_executor
+        _pool, _writer, _read_executor = None, None, None
+    if writer is not None:
+        writer.stop()
+    _device_cache.clear()
+    if read_executor is not None:
+        read_executor.shutdown()
+    if pool is not None:
+        pool.close()
+
+
+@contextmanager
+def get_db_connection() -> Iterator[sqlite3.Connection]:
+    """プールから接続を借りる（未作成ならプールを作成する）"""
+    if _pool is None:
+        open_database()
+    pool = _pool
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def _write(op: WriteOp, *args):
+    """書き込みスレッドで実行し、コミットされるまで待つ"""
+    if _writer is None:
+        open_database()
+    with _WRITE_SECONDS.labels(function=op.__name__.lstrip('_')).time():
+        return _writer.submit(op, *args).result()
+
+
+async def _write_async(op: WriteOp, *args):
+    """書き込みスレッドで実行し、イベントループを止めずにコミットを待つ"""
+    if _writer is None:
+        open_database()
+    start = time.perf_counter()
+    try:
+        return await asyncio.wrap_future(_writer.submit(op, *args))
+    finally:
+        _WRITE_SECONDS.labels(function=op.__name__.lstrip('_')).observe(time.perf_counter() - start)
+
+
+metrics.gauge_callback(
+    "qrdia_db_write_queue_depth", "書き込みスレッドの待機中の書き込み数", [],
+    lambda: {(): _writer.depth() if _writer is not None else 0}
+)
+metrics.gauge_callback(
+    "qrdia_device_cache_size", "キャッシュしているデバイス数", [], lambda: {(): len(_device_cache)}
+)
+
+
+async def run_read(fn: Callable, *args, **kwargs):
+    """同期の読み取り関数を読み取り用スレッドプールで実行する"""
+    if _read_executor is None:
+        open_database()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, functools.partial(fn, *args, **kwargs))
+
+
 def init_database():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS devices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            mac_address TEXT NOT NULL,
-            channel TEXT NOT NULL,
-            key TEXT NOT NULL,
-            date TEXT DEFAULT CURRENT_TIMESTAMP,
-            name TEXT,
-            ssid TEXT,
-            status TEXT DEFAULT 'scanned',
-            password TEXT,
-            room TEXT,
-            desc TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-def get_all_devices() -> List[Dict]:
-    """全てのデバイスを取得"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, mac_address, channel, key, date, name, ssid, status, password, room, desc
+    global _mac_key_unique
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        raise RuntimeError(f"SQLite 3.35以降が必要です（RETURNING句を使用）: {sqlite3.sqlite_version}")
+    with get_db_connection() as conn, conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS devices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mac_address TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                key TEXT NOT NULL,
+                date TEXT DEFAULT CURRENT_TIMESTAMP,
+                name TEXT,
+                ssid TEXT,
+                status TEXT DEFAULT 'scanned',
+                password TEXT,
+                room TEXT,
+                desc TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                last_seen TEXT,
+                profile_id INTEGER
+            )
+        ''')
+        # 既存のデータベースに追加された列を作成する
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(devices)')}
+        if 'last_seen' not in columns:
+            conn.execute('ALTER TABLE devices ADD COLUMN last_seen TEXT')
+        if 'profile_id' not in columns:
+            conn.execute('ALTER TABLE devices ADD COLUMN profile_id INTEGER')
+        # 一覧取得（キーセットページネーションと絞り込み）用のインデックス
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_devices_created_at ON devices (created_at, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_devices_status ON devices (status, created_at, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_devices_room ON devices (room, created_at, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_devices_ssid ON devices (ssid, created_at, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_devices_mac_address ON devices (mac_address)')
+        # 同じデバイス（MACアドレスと公開鍵）の重複登録を防ぐ
+        try:
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_devices_mac_key ON devices (mac_address, key)')
+            _mac_key_unique = True
+        except sqlite3.IntegrityError:
+            logger.warning(
+                "同じ (mac_address, key) のデバイスが複数登録されているため一意インデックスを作成できません。"
+                "重複を解消するまで通常のインデックスで検索し、インポートは行ごとに更新・追加します"
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_devices_mac_key_dup ON devices (mac_address, key)')
+            _mac_key_unique = False
+        # 差分取得（since）用のインデックス
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_devices_updated_at ON devices (updated_at, id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS provisioning_attempts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id INTEGER NOT NULL,
+                job_id TEXT NOT NULL,
+                attempt INTEGER NOT NULL,
+                interface TEXT,
+                success INTEGER NOT NULL,
+                message TEXT,
+                started_at TEXT NOT NULL,
+                finished_at TEXT NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_provisioning_attempts_device_id
+            ON provisioning_attempts (device_id, id)
+        ''')
+        # 複数のデバイスで共有するWi-Fiの認証情報（作成後は変更しない）
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS credential_profiles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                ssid TEXT NOT NULL,
+                akm TEXT NOT NULL DEFAULT 'psk',
+                password TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS dpp_configurators (
+                interface TEXT PRIMARY KEY,
+                configurator_id TEXT NOT NULL,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+
+def encode_cursor(created_at: str, device_id: int) -> str:
+    """ページネーション用のカーソルを作成"""
+    raw = json.dumps([created_at, device_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """カーソルを (created_at, id) に戻す（不正な場合はValueError）"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, device_id = json.loads(raw)
+    except Exception:
+        raise ValueError(f"invalid cursor: {cursor}")
+    if not isinstance(created_at, str) or not isinstance(device_id, int):
+        raise ValueError(f"invalid cursor: {cursor}")
+    return created_at, device_id
+
+
+def _select_devices(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    room: Optional[str] = None,
+    ssid: Optional[str] = None,
+    mac_prefix: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_before: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None
+) -> Tuple[List[str], List[tuple], Optional[str]]:
+    columns = list(fields) if fields else DEVICE_FIELDS
+    unknown_fields = [field for field in columns if field not in DEVICE_FIELDS]
+    if unknown_fields:
+        raise ValueError(f"unknown fields: {', '.join(unknown_fields)}")
+
+    conditions = []
+    params: List = []
+
+    if status is not None:
+        conditions.append('status = ?')
+        params.append(status)
+    if room is not None:
+        conditions.append('room = ?')
+        params.append(room)
+    if ssid is not None:
+        conditions.append('ssid = ?')
+        params.append(ssid)
+    if mac_prefix:
+        # GLOBはBINARY照合のインデックスで前方一致検索できる
+        conditions.append('mac_address GLOB ?')
+        params.append(mac_prefix + '*')
+    if created_from is not None:
+        conditions.append('created_at >= ?')
+        params.append(created_from)
+    if created_before is not None:
+        conditions.append('created_at < ?')
+        params.append(created_before)
+    if cursor is not None:
+        conditions.append('(created_at, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+
+    # 末尾の2列はカーソルの作成に使用する
+    sql = f"SELECT {', '.join(columns)}, created_at, id FROM devices"
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY created_at DESC, id DESC'
+    if limit is not None:
+        # 次ページの有無を判定するため1件多く取得する
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+
+    rows = _fetch_tuples(sql, params)
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][-2], rows[-1][-1])
+
+    return columns, rows, next_cursor
+
+
+def _select_devices_since(
+    since: str,
+    limit: Optional[int] = None,
+    fields: Optional[Sequence[str]] = None
+) -> Tuple[List[str], List[tuple], str]:
+    columns = list(fields) if fields else DEVICE_FIELDS
+    unknown_fields = [field for field in columns if field not in DEVICE_FIELDS]
+    if unknown_fields:
+        raise ValueError(f"unknown fields: {', '.join(unknown_fields)}")
+
+    updated_at, device_id = decode_cursor(since)
+    sql = f'''
+        SELECT {', '.join(columns)}, updated_at, id
         FROM devices
-        ORDER BY created_at DESC
-    ''')
-    devices = cursor.fetchall()
-    conn.close()
-    
-    # Row オブジェクトを辞書に変換
-    return [dict(device) for device in devices]
+        WHERE (updated_at, id) > (?, ?)
+        ORDER BY updated_at, id
+    '''
+    params: List = [updated_at, device_id]
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
 
-def create_device(device_data: Dict) -> int:
-    """新しいデバイスを作成"""
-    current_time = datetime.now().isoformat()
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO devices (mac_address, channel, key, date, name, ssid, status, password, room, desc, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+    rows = _fetch_tuples(sql, params)
+
+    next_since = encode_cursor(rows[-1][-2], rows[-1][-1]) if rows else since
+    return columns, rows, next_since
+
+
+def _fetch_tuples(sql: str, params: Sequence) -> List[tuple]:
+    """sqlite3.Rowを作らずにタプルのまま全行を読み出す"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        return cursor.execute(sql, params).fetchall()
+
+
+def _to_dicts(columns: List[str], rows: List[tuple]) -> List[Dict]:
+    return [dict(zip(columns, row)) for row in rows]
+
+
+@_timed
+def query_devices(**kwargs) -> Tuple[List[Dict], Optional[str]]:
+    """
+    デバイスを作成日時の新しい順に取得
+    (created_at, id) によるキーセットページネーションと絞り込み（limit, cursor, status, room, ssid,
+    mac_prefix, created_from, created_before）を行い、fieldsで返すフィールドを限定する
+    Returns: (デバイス一覧, 次ページのカーソル)
+    """
+    columns, rows, next_cursor = _select_devices(**kwargs)
+    return _to_dicts(columns, rows), next_cursor
+
+
+@_timed
+def query_device_rows(**kwargs) -> Tuple[List[str], List[tuple], Optional[str]]:
+    """
+    query_devices と同じ条件でデバイスを取得し、辞書を作らずにタプルのまま返す（一覧のJSONを直接作成する場合に使用）
+    各行の末尾にはカーソル用の2列が付くため、先頭の len(列名) 列だけを使用する
+    Returns: (列名, 行, 次ページのカーソル)
+    """
+    return _select_devices(**kwargs)
+
+
+@_timed
+def query_devices_since(
+    since: str,
+    limit: Optional[int] = None,
+    fields: Optional[Sequence[str]] = None
+) -> Tuple[List[Dict], str]:
+    """
+    カーソル以降に作成・更新されたデバイスを更新日時の古い順に取得
+    Returns: (デバイス一覧, 次回の差分取得に使うカーソル)
+    """
+    columns, rows, next_since = _select_devices_since(since, limit=limit, fields=fields)
+    return _to_dicts(columns, rows), next_since
+
+
+@_timed
+def query_device_rows_since(
+    since: str,
+    limit: Optional[int] = None,
+    fields: Optional[Sequence[str]] = None
+) -> Tuple[List[str], List[tuple], str]:
+    """query_devices_since のタプル版（Returns: (列名, 行, 次回の差分取得に使うカーソル)）"""
+    return _select_devices_since(since, limit=limit, fields=fields)
+
+
+@_timed
+def get_change_cursor() -> str:
+    """現時点で最新の更新を指す差分取得用カーソルを取得"""
+    with get_db_connection() as conn:
+        row = conn.execute('''
+            SELECT updated_at, id FROM devices ORDER BY updated_at DESC, id DESC LIMIT 1
+        ''').fetchone()
+
+    if row is None:
+        return encode_cursor('', 0)
+    return encode_cursor(row['updated_at'], row['id'])
+
+
+async def query_devices_async(**kwargs) -> Tuple[List[Dict], Optional[str]]:
+    """デバイス一覧をページ単位で取得（非同期）"""
+    return await run_read(query_devices, **kwargs)
+
+
+async def query_devices_since_async(since: str, **kwargs) -> Tuple[List[Dict], str]:
+    """指定カーソル以降に作成・更新されたデバイスを取得（非同期）"""
+    return await run_read(query_devices_since, since, **kwargs)
+
+
+async def query_device_rows_async(**kwargs) -> Tuple[List[str], List[tuple], Optional[str]]:
+    """デバイス一覧をタプルのまま取得（非同期）"""
+    return await run_read(query_device_rows, **kwargs)
+
+
+async def query_device_rows_since_async(since: str, **kwargs) -> Tuple[List[str], List[tuple], str]:
+    """差分取得をタプルのまま行う（非同期）"""
+    return await run_read(query_device_rows_since, since, **kwargs)
+
+
+async def get_change_cursor_async() -> str:
+    """差分取得の起点となるカーソルを取得（非同期）"""
+    return await run_read(get_change_cursor)
+
+
+def _publish_created(device_id: int, device_data: Dict, current_time: str):
+    device_events.publish({
+        "event": "created",
+        "id": device_id,
+        "mac_address": device_data.get('mac_address'),
+        "status": device_data.get('status', 'scanned'),
+        "updated_at": current_time
+    })
+
+
+def _publish_updated(device_id: int, update_fields: Dict, current_time: str):
+    device_events.publish({
+        "event": "updated",
+        "id": device_id,
+        # パスワードは配信しない
+        "fields": {field: value for field, value in update_fields.items() if field != 'password'},
+        "updated_at": current_time
+    })
+
+
+def _on_created(on_commit: List, device: Dict, current_time: str):
+    on_commit.append(functools.partial(_device_cache.put, device))
+    on_commit.append(functools.partial(_publish_created, device['id'], device, current_time))
+
+
+def _on_updated(on_commit: List, devices: List[Dict], update_fields: Dict, current_time: str):
+    """RETURNINGで受け取った更新後の行をキャッシュに反映し、更新したフィールドを配信する"""
+    for device in devices:
+        on_commit.append(functools.partial(_device_cache.put, device))
+        on_commit.append(functools.partial(_publish_updated, device['id'], update_fields, current_time))
+
+
+def _execute_returning(conn: sqlite3.Connection, sql: str, params: Sequence) -> List[Dict]:
+    """RETURNING付きの書き込みを実行して行を返す（文を最後まで実行するため全行を読み出す）"""
+    return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+
+def _insert_device(conn: sqlite3.Connection, on_commit: List, device_data: Dict, current_time: str) -> Dict:
+    (device,) = _execute_returning(conn, _INSERT_DEVICE_SQL, _device_params(device_data, current_time))
+    _on_created(on_commit, device, current_time)
+    return device
+
+
+def _device_params(device_data: Dict, current_time: str) -> tuple:
+    return (
         device_data.get('mac_address'),
         device_data.get('channel'),
         device_data.get('key'),
@@ -72,284 +678,457 @@ def create_device(device_data: Dict) -> int:
         device_data.get('password'),
         device_data.get('room'),
         device_data.get('desc'),
+        device_data.get('profile_id'),
         current_time,
         current_time
-    ))
-    device_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    
-    return device_id
+    )
+
+
+def _create_device(conn: sqlite3.Connection, on_commit: List, device_data: Dict) -> int:
+    return _insert_device(conn, on_commit, device_data, datetime.now().isoformat())['id']
+
+
+def create_device(device_data: Dict) -> int:
+    """新しいデバイスを作成"""
+    return _write(_create_device, device_data)
+
+
+async def create_device_async(device_data: Dict) -> int:
+    """新しいデバイスを作成（非同期）"""
+    return await _write_async(_create_device, device_data)
+
+
+def _create_devices(conn: sqlite3.Connection, on_commit: List, devices_data: List[Dict]) -> List[int]:
+    current_time = datetime.now().isoformat()
+    return [_insert_device(conn, on_commit, device_data, current_time)['id'] for device_data in devices_data]
 
 
-def create_new_device_with_configuration(device_data: Dict) -> tuple[int, str]:
+def create_devices(devices_data: List[Dict]) -> List[int]:
+    """複数のデバイスを1つのトランザクションで作成"""
+    return _write(_create_devices, devices_data)
+
+
+def _upsert_provisioning_device(
+    conn: sqlite3.Connection, on_commit: List, device_data: Dict, current_time: str
+) -> Tuple[int, bool]:
+    existing = conn.execute(
+        _SELECT_DEVICES_SQL + 'WHERE mac_address = ? AND key = ?',
+        (device_data.get('mac_address'), device_data.get('key'))
+    ).fetchone()
+
+    if existing is None:
+        return _insert_device(conn, on_commit, device_data, current_time)['id'], True
+
+    # 部屋の指定が無い再スキャンでは登録済みの部屋を使う（エージェントの選択に使用する）
+    if not device_data.get('room'):
+        device_data['room'] = existing['room']
+
+    if (existing['status'] in PROVISIONED_STATUSES
+            and existing['ssid'] == device_data.get('ssid')
+            and existing['password'] == device_data.get('password')
+            and existing['profile_id'] == device_data.get('profile_id')):
+        # 直後にAPIの応答で読み込まれるため、読み込んだ行をキャッシュしておく
+        on_commit.append(functools.partial(_device_cache.put, dict(existing)))
+        return existing['id'], False
+
+    update_fields = {
+        'channel': device_data.get('channel'),
+        'ssid': device_data.get('ssid'),
+        'password': device_data.get('password'),
+        'profile_id': device_data.get('profile_id'),
+        'room': device_data.get('room'),
+        'status': device_data.get('status', 'configuring')
+    }
+    devices = _execute_returning(
+        conn, _UPDATE_PROVISIONING_SQL, (*update_fields.values(), current_time, existing['id'])
+    )
+    _on_updated(on_commit, devices, update_fields, current_time)
+    return existing['id'], True
+
+
+def _upsert_provisioning_devices(
+    conn: sqlite3.Connection, on_commit: List, devices_data: List[Dict]
+) -> List[Tuple[int, bool]]:
+    current_time = datetime.now().isoformat()
+    return [
+        _upsert_provisioning_device(conn, on_commit, device_data, current_time)
+        for device_data in devices_data
+    ]
+
+
+def upsert_provisioning_devices(devices_data: List[Dict]) -> List[Tuple[int, bool]]:
     """
-    新規デバイスを登録し、WiFi設定を適用
-    Returns: (device_id, status_message)
+    プロビジョニング対象のデバイスを (mac_address, key) をキーに1つのトランザクションで登録する
+    既存のデバイスは設定内容を更新して再利用し、同じSSID/パスワードで設定済みの場合は変更しない
+    部屋の指定が無いデバイスは devices_data の room を登録済みの部屋で補完する
+    Returns: デバイスごとの (デバイスID, プロビジョニングが必要か)
     """
-    current_time = datetime.now().isoformat()
-    
-    # 最初は"configuring"状態で作成
-    initial_status = "configuring"
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute('''
-            INSERT INTO devices (mac_address, channel, key, date, name, ssid, status, password, room, desc, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            device_data.get('mac_address'),
-            device_data.get('channel'),
-            device_data.get('key'),
-            current_time,
-            device_data.get('name'),
-            device_data.get('ssid'),
-            initial_status,
-            device_data.get('password'),
-            device_data.get('room'),
-            device_data.get('desc'),
-            current_time,
-            current_time
+    return _write(_upsert_provisioning_devices, devices_data)
+
+
+_IMPORT_UPDATE_SQL = '''
+    UPDATE devices SET
+        channel = ?, date = ?, name = ?, ssid = ?, status = ?, password = ?, room = ?, desc = ?, profile_id = ?,
+        updated_at = ?
+    WHERE mac_address = ? AND key = ?
+'''
+
+
+def _import_devices_without_unique_index(
+    conn: sqlite3.Connection, on_commit: List, devices_data: List[Dict], current_time: str
+) -> int:
+    """
+    一意インデックスが無いとON CONFLICTを使用できないため、(mac_address, key) で更新し、
+    一致するデバイスが無い場合に追加する（重複して登録されたデバイスはすべて上書きする）
+    """
+    for device_data in devices_data:
+        params = _device_params(device_data, current_time)
+        mac_address, channel, key, date, name, ssid, status, password, room, desc, profile_id, _, updated_at = params
+        cursor = conn.execute(_IMPORT_UPDATE_SQL, (
+            channel, date, name, ssid, status, password, room, desc, profile_id, updated_at, mac_address, key
         ))
-        
-        device_id = cursor.lastrowid
-        configuration_success = apply_dpp_configuration(device_data)
-        
-        if configuration_success:
-            # 設定成功時は"configured"に更新
-            cursor.execute('''
-                UPDATE devices SET status = ?, updated_at = ? WHERE id = ?
-            ''', ("configured", datetime.now().isoformat(), device_id))
-            status_message = "デバイスの設定が正常に完了しました"
-        else:
-            # 設定失敗時は"error"に更新
-            cursor.execute('''
-                UPDATE devices SET status = ?, updated_at = ? WHERE id = ?
-            ''', ("error", datetime.now().isoformat(), device_id))
-            status_message = "デバイス設定の適用に失敗しました"
-        
-        conn.commit()
-        return device_id, status_message
-        
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+        if cursor.rowcount == 0:
+            conn.execute(_INSERT_DEVICE_COLUMNS_SQL, params)
+    # 重複したデバイスは索引から辿れないため、キャッシュをすべて破棄する
+    on_commit.append(_device_cache.clear)
+    return len(devices_data)
 
 
-def apply_dpp_configuration(device_data: Dict) -> bool:
+def _import_devices(conn: sqlite3.Connection, on_commit: List, devices_data: List[Dict]) -> int:
+    current_time = datetime.now().isoformat()
+    if not _mac_key_unique:
+        return _import_devices_without_unique_index(conn, on_commit, devices_data, current_time)
+    conn.executemany(_INSERT_DEVICE_COLUMNS_SQL + '''
+        ON CONFLICT(mac_address, key) DO UPDATE SET
+            channel = excluded.channel,
+            date = excluded.date,
+            name = excluded.name,
+            ssid = excluded.ssid,
+            status = excluded.status,
+            password = excluded.password,
+            room = excluded.room,
+            desc = excluded.desc,
+            profile_id = excluded.profile_id,
+            updated_at = excluded.updated_at
+    ''', [_device_params(device_data, current_time) for device_data in devices_data])
+    # 上書きされたデバイスのIDは分からないため (mac_address, key) でキャッシュから破棄する
+    on_commit.append(functools.partial(_device_cache.discard_by_mac, [
+        (device_data.get('mac_address'), device_data.get('key')) for device_data in devices_data
+    ]))
+    return len(devices_data)
+
+
+def import_devices(devices_data: List[Dict]) -> int:
     """
-    DPP設定を適用する
-    CLIディレクトリのスクリプトを使用してhostapdにDPP設定を適用
+    デバイスをexecutemanyでまとめて取り込む（同じ (mac_address, key) のデバイスは上書きする）
+    件数が多い場合は呼び出し側で分割し、分割した単位でコミットされる
     """
-    import subprocess
-    import json
-    import os
-    from .config import settings
-    
-    logger.info(f"DPP設定適用開始: デバイス {device_data.get('mac_address')}")
-    
-    try:
-        wifi_config = {
-            "wi-fi_tech": "infra",
-            "discovery": {
-                "ssid": device_data.get('ssid', '')
-            },
-            "cred": {
-                "akm": "psk",
-                "pass": device_data.get('password', '')
-            }
-        }
-        
-        # JSON文字列を準備
-        conf_json = json.dumps(wifi_config)
-        logger.info(f"WiFi設定: SSID={wifi_config['discovery']['ssid']}")
-        
-        # CLIスクリプトパスの存在確認
-        if not os.path.exists(settings.cli_script_path):
-            logger.error(f"CLIスクリプトパスが見つかりません: {settings.cli_script_path}")
-            return False
-        
-        # DPPプロビジョニングの実行
-        success = _execute_dpp_provisioning(device_data, conf_json)
-        
-        if success:
-            logger.info(f"DPP設定適用成功: デバイス {device_data.get('mac_address')}")
-            return True
-        else:
-            logger.error(f"DPP設定適用失敗: デバイス {device_data.get('mac_address')}")
-            return False
-            
-    except Exception as e:
-        logger.error(f"DPP設定適用中にエラーが発生しました: {str(e)}")
-        return False
-
-
-def _execute_dpp_provisioning(device_data: Dict, conf_json: str) -> bool:
+    return _write(_import_devices, devices_data)
+
+
+def iter_devices(
+    fields: Optional[Sequence[str]] = None, status: Optional[str] = None, chunk_size: int = 1000
+) -> Iterator[List[tuple]]:
     """
-    DPPプロビジョニングの実際の実行
+    全デバイスをID順にchunk_size件ずつ返す
+    エクスポート中に読み取り用の接続プールを占有しないよう専用の接続のカーソルから順に読み出す
     """
-    import subprocess
-    from .config import settings
-    
-    mac_address = device_data.get('mac_address', '')
-    channel = device_data.get('channel', '')
-    
-    logger.info(f"DPPプロビジョニング実行開始: MAC={mac_address}, Channel={channel}")
-    
+    columns = list(fields) if fields else DEVICE_FIELDS
+    unknown_fields = [field for field in columns if field not in DEVICE_FIELDS]
+    if unknown_fields:
+        raise ValueError(f"unknown fields: {', '.join(unknown_fields)}")
+
+    sql = f"SELECT {', '.join(columns)} FROM devices"
+    params: list = []
+    if status is not None:
+        sql += ' WHERE status = ?'
+        params.append(status)
+    sql += ' ORDER BY id'
+
+    conn = _connect(DATABASE_FILE)
+    conn.row_factory = None
     try:
-        # Step 1: DPP Configuratorを追加
-        logger.info("Step 1: DPP Configurator追加")
-        configurator_cmd = [
-            "python", "-m", "provisioning_cli.main",
-            settings.dpp_interface,
-            "DPP_CONFIGURATOR_ADD"
-        ]
-        
-        result = subprocess.run(
-            configurator_cmd,
-            cwd=settings.cli_script_path,
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if result.returncode != 0:
-            logger.error(f"DPP Configurator追加失敗: stdout={result.stdout}, stderr={result.stderr}")
-            return False
-        
-        configurator_id = result.stdout.strip()
-        logger.info(f"DPP Configurator追加成功: ID={configurator_id}")
-        
-        # Step 2: QRコード情報でデバイスを追加
-        logger.info("Step 2: QRコード情報でデバイス追加")
-        
-        # DPP QRコード文字列を構築
-        key = device_data.get('key', '')
-        if not key:
-            logger.error("暗号化キー情報が見つかりません")
-            return False
-        
-        # DPP QRコード文字列の構築: "DPP:C:channel;M:mac_address;K:key;;"
-        qr_code_data = f"DPP:C:{channel};M:{mac_address};K:{key};;"
-        logger.info(f"構築されたDPP QRコード: {qr_code_data[:50]}...")  # セキュリティのため最初の50文字のみログ出力
-        
-        qr_cmd = [
-            "python", "-m", "provisioning_cli.main",
-            settings.dpp_interface,
-            "DPP_QR_CODE",
-            qr_code_data
-        ]
-        
-        result = subprocess.run(
-            qr_cmd,
-            cwd=settings.cli_script_path,
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if result.returncode != 0:
-            logger.error(f"QRコード追加失敗: stdout={result.stdout}, stderr={result.stderr}")
-            return False
-        
-        bootstrap_id = result.stdout.strip()
-        logger.info(f"QRコード追加成功: ID={bootstrap_id}")
-        
-        # Step 3: DPP認証と設定送信
-        logger.info("Step 3: DPP認証と設定送信")
-        auth_cmd = [
-            "python", "-m", "provisioning_cli.main",
-            settings.dpp_interface,
-            "DPP_AUTH_INIT",
-            f"peer={bootstrap_id}",
-            f"configurator={configurator_id}",
-            f"conf_json={conf_json}"
-        ]
-        
-        result = subprocess.run(
-            auth_cmd,
-            cwd=settings.cli_script_path,
-            capture_output=True,
-            text=True,
-            timeout=settings.dpp_timeout
-        )
-        
-        if result.returncode != 0:
-            logger.error(f"DPP認証失敗: stdout={result.stdout}, stderr={result.stderr}")
-            return False
-        
-        logger.info(f"DPP認証成功: {result.stdout}")
-        return True
-        
-    except subprocess.TimeoutExpired:
-        logger.error("DPP設定適用がタイムアウトしました")
-        return False
-    except FileNotFoundError as e:
-        logger.error(f"ファイルまたはコマンドが見つかりません: {str(e)}")
-        return False
-    except Exception as e:
-        logger.error(f"DPP実行中にエラーが発生しました: {str(e)}")
-        return False
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        conn.close()
+
 
+def _select_device_by_id(device_id: int) -> Optional[Dict]:
+    """DBからデバイスを読み込んでキャッシュに追加する"""
+    version = _device_cache.version
+    with _QUERY_SECONDS.labels(function="get_device_by_id").time():
+        with get_db_connection() as conn:
+            row = conn.execute(_SELECT_DEVICES_SQL + 'WHERE id = ?', (device_id,)).fetchone()
+    if row is None:
+        return None
+    device = dict(row)
+    _device_cache.fill(device, version)
+    return device
 
 
 def get_device_by_id(device_id: int) -> Optional[Dict]:
-    """IDでデバイスを取得"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, mac_address, channel, key, date, name, ssid, status, password, room, desc
-        FROM devices
-        WHERE id = ?
-    ''', (device_id,))
-    device = cursor.fetchone()
-    conn.close()
-    
-    return dict(device) if device else None
-
-def update_device(device_id: int, update_data: Dict) -> bool:
-    """デバイス情報を更新"""
+    """IDでデバイスを取得（キャッシュに無い場合のみDBから読み込む）"""
+    device = _device_cache.get(device_id)
+    if device is not None:
+        return device
+    return _select_device_by_id(device_id)
+
+
+async def get_device_by_id_async(device_id: int) -> Optional[Dict]:
+    """IDでデバイスを取得（非同期、キャッシュにあればスレッドプールを経由せずに返す）"""
+    device = _device_cache.get(device_id)
+    if device is not None:
+        return device
+    return await run_read(_select_device_by_id, device_id)
+
+
+@functools.lru_cache(maxsize=2 ** len(_UPDATABLE_FIELDS))
+def _update_device_sql(fields: frozenset) -> Tuple[str, Tuple[str, ...]]:
+    """
+    更新するフィールドの組み合わせごとのUPDATE文を作成する
+    同じ組み合わせには同じ文字列を返すため、接続のステートメントキャッシュでコンパイル済みの文が再利用される
+    Returns: (SQL文, パラメータに渡すフィールドの順序)
+    """
+    columns = tuple(field for field in _UPDATABLE_FIELDS if field in fields)
+    set_clause = ', '.join(f"{field} = ?" for field in columns)
+    return f"UPDATE devices SET {set_clause}, updated_at = ? WHERE id = ?{_RETURNING_DEVICE_SQL}", columns
+
+
+def _update_device(
+    conn: sqlite3.Connection, on_commit: List, device_id: int, update_data: Dict
+) -> Optional[Dict]:
     current_time = datetime.now().isoformat()
-    
-    # 更新可能なフィールドのリスト
-    allowed_fields = ['name', 'ssid', 'password', 'room', 'desc', 'status']
-    
+
     # 更新するフィールドを抽出
-    update_fields = {}
-    for field, value in update_data.items():
-        if field in allowed_fields and value is not None:
-            update_fields[field] = value
-    
+    update_fields = {
+        field: value for field, value in update_data.items() if field in _UPDATABLE_FIELDS and value is not None
+    }
     if not update_fields:
-        return False
-    
-    # SQL文を動的に構築
-    set_clause = ', '.join([f"{field} = ?" for field in update_fields.keys()])
-    set_clause += ', updated_at = ?'
-    
-    values = list(update_fields.values()) + [current_time, device_id]
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute(f'''
-            UPDATE devices 
-            SET {set_clause}
-            WHERE id = ?
-        ''', values)
-        
-        rows_affected = cursor.rowcount
-        conn.commit()
-        
-        return rows_affected > 0
-        
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
\ No newline at end of file
+        return None
+
+    sql, columns = _update_device_sql(frozenset(update_fields))
+    devices = _execute_returning(conn, sql, [*(update_fields[field] for field in columns), current_time, device_id])
+    if not devices:
+        return None
+    _on_updated(on_commit, devices, update_fields, current_time)
+    return devices[0]
+
+
+def update_device(device_id: int, update_data: Dict) -> Optional[Dict]:
+    """デバイス情報を更新し、更新後のデバイスを返す（デバイスが無い場合はNone）"""
+    return _write(_update_device, device_id, update_data)
+
+
+async def update_device_async(device_id: int, update_data: Dict) -> Optional[Dict]:
+    """デバイス情報を更新し、更新後のデバイスを返す（非同期）"""
+    return await _write_async(_update_device, device_id, update_data)
+
+
+def _set_devices_status(conn: sqlite3.Connection, on_commit: List, device_ids: List[int], status: str) -> int:
+    current_time = datetime.now().isoformat()
+    placeholders = ', '.join('?' for _ in device_ids)
+    devices = _execute_returning(conn, f'''
+        UPDATE devices SET status = ?, updated_at = ? WHERE id IN ({placeholders})
+    ''' + _RETURNING_DEVICE_SQL, [status, current_time, *device_ids])
+    _on_updated(on_commit, devices, {'status': status}, current_time)
+    return len(devices)
+
+
+def set_devices_status(device_ids: List[int], status: str) -> int:
+    """複数デバイスのステータスを1つのUPDATE文で更新"""
+    if not device_ids:
+        return 0
+    return _write(_set_devices_status, device_ids, status)
+
+
+def _claim_devices_by_status(
+    conn: sqlite3.Connection, on_commit: List, from_status: str, to_status: str,
+    device_ids: Optional[List[int]], limit: int
+) -> List[Dict]:
+    current_time = datetime.now().isoformat()
+    subquery = 'SELECT id FROM devices WHERE status = ?'
+    params: list = [to_status, current_time, from_status]
+    if device_ids is not None:
+        subquery += f" AND id IN ({', '.join('?' for _ in device_ids)})"
+        params.extend(device_ids)
+    subquery += ' ORDER BY created_at, id LIMIT ?'
+    params.append(limit)
+    # 対象の選択とステータスの変更を1つの文で行う（RETURNINGの行の順序は不定のため古い順に並べ直す）
+    devices = _execute_returning(
+        conn,
+        f"UPDATE devices SET status = ?, updated_at = ? WHERE id IN ({subquery}){_RETURNING_DEVICE_SQL}, created_at",
+        params
+    )
+    devices.sort(key=lambda device: (device['created_at'], device['id']))
+    for device in devices:
+        del device['created_at']
+    _on_updated(on_commit, devices, {'status': to_status}, current_time)
+    return devices
+
+
+def claim_devices_by_status(
+    from_status: str, to_status: str, device_ids: Optional[List[int]] = None, limit: int = 500
+) -> List[Dict]:
+    """
+    指定ステータスのデバイスを取得し、同じトランザクションでステータスを変更する
+    同時に呼び出されても同じデバイスが二重に取得されることはない
+    """
+    if device_ids is not None and not device_ids:
+        return []
+    return _write(_claim_devices_by_status, from_status, to_status, device_ids, limit)
+
+
+# これを超える件数のステータス変更は個別のイベントではなく再取得（resync）として通知する
+_STATION_EVENT_LIMIT = 200
+
+
+def _apply_station_status(
+    conn: sqlite3.Connection, on_commit: List, changes: List[Tuple[int, str, str]]
+) -> int:
+    current_time = datetime.now().isoformat()
+    # 照合の間に再プロビジョニングなどでステータスが変わったデバイスは更新しない
+    cursor = conn.executemany(f'''
+        UPDATE devices SET status = ?, last_seen = ?, updated_at = ?
+        WHERE id = ? AND status IN ({', '.join('?' for _ in PROVISIONED_STATUSES)})
+    ''', [
+        (status, last_seen, current_time, device_id, *PROVISIONED_STATUSES)
+        for device_id, status, last_seen in changes
+    ])
+    # どのデバイスが更新されたか（ステータスの条件に一致したか）は分からないためキャッシュから破棄する
+    on_commit.append(functools.partial(_device_cache.discard, [device_id for device_id, _, _ in changes]))
+    if len(changes) > _STATION_EVENT_LIMIT:
+        on_commit.append(functools.partial(device_events.publish, {"event": "resync"}))
+    else:
+        for device_id, status, last_seen in changes:
+            on_commit.append(functools.partial(
+                _publish_updated, device_id, {'status': status, 'last_seen': last_seen}, current_time
+            ))
+    return cursor.rowcount
+
+
+def apply_station_status(changes: List[Tuple[int, str, str]]) -> int:
+    """
+    ステーション一覧との照合結果を1回のexecutemanyでまとめて反映する
+    changes: (デバイスID, "online" / "offline", last_seen) の一覧
+    """
+    if not changes:
+        return 0
+    return _write(_apply_station_status, changes)
+
+
+def _record_provisioning_attempt(conn: sqlite3.Connection, on_commit: List, attempt: Dict):
+    conn.execute('''
+        INSERT INTO provisioning_attempts
+            (device_id, job_id, attempt, interface, success, message, started_at, finished_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        attempt['device_id'],
+        attempt['job_id'],
+        attempt['attempt'],
+        attempt.get('interface'),
+        1 if attempt['success'] else 0,
+        attempt.get('message'),
+        attempt['started_at'],
+        attempt['finished_at']
+    ))
+
+
+def record_provisioning_attempt(attempt: Dict):
+    """プロビジョニング試行の結果を履歴に追加"""
+    _write(_record_provisioning_attempt, attempt)
+
+
+@_timed
+def get_provisioning_attempts(device_id: int) -> List[Dict]:
+    """デバイスのプロビジョニング試行履歴を古い順に取得"""
+    with get_db_connection() as conn:
+        rows = conn.execute('''
+            SELECT id, device_id, job_id, attempt, interface, success, message, started_at, finished_at
+            FROM provisioning_attempts
+            WHERE device_id = ?
+            ORDER BY id
+        ''', (device_id,)).fetchall()
+
+    return [{**dict(row), 'success': bool(row['success'])} for row in rows]
+
+
+async def get_provisioning_attempts_async(device_id: int) -> List[Dict]:
+    """デバイスのプロビジョニング試行履歴を取得（非同期）"""
+    return await run_read(get_provisioning_attempts, device_id)
+
+
+@_timed
+def get_dpp_configurator(interface: str) -> Optional[str]:
+    """インターフェースに保存されたDPP Configurator IDを取得"""
+    with get_db_connection() as conn:
+        row = conn.execute('''
+            SELECT configurator_id FROM dpp_configurators WHERE interface = ?
+        ''', (interface,)).fetchone()
+
+    return row["configurator_id"] if row else None
+
+
+def _save_dpp_configurator(conn: sqlite3.Connection, on_commit: List, interface: str, configurator_id: str):
+    conn.execute('''
+        INSERT INTO dpp_configurators (interface, configurator_id, updated_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(interface) DO UPDATE SET
+            configurator_id = excluded.configurator_id,
+            updated_at = excluded.updated_at
+    ''', (interface, configurator_id, datetime.now().isoformat()))
+
+
+def save_dpp_configurator(interface: str, configurator_id: str):
+    """インターフェースのDPP Configurator IDを保存"""
+    _write(_save_dpp_configurator, interface, configurator_id)
+
+
+_PROFILE_COLUMNS_SQL = 'id, name, ssid, akm, password, created_at'
+
+
+def _create_credential_profile(conn: sqlite3.Connection, on_commit: List, profile: Dict) -> Dict:
+    (created,) = _execute_returning(conn, f'''
+        INSERT INTO credential_profiles (name, ssid, akm, password, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        RETURNING {_PROFILE_COLUMNS_SQL}
+    ''', (profile['name'], profile['ssid'], profile.get('akm', 'psk'), profile['password'],
+          datetime.now().isoformat()))
+    return created
+
+
+async def create_credential_profile_async(profile: Dict) -> Dict:
+    """
+    認証情報プロファイルを作成（非同期）
+    同じ名前のプロファイルがある場合は sqlite3.IntegrityError を送出する
+    """
+    return await _write_async(_create_credential_profile, profile)
+
+
+@_timed
+def get_credential_profile(profile_id: int) -> Optional[Dict]:
+    """IDで認証情報プロファイルを取得（パスワードを含む）"""
+    with get_db_connection() as conn:
+        row = conn.execute(
+            f'SELECT {_PROFILE_COLUMNS_SQL} FROM credential_profiles WHERE id = ?', (profile_id,)
+        ).fetchone()
+
+    return dict(row) if row else None
+
+
+@_timed
+def list_credential_profiles() -> List[Dict]:
+    """認証情報プロファイルを作成順に取得（パスワードを含む）"""
+    with get_db_connection() as conn:
+        rows = conn.execute(f'SELECT {_PROFILE_COLUMNS_SQL} FROM credential_profiles ORDER BY id').fetchall()
+
+    return [dict(row) for row in rows]
+
+
+async def list_credential_profiles_async() -> List[Dict]:
+    """認証情報プロファイルを取得（非同期）"""
+    return await run_read(list_credential_profiles)
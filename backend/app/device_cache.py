@@ -0,0 +1,100 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from . import metrics
+
+_REQUESTS = metrics.counter(
+    "qrdia_device_cache_requests", "デバイスキャッシュの参照回数（hit / miss）", ["result"]
+)
+
+
+class DeviceCache:
+    """
+    デバイスの行をIDごとにタプルで保持するLRUキャッシュ
+    書き込みはコミット後に書き込みスレッドから反映する（write-through）。インポートなど
+    IDの分からない書き込みは (mac_address, key) の索引から該当するデバイスを破棄する
+
+    読み取り中に書き込みがコミットされると、古い行をキャッシュしてしまう可能性がある。
+    読み取り前に version を取得し、その後に書き込みが反映されていれば fill しない
+    """
+
+    def __init__(self, fields: Sequence[str], max_size: int):
+        self.fields = list(fields)
+        self.max_size = max_size
+        self.version = 0
+        self._index = {field: i for i, field in enumerate(self.fields)}
+        self._id = self._index['id']
+        self._mac = self._index['mac_address']
+        self._key = self._index['key']
+        self._rows: "OrderedDict[int, tuple]" = OrderedDict()
+        # (mac_address, key) -> デバイスID
+        self._by_mac: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self._hit = _REQUESTS.labels(result="hit")
+        self._miss = _REQUESTS.labels(result="miss")
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, device_id: int) -> Optional[Dict]:
+        with self._lock:
+            row = self._rows.get(device_id)
+            if row is not None:
+                self._rows.move_to_end(device_id)
+        if row is None:
+            self._miss.inc()
+            return None
+        self._hit.inc()
+        return dict(zip(self.fields, row))
+
+    def fill(self, device: Dict, version: int):
+        """DBから読んだデバイスを追加する（読み取り開始後に書き込みが反映されていれば追加しない）"""
+        with self._lock:
+            if version == self.version:
+                self._store(tuple(device.get(field) for field in self.fields))
+
+    def put(self, device: Dict):
+        """作成したデバイスを追加する（書き込みのコミット後に呼び出す）"""
+        with self._lock:
+            self.version += 1
+            self._store(tuple(device.get(field) for field in self.fields))
+
+    def discard(self, device_ids: Iterable[int]):
+        with self._lock:
+            self.version += 1
+            for device_id in device_ids:
+                self._remove(device_id)
+
+    def discard_by_mac(self, keys: Iterable[Tuple[str, str]]):
+        """(mac_address, key) で一致するデバイスを破棄する"""
+        with self._lock:
+            self.version += 1
+            for key in keys:
+                device_id = self._by_mac.get(key)
+                if device_id is not None:
+                    self._remove(device_id)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._rows.clear()
+            self._by_mac.clear()
+
+    def _store(self, row: tuple):
+        if self.max_size <= 0:
+            return
+        device_id = row[self._id]
+        self._remove(device_id)
+        self._rows[device_id] = row
+        self._by_mac[(row[self._mac], row[self._key])] = device_id
+        while len(self._rows) > self.max_size:
+            _, evicted = self._rows.popitem(last=False)
+            self._by_mac.pop((evicted[self._mac], evicted[self._key]), None)
+
+    def _remove(self, device_id: int):
+        row = self._rows.pop(device_id, None)
+        if row is not None:
+            key = (row[self._mac], row[self._key])
+            if self._by_mac.get(key) == device_id:
+                del self._by_mac[key]
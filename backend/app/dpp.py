@@ -0,0 +1,322 @@
+import logging
+import os
+import subprocess
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics
+from .config import settings
+from .dpp_events import CompletionCallback, get_event_monitor
+from .hostapd import get_hostapd_client, provisioning_cli
+from .profiles import encode_conf_json, get_conf_json
+from .tracing import current_correlation_id
+
+logger = logging.getLogger(__name__)
+
+_COMMAND_SECONDS = metrics.histogram(
+    "qrdia_hostapd_command_duration_seconds",
+    "hostapdへのコマンド送信から応答までの時間（subprocessモードはCLIの起動を含む）",
+    ["mode", "command"]
+)
+DPP_STEP_SECONDS = metrics.histogram(
+    "qrdia_dpp_step_duration_seconds",
+    "DPPプロビジョニングの各ステップの所要時間",
+    ["step"]
+)
+
+def _run_inprocess(interface: str, args: List[str], timeout: int) -> Tuple[bool, str]:
+    """HostapdClientを直接使用してコマンドを送信"""
+    client = get_hostapd_client(interface)
+    command = provisioning_cli().format_command(args)
+    response = client.send_command(command, timeout=timeout).strip()
+    if response == "FAIL":
+        return False, f"response={response}"
+    return True, response
+
+
+def _run_subprocess(interface: str, args: List[str], timeout: int) -> Tuple[bool, str]:
+    """
+    CLIを別プロセスで起動してコマンドを送信
+    conf_jsonのパスワードがプロセスの引数（ps などで見える）に含まれないよう、コマンドは標準入力で渡す
+    """
+    cmd = [sys.executable, "-m", "provisioning_cli.main", "--socket-dir", settings.hostapd_socket_dir, "--stdin"]
+    correlation_id = current_correlation_id()
+    if correlation_id:
+        cmd += ["--correlation-id", correlation_id]
+    cmd += [interface]
+
+    result = subprocess.run(
+        cmd,
+        cwd=settings.cli_script_path,
+        input=provisioning_cli().format_command(args),
+        capture_output=True,
+        text=True,
+        timeout=timeout
+    )
+
+    output = result.stdout.strip()
+    if result.returncode != 0 or output == "FAIL":
+        return False, f"stdout={result.stdout}, stderr={result.stderr}"
+    return True, output
+
+
+def _run_hostapd_command(interface: str, args: List[str], timeout: int) -> Tuple[bool, str]:
+    """
+    設定されたモードでインターフェースのhostapdにコマンドを送信
+    Returns: (成功したか, 応答またはエラー詳細)
+    """
+    mode = "subprocess" if settings.dpp_mode == "subprocess" else "inprocess"
+    with _COMMAND_SECONDS.labels(mode=mode, command=args[0]).time():
+        if mode == "subprocess":
+            return _run_subprocess(interface, args, timeout)
+        return _run_inprocess(interface, args, timeout)
+
+
+# インターフェースごとのDPP Configurator ID: interface -> (configurator_id, 確認時の再接続回数)
+_configurators: Dict[str, Tuple[str, int]] = {}
+_configurators_lock = threading.Lock()
+
+
+def _connection_epoch(interface: str) -> int:
+    """制御ソケットの再接続回数（hostapd再起動の検知に使用）"""
+    if settings.dpp_mode == "subprocess":
+        return 0
+    return get_hostapd_client(interface).reconnects
+
+
+def _configurator_exists(interface: str, configurator_id: str) -> bool:
+    """hostapdにConfiguratorが存在するか確認"""
+    success, _ = _run_hostapd_command(interface, ["DPP_CONFIGURATOR_GET_KEY", configurator_id], timeout=10)
+    return success
+
+
+def _get_configurator_id(interface: str) -> Optional[str]:
+    """
+    インターフェースのDPP Configurator IDを取得
+    キャッシュまたは保存済みのIDが無効な場合のみ DPP_CONFIGURATOR_ADD を実行する
+    """
+    from .database import get_dpp_configurator, save_dpp_configurator
+
+    with _configurators_lock:
+        cached = _configurators.get(interface)
+        if cached is not None and cached[1] == _connection_epoch(interface):
+            return cached[0]
+
+        # 初回または再接続後は既存のIDがhostapdに残っているか確認する
+        configurator_id = cached[0] if cached else get_dpp_configurator(interface)
+        if configurator_id and _configurator_exists(interface, configurator_id):
+            logger.info(f"DPP Configurator再利用: ID={configurator_id}")
+        else:
+            success, output = _run_hostapd_command(interface, ["DPP_CONFIGURATOR_ADD"], timeout=10)
+            if not success:
+                logger.error(f"DPP Configurator追加失敗: {output}")
+                return None
+            configurator_id = output
+            save_dpp_configurator(interface, configurator_id)
+            logger.info(f"DPP Configurator追加成功: ID={configurator_id}")
+
+        _configurators[interface] = (configurator_id, _connection_epoch(interface))
+        return configurator_id
+
+
+def _invalidate_configurator(interface: str, configurator_id: str):
+    """キャッシュしたConfigurator IDを破棄"""
+    with _configurators_lock:
+        cached = _configurators.get(interface)
+        if cached is not None and cached[0] == configurator_id:
+            del _configurators[interface]
+
+
+def build_conf_json(device_data: Dict) -> str:
+    """
+    DPP_AUTH_INITで送信するWi-Fi設定（conf_json）を作成
+    認証情報プロファイルを参照するデバイスは、プロファイルごとに作成済みのconf_jsonを使用する
+    """
+    profile_id = device_data.get('profile_id')
+    if profile_id is not None:
+        return get_conf_json(profile_id)
+    return encode_conf_json(device_data.get('ssid', ''), "psk", device_data.get('password', ''))
+
+
+def build_qr_code(device_data: Dict) -> str:
+    """DPP QRコード文字列 "DPP:C:channel;M:mac_address;K:key;;" を作成"""
+    return f"DPP:C:{device_data.get('channel', '')};M:{device_data.get('mac_address', '')};K:{device_data.get('key', '')};;"
+
+
+def apply_dpp_configuration(
+    device_data: Dict,
+    on_complete: Optional[CompletionCallback] = None,
+    bootstrap_id: Optional[str] = None,
+    interface: Optional[str] = None
+) -> bool:
+    """
+    DPP設定を適用する
+    provisioning_cliのHostapdClientを使用してhostapdにDPP設定を適用
+    on_completeを指定した場合はDPP_AUTH_INITが受け付けられた時点でTrueを返し、
+    最終結果（DPP-CONF-SENT など）はイベント受信時に on_complete(success, message) で通知する
+    bootstrap_idには register_bootstrap で登録済みのIDを指定できる
+    interfaceを省略した場合は settings.dpp_interface を使用する
+    """
+    logger.info(f"DPP設定適用開始: デバイス {device_data.get('mac_address')}")
+
+    try:
+        conf_json = build_conf_json(device_data)
+        logger.info(f"WiFi設定: SSID={device_data.get('ssid', '')}")
+
+        # CLIスクリプトパスの存在確認
+        if settings.dpp_mode == "subprocess" and not os.path.exists(settings.cli_script_path):
+            logger.error(f"CLIスクリプトパスが見つかりません: {settings.cli_script_path}")
+            return False
+
+        # DPPプロビジョニングの実行
+        success = _execute_dpp_provisioning(device_data, conf_json, on_complete, bootstrap_id, interface)
+
+        if success:
+            logger.info(f"DPP設定適用成功: デバイス {device_data.get('mac_address')}")
+            return True
+        else:
+            logger.error(f"DPP設定適用失敗: デバイス {device_data.get('mac_address')}")
+            return False
+
+    except Exception as e:
+        logger.error(f"DPP設定適用中にエラーが発生しました: {str(e)}")
+        return False
+
+
+def _execute_dpp_provisioning(
+    device_data: Dict,
+    conf_json: str,
+    on_complete: Optional[CompletionCallback] = None,
+    bootstrap_id: Optional[str] = None,
+    interface: Optional[str] = None
+) -> bool:
+    """
+    DPPプロビジョニングの実際の実行
+    bootstrap_idを指定した場合はQRコード登録済みとしてStep 2を省略する
+    """
+    mac_address = device_data.get('mac_address', '')
+    channel = device_data.get('channel', '')
+    interface = interface or settings.dpp_interface
+
+    logger.info(
+        f"DPPプロビジョニング実行開始: MAC={mac_address}, Channel={channel}, "
+        f"Interface={interface}, Mode={settings.dpp_mode}"
+    )
+
+    try:
+        # Step 1: DPP Configuratorを取得（インターフェースごとにキャッシュ）
+        logger.info("Step 1: DPP Configurator取得")
+        with DPP_STEP_SECONDS.labels(step="configurator").time():
+            configurator_id = _get_configurator_id(interface)
+        if configurator_id is None:
+            return False
+
+        # Step 2: QRコード情報でデバイスを追加
+        if bootstrap_id is None:
+            with DPP_STEP_SECONDS.labels(step="qr_code").time():
+                bootstrap_id = _register_qr_code(interface, device_data)
+            if bootstrap_id is None:
+                return False
+
+        # Step 3: DPP認証と設定送信
+        with DPP_STEP_SECONDS.labels(step="auth_init").time():
+            success, output = _authenticate(interface, bootstrap_id, configurator_id, conf_json, on_complete)
+
+        if not success and not _configurator_exists(interface, configurator_id):
+            # hostapdの再起動でConfiguratorとQRコードが失われた場合は作り直して一度だけ再試行する
+            logger.warning(f"DPP Configuratorが無効になっています: ID={configurator_id}")
+            _invalidate_configurator(interface, configurator_id)
+            configurator_id = _get_configurator_id(interface)
+            if configurator_id is None:
+                return False
+            bootstrap_id = _register_qr_code(interface, device_data)
+            if bootstrap_id is None:
+                return False
+            success, output = _authenticate(interface, bootstrap_id, configurator_id, conf_json, on_complete)
+
+        if not success:
+            logger.error(f"DPP認証失敗: {output}")
+            return False
+
+        if on_complete is not None:
+            logger.info(f"DPP認証要求受付: {output}（結果はイベントで通知）")
+        else:
+            logger.info(f"DPP認証成功: {output}")
+        return True
+
+    except (subprocess.TimeoutExpired, TimeoutError):
+        logger.error("DPP設定適用がタイムアウトしました")
+        return False
+    except FileNotFoundError as e:
+        logger.error(f"ファイルまたはコマンドが見つかりません: {str(e)}")
+        return False
+    except Exception as e:
+        logger.error(f"DPP実行中にエラーが発生しました: {str(e)}")
+        return False
+
+
+def _register_qr_code(interface: str, device_data: Dict) -> Optional[str]:
+    """QRコード情報をhostapdに登録し、bootstrap IDを返す"""
+    logger.info("Step 2: QRコード情報でデバイス追加")
+
+    # DPP QRコード文字列を構築
+    key = device_data.get('key', '')
+    if not key:
+        logger.error("暗号化キー情報が見つかりません")
+        return None
+
+    qr_code_data = build_qr_code(device_data)
+    logger.info(f"構築されたDPP QRコード: {qr_code_data[:50]}...")  # セキュリティのため最初の50文字のみログ出力
+
+    success, output = _run_hostapd_command(interface, ["DPP_QR_CODE", qr_code_data], timeout=10)
+
+    if not success:
+        logger.error(f"QRコード追加失敗: {output}")
+        return None
+
+    logger.info(f"QRコード追加成功: ID={output}")
+    return output
+
+
+def register_bootstrap(device_data: Dict, interface: Optional[str] = None) -> Optional[str]:
+    """
+    DPP認証に先立ってQRコードを登録する（一括登録用）
+    登録したbootstrap IDは同じインターフェースでのみ有効
+    Returns: bootstrap ID（失敗時はNone）
+    """
+    try:
+        return _register_qr_code(interface or settings.dpp_interface, device_data)
+    except (subprocess.TimeoutExpired, TimeoutError):
+        logger.error("QRコード登録がタイムアウトしました")
+        return None
+    except Exception as e:
+        logger.error(f"QRコード登録中にエラーが発生しました: {str(e)}")
+        return None
+
+
+def _authenticate(
+    interface: str,
+    bootstrap_id: str, configurator_id: str, conf_json: str, on_complete: Optional[CompletionCallback]
+) -> Tuple[bool, str]:
+    """DPP認証を開始し、設定を送信する"""
+    logger.info("Step 3: DPP認証と設定送信")
+
+    # 結果イベントを取りこぼさないようDPP_AUTH_INIT前に通知先を登録する
+    if on_complete is not None:
+        get_event_monitor(interface).register(bootstrap_id, on_complete)
+
+    success, output = _run_hostapd_command(
+        interface,
+        [
+            "DPP_AUTH_INIT",
+            f"peer={bootstrap_id}",
+            f"configurator={configurator_id}",
+            f"conf_json={conf_json}"
+        ],
+        timeout=settings.dpp_timeout
+    )
+
+    if not success and on_complete is not None:
+        get_event_monitor(interface).discard(bootstrap_id)
+    return success, output
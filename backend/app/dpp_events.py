@@ -0,0 +1,258 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .config import settings
+from .hostapd import provisioning_cli
+from .tracing import correlation_scope, current_correlation_id
+
+logger = logging.getLogger(__name__)
+
+# DPP交換の最終結果を表すイベント
+_SUCCESS_EVENTS = {"DPP-CONF-SENT"}
+_FAILURE_EVENTS = {"DPP-AUTH-INIT-FAILED", "DPP-CONF-FAILED", "DPP-FAIL", "DPP-NOT-COMPATIBLE"}
+
+# イベントが無い状態が続いた場合にhostapdの生存確認を行う間隔（秒）
+_PING_INTERVAL = 10.0
+
+# on_complete(success, message)
+CompletionCallback = Callable[[bool, str], None]
+
+
+class _Pending:
+    def __init__(self, on_complete: CompletionCallback, deadline: float):
+        self.on_complete = on_complete
+        self.deadline = deadline
+        # 結果の通知とログを登録元のプロビジョニングに関連付ける
+        self.correlation_id = current_correlation_id()
+
+
+class _EventLoop:
+    """
+    全インターフェースのDPPイベント監視を1つのスレッドのasyncioイベントループで実行する
+    （インターフェースごとにスレッドを作らない）
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> asyncio.AbstractEventLoop:
+        """イベントループを取得（未起動なら起動する）"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="dpp-events", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def stop(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+_event_loop = _EventLoop()
+
+
+class DppEventMonitor:
+    """
+    hostapdの制御ソケットにATTACHしてDPPイベントを受信し、
+    bootstrap ID（peer）ごとに待機中のプロビジョニングへ結果を通知する
+    受信は共有のイベントループ上のタスクで行い、register / discard はワーカースレッドから呼び出す
+    """
+
+    def __init__(self, interface: str):
+        self.interface = interface
+        # bootstrap_id -> _Pending（登録順）
+        self._pending: Dict[str, _Pending] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[concurrent.futures.Future] = None
+        # 以下はイベントループのスレッドからのみ使用する
+        self._monitor = None
+        self._attach_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        self._loop = _event_loop.get()
+        self._task = asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+
+    def stop(self):
+        self.request_stop()
+        self.wait_stopped()
+
+    def request_stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def wait_stopped(self):
+        if self._task is None:
+            return
+        try:
+            self._task.result()
+        except Exception as e:
+            logger.error(f"DPPイベント監視の終了中にエラーが発生しました: {str(e)}")
+
+    def ensure_attached(self):
+        """イベント受信用の制御ソケットにATTACHする（済みなら何もしない）"""
+        asyncio.run_coroutine_threadsafe(self._attach(), self._loop).result()
+
+    def register(self, bootstrap_id: str, on_complete: CompletionCallback):
+        """DPP_AUTH_INIT前に結果の通知先を登録する"""
+        self.ensure_attached()
+        with self._lock:
+            self._pending[bootstrap_id] = _Pending(on_complete, time.monotonic() + settings.dpp_timeout)
+
+    def discard(self, bootstrap_id: str):
+        """DPP_AUTH_INITが受け付けられなかった場合に登録を取り消す"""
+        with self._lock:
+            self._pending.pop(bootstrap_id, None)
+
+    async def _attach(self):
+        if self._monitor is not None:
+            return
+        if self._attach_lock is None:
+            self._attach_lock = asyncio.Lock()
+        async with self._attach_lock:
+            if self._monitor is not None:
+                return
+            AsyncHostapdMonitor = provisioning_cli().AsyncHostapdMonitor
+            monitor = AsyncHostapdMonitor(self.interface, socket_dir=settings.hostapd_socket_dir)
+            await monitor.attach()
+            self._monitor = monitor
+            logger.info(f"DPPイベント監視開始: interface={self.interface}")
+
+    def _detach(self):
+        monitor, self._monitor = self._monitor, None
+        if monitor is not None:
+            monitor.close()
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        self._wakeup = asyncio.Event()
+        last_activity = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                monitor = self._monitor
+                if monitor is None:
+                    try:
+                        await self._attach()
+                    except OSError as e:
+                        logger.warning(f"DPPイベント監視のATTACHに失敗しました: {str(e)}")
+                        try:
+                            await asyncio.wait_for(self._wakeup.wait(), 5.0)
+                        except asyncio.TimeoutError:
+                            pass
+                        self._expire()
+                        continue
+                    last_activity = time.monotonic()
+                    continue
+
+                try:
+                    line = await monitor.recv_event(timeout=1.0)
+                    if line is None and time.monotonic() - last_activity > _PING_INTERVAL:
+                        monitor.ping()
+                        last_activity = time.monotonic()
+                except OSError as e:
+                    # hostapdの再起動などで接続が切れた場合は再ATTACHする
+                    logger.warning(f"DPPイベント監視の接続が切断されました: {str(e)}")
+                    self._detach()
+                    continue
+
+                if line is not None:
+                    last_activity = time.monotonic()
+                    self._dispatch(line)
+                self._expire()
+        finally:
+            self._detach()
+
+    def _dispatch(self, line: str):
+        name, params = provisioning_cli().parse_event(line)
+        if name in _SUCCESS_EVENTS:
+            success = params.get("conf_status", "0") == "0"
+        elif name in _FAILURE_EVENTS:
+            success = False
+        else:
+            return
+
+        with self._lock:
+            bootstrap_id = params.get("peer")
+            if bootstrap_id is None and len(self._pending) == 1:
+                # peerを含まないイベントは処理中の交換に対するもの
+                # 複数の交換を待っている場合はどの交換の結果か判断できないため無視する（タイムアウトで失敗になる）
+                bootstrap_id = next(iter(self._pending))
+            pending = self._pending.pop(bootstrap_id, None) if bootstrap_id else None
+
+        if pending is None:
+            logger.info(f"対応するプロビジョニングが無いDPPイベント: {line}")
+            return
+
+        with correlation_scope(pending.correlation_id):
+            logger.info(f"DPPイベント受信: {line} (peer={bootstrap_id})")
+        self._complete(pending, success, line)
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, pending in self._pending.items() if pending.deadline <= now]
+            expired_pending = [self._pending.pop(key) for key in expired]
+        for pending in expired_pending:
+            self._complete(pending, False, "DPP設定適用がタイムアウトしました")
+
+    def _complete(self, pending: _Pending, success: bool, message: str):
+        with correlation_scope(pending.correlation_id):
+            try:
+                pending.on_complete(success, message)
+            except Exception as e:
+                logger.error(f"DPP完了処理中にエラーが発生しました: {str(e)}")
+
+
+# インターフェースごとのイベント監視
+_monitors: Dict[str, DppEventMonitor] = {}
+_monitors_lock = threading.Lock()
+
+
+def get_event_monitor(interface: str) -> DppEventMonitor:
+    """インターフェースのイベント監視を取得（未起動なら起動する）"""
+    with _monitors_lock:
+        monitor = _monitors.get(interface)
+        if monitor is None:
+            monitor = DppEventMonitor(interface)
+            monitor.start()
+            _monitors[interface] = monitor
+    return monitor
+
+
+def start_event_monitors():
+    """設定されたインターフェースのイベント監視を起動"""
+    if settings.dpp_wait_events:
+        for interface in settings.provisioning_interfaces:
+            get_event_monitor(interface)
+
+
+def stop_event_monitors():
+    """全てのイベント監視を停止"""
+    with _monitors_lock:
+        monitors = list(_monitors.values())
+        _monitors.clear()
+    # 全ての監視に停止を要求してから終了を待つ（受信待ちのタイムアウトを並行して待つ）
+    for monitor in monitors:
+        monitor.request_stop()
+    for monitor in monitors:
+        monitor.wait_stopped()
+    _event_loop.stop()
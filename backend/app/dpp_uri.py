@@ -0,0 +1,195 @@
+import base64
+import binascii
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from . import metrics
+
+# 解析結果をキャッシュするDPP URIの件数（同じQRコードの再スキャンや再投入ではhostapdに送る前に結果を再利用する）
+URI_CACHE_SIZE = 4096
+
+# id-ecPublicKey (1.2.840.10045.2.1)
+_EC_PUBLIC_KEY_OID = bytes.fromhex("2a8648ce3d0201")
+
+# 曲線のOID -> (曲線名, 座標のバイト数)
+_CURVES: Dict[bytes, Tuple[str, int]] = {
+    bytes.fromhex("2a8648ce3d030107"): ("prime256v1", 32),
+    bytes.fromhex("2b81040022"): ("secp384r1", 48),
+    bytes.fromhex("2b81040023"): ("secp521r1", 66),
+    bytes.fromhex("2b2403030208010107"): ("brainpoolP256r1", 32),
+    bytes.fromhex("2b240303020801010b"): ("brainpoolP384r1", 48),
+    bytes.fromhex("2b240303020801010d"): ("brainpoolP512r1", 64),
+}
+
+_MAC_SEPARATORS = str.maketrans('', '', ':-.')
+_HEX_DIGITS = frozenset('0123456789abcdef')
+
+
+class DppUriError(ValueError):
+    """DPP URI（QRコード）の形式が不正"""
+
+
+class DppUri(NamedTuple):
+    # チャンネルリスト（"オペレーティングクラス/チャンネル" のカンマ区切り）
+    channel: str
+    # 区切り文字なしの小文字16進（QRコードの M: と同じ形式）
+    mac_address: str
+    # base64エンコードされたDERのSubjectPublicKeyInfo
+    key: str
+    curve: str
+    info: Optional[str] = None
+    version: Optional[int] = None
+
+
+def parse_channel_list(value: str) -> str:
+    """
+    "81/1,115/36" 形式のチャンネルリストを検証し、重複を除いた正規形にする
+    不正な場合は DppUriError を送出する
+    """
+    channels: List[str] = []
+    for entry in value.split(','):
+        op_class, separator, channel = entry.strip().partition('/')
+        if not separator or not op_class.isdigit() or not channel.isdigit():
+            raise DppUriError(f"チャンネルは オペレーティングクラス/チャンネル の形式で指定してください: {entry.strip()}")
+        if not 1 <= int(op_class) <= 255 or not 1 <= int(channel) <= 255:
+            raise DppUriError(f"チャンネルの値が範囲外です: {entry.strip()}")
+        normalized = f"{int(op_class)}/{int(channel)}"
+        if normalized not in channels:
+            channels.append(normalized)
+    return ','.join(channels)
+
+
+def parse_mac(value: str) -> str:
+    """MACアドレスを区切り文字なしの小文字16進に揃える（不正な場合は DppUriError）"""
+    digits = value.strip().lower().translate(_MAC_SEPARATORS)
+    if len(digits) != 12 or not _HEX_DIGITS.issuperset(digits):
+        raise DppUriError(f"MACアドレスの形式が正しくありません: {value}")
+    return digits
+
+
+def normalize_mac_prefix(value: str) -> str:
+    """MACアドレスの前方一致検索の値を parse_mac と同じ形式にする（不正な場合は DppUriError）"""
+    digits = value.strip().lower().translate(_MAC_SEPARATORS)
+    if len(digits) > 12 or not _HEX_DIGITS.issuperset(digits):
+        raise DppUriError(f"MACアドレスの前方一致の形式が正しくありません: {value}")
+    return digits
+
+
+def _read_der(data: bytes, offset: int, tag: int) -> Tuple[int, int]:
+    """offsetの位置のDER要素のタグを確認し、(値の開始位置, 終了位置) を返す"""
+    if offset + 2 > len(data) or data[offset] != tag:
+        raise DppUriError("キーのASN.1構造が正しくありません")
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7f
+        if size == 0 or size > 2 or offset + size > len(data):
+            raise DppUriError("キーのASN.1構造が正しくありません")
+        length = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+    if offset + length > len(data):
+        raise DppUriError("キーのASN.1構造が正しくありません")
+    return offset, offset + length
+
+
+def decode_bootstrap_key(key: str) -> str:
+    """
+    ブートストラップ鍵（base64のSubjectPublicKeyInfo）を検証し、曲線名を返す
+    楕円曲線の公開鍵で、DPPで使用できる曲線と点の長さであることを確認する（曲線上の点かまでは確認しない）
+    """
+    try:
+        der = base64.b64decode(key, validate=True)
+    except (binascii.Error, ValueError):
+        raise DppUriError("キーがbase64ではありません")
+
+    # SubjectPublicKeyInfo ::= SEQUENCE { SEQUENCE { OID, OID }, BIT STRING }
+    start, end = _read_der(der, 0, 0x30)
+    if end != len(der):
+        raise DppUriError("キーのASN.1構造が正しくありません")
+    algorithm_start, algorithm_end = _read_der(der, start, 0x30)
+    oid_start, oid_end = _read_der(der, algorithm_start, 0x06)
+    if der[oid_start:oid_end] != _EC_PUBLIC_KEY_OID:
+        raise DppUriError("キーが楕円曲線の公開鍵ではありません")
+    curve_start, curve_end = _read_der(der, oid_end, 0x06)
+    curve = _CURVES.get(der[curve_start:curve_end])
+    if curve is None or curve_end != algorithm_end:
+        raise DppUriError("キーの曲線はDPPで使用できません")
+
+    point_start, point_end = _read_der(der, algorithm_end, 0x03)
+    if point_end != end or point_start == point_end or der[point_start] != 0:
+        raise DppUriError("キーのASN.1構造が正しくありません")
+    point = der[point_start + 1:point_end]
+    name, size = curve
+    if not point or not (
+        (point[0] in (2, 3) and len(point) == size + 1) or (point[0] == 4 and len(point) == 2 * size + 1)
+    ):
+        raise DppUriError(f"キーの公開鍵の長さが {name} と一致しません")
+    return name
+
+
+@lru_cache(maxsize=URI_CACHE_SIZE)
+def _parse_cached(uri: str) -> Union[DppUri, str]:
+    """DPP URIを解析する（不正な場合もキャッシュするため、例外ではなくエラーメッセージを返す）"""
+    try:
+        return _parse(uri)
+    except DppUriError as e:
+        return str(e)
+
+
+def _parse(uri: str) -> DppUri:
+    if not uri.startswith("DPP:") or not uri.endswith(";;"):
+        raise DppUriError("DPP URIは DPP: で始まり ;; で終わる必要があります")
+
+    tokens: Dict[str, str] = {}
+    for token in uri[4:-2].split(';'):
+        name, separator, value = token.partition(':')
+        if not separator or len(name) != 1 or not name.isupper():
+            raise DppUriError(f"DPP URIの要素が正しくありません: {token[:20]}")
+        if name in tokens:
+            raise DppUriError(f"DPP URIの要素が重複しています: {name}")
+        tokens[name] = value
+
+    # 機器の識別（MACアドレス、キー）と同じチャンネルのジョブのまとめ（チャンネル）に使用するため必須とする
+    missing = [name for name in ('C', 'M', 'K') if not tokens.get(name)]
+    if missing:
+        raise DppUriError(f"DPP URIに必須の要素がありません: {', '.join(missing)}")
+
+    version = tokens.get('V')
+    if version is not None and not version.isdigit():
+        raise DppUriError(f"DPPのバージョンが正しくありません: {version}")
+
+    key = tokens['K']
+    return DppUri(
+        channel=parse_channel_list(tokens['C']),
+        mac_address=parse_mac(tokens['M']),
+        key=key,
+        curve=decode_bootstrap_key(key),
+        info=tokens.get('I'),
+        version=int(version) if version is not None else None,
+    )
+
+
+def parse_dpp_uri(uri: str) -> DppUri:
+    """
+    QRコードのDPP URI（"DPP:C:81/1;M:...;K:...;;"）を解析・検証する
+    結果はURIの文字列ごとにキャッシュする。不正な場合は DppUriError を送出する
+    """
+    result = _parse_cached(uri.strip())
+    if isinstance(result, str):
+        raise DppUriError(result)
+    return result
+
+
+def parse_device_fields(mac_address: str, channel: str, key: str) -> DppUri:
+    """QRコードから個別に取り出したMACアドレス・チャンネル・キーを、URIにまとめて検証する"""
+    return parse_dpp_uri(f"DPP:C:{channel.strip()};M:{mac_address.strip()};K:{key.strip()};;")
+
+
+def _cache_stats() -> Dict[Tuple[str, ...], float]:
+    info = _parse_cached.cache_info()
+    return {("hits",): info.hits, ("misses",): info.misses, ("size",): info.currsize}
+
+
+metrics.gauge_callback(
+    "qrdia_dpp_uri_cache", "DPP URI解析結果のキャッシュ（hits/missesは累計、sizeは件数）", ["stat"], _cache_stats
+)
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 購読者ごとに溜められる未送信イベントの最大数
+_SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class DeviceEventBroker:
+    """
+    デバイスの作成・更新イベントを購読者（SSE接続）に配信する
+    publishは任意のスレッドから呼び出せる
+    """
+
+    def __init__(self):
+        self._subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> asyncio.Queue:
+        """イベントループ上で呼び出し、イベントを受け取るキューを返す"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers = [sub for sub in self._subscribers if sub[1] is not queue]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event: Dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_deliver, queue, event)
+            except RuntimeError:
+                # イベントループが終了している
+                self.unsubscribe(queue)
+
+
+def _deliver(queue: asyncio.Queue, event: Dict):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # 取りこぼしが発生したため、クライアントに差分取得での再同期を促す
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait({"event": "resync"})
+
+
+device_events = DeviceEventBroker()
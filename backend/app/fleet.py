@@ -0,0 +1,254 @@
+import json
+import logging
+import ssl
+import threading
+import time
+import urllib.request
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+from .config import settings
+from .dpp import build_conf_json, build_qr_code
+from .tracing import current_correlation_id
+
+logger = logging.getLogger(__name__)
+
+# エージェントのインターフェースをジョブキューで識別する名前の区切り（"ap1:wlan0"）
+TARGET_SEPARATOR = ":"
+
+_RPC_SECONDS = metrics.histogram(
+    "qrdia_agent_rpc_duration_seconds", "エージェントへのリクエストの所要時間（provisionはDPP結果の受信まで）",
+    ["agent", "method"]
+)
+
+
+class AgentUnavailable(Exception):
+    """エージェントに接続できない、または応答が不正"""
+
+
+class Agent:
+    """hostapdの隣で動くプロビジョニングエージェント（provisioning_cli.agent）"""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url.rstrip('/')
+        self._ssl_context = (
+            ssl.create_default_context(cafile=settings.agent_ca_file or None) if self.url.startswith("https://") else None
+        )
+        self.healthy = False
+        self.failures = 0
+        self.rooms: List[str] = []
+        # インターフェース -> 状態（channel, running, waiting）
+        self.interfaces: Dict[str, Dict] = {}
+        self.last_heartbeat: Optional[float] = None
+
+    def request(self, method: str, path: str, body: Optional[Dict] = None, timeout: float = 5) -> Dict:
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(f"{self.url}{path}", data=data, method=method)
+        request.add_header("Content-Type", "application/json")
+        if settings.agent_token:
+            request.add_header("X-Agent-Token", settings.agent_token)
+        with _RPC_SECONDS.labels(agent=self.name, method=path.strip('/')).time():
+            try:
+                with urllib.request.urlopen(request, timeout=timeout, context=self._ssl_context) as response:
+                    return json.loads(response.read())
+            except (OSError, ValueError) as e:
+                raise AgentUnavailable(f"エージェント {self.name} に接続できません: {str(e)}")
+
+    def load(self, interface: str) -> int:
+        state = self.interfaces.get(interface, {})
+        return state.get('running', 0) + state.get('waiting', 0)
+
+
+class Fleet:
+    """
+    エージェントの死活監視（ハートビート）と、エージェントのインターフェースへのDPPジョブの送信
+    インターフェースは "エージェント名:インターフェース名" の名前でジョブキューとして扱う
+    """
+
+    def __init__(self, agents: Dict[str, str]):
+        self.agents = {name: Agent(name, url) for name, url in agents.items()}
+        self._listeners: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_listener(self, listener: Callable[[], None]):
+        """エージェントの追加・停止・復帰時に呼び出す関数を登録"""
+        self._listeners.append(listener)
+
+    def start(self):
+        # 起動直後のジョブ投入に間に合うよう、最初のハートビートは同期的に行う
+        self.heartbeat()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="agent-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(settings.agent_heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"エージェントのハートビートでエラーが発生しました: {str(e)}")
+
+    def heartbeat(self):
+        """全エージェントの状態を取得し、停止・復帰やインターフェースの変化があれば通知する"""
+        changed = False
+        for agent in self.agents.values():
+            try:
+                status = agent.request("GET", "/status", timeout=min(5.0, settings.agent_heartbeat_interval))
+            except AgentUnavailable as e:
+                changed |= self._record_failure(agent, str(e))
+                continue
+            with self._lock:
+                interfaces_changed = set(status.get('interfaces', {})) != set(agent.interfaces)
+                recovered = not agent.healthy
+                agent.interfaces = status.get('interfaces', {})
+                agent.rooms = status.get('rooms', [])
+                agent.healthy = True
+                agent.failures = 0
+                agent.last_heartbeat = time.monotonic()
+            if recovered:
+                logger.info(f"エージェント接続: {agent.name}, interfaces={list(agent.interfaces)}")
+            changed |= recovered or interfaces_changed
+        if changed:
+            self._notify()
+
+    def _record_failure(self, agent: Agent, message: str) -> bool:
+        """失敗を記録し、停止とみなした場合はTrueを返す"""
+        with self._lock:
+            agent.failures += 1
+            if not agent.healthy or agent.failures < settings.agent_max_failures:
+                return False
+            agent.healthy = False
+        logger.warning(f"エージェント停止: {agent.name}, {message}")
+        return True
+
+    def _mark_down(self, agent: Agent, message: str):
+        """プロビジョニング中に接続できなかったエージェントを直ちに停止扱いにする"""
+        with self._lock:
+            was_healthy, agent.healthy = agent.healthy, False
+            agent.failures = max(agent.failures, settings.agent_max_failures)
+        if was_healthy:
+            logger.warning(f"エージェント停止: {agent.name}, {message}")
+            self._notify()
+
+    def _notify(self):
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"エージェント状態の通知中にエラーが発生しました: {str(e)}")
+
+    def targets(self) -> List[str]:
+        """エージェントのインターフェースの一覧（停止中のエージェントのものを含む）"""
+        with self._lock:
+            return [
+                f"{agent.name}{TARGET_SEPARATOR}{interface}"
+                for agent in self.agents.values() for interface in agent.interfaces
+            ]
+
+    def _resolve(self, target: str) -> Optional[Tuple[Agent, str]]:
+        name, separator, interface = target.partition(TARGET_SEPARATOR)
+        agent = self.agents.get(name) if separator else None
+        return (agent, interface) if agent is not None else None
+
+    def is_remote(self, target: str) -> bool:
+        return self._resolve(target) is not None
+
+    def is_available(self, target: str) -> bool:
+        """ローカルのインターフェース、または稼働中のエージェントのインターフェースか"""
+        resolved = self._resolve(target)
+        return resolved is None or resolved[0].healthy
+
+    def remote_load(self, target: str) -> int:
+        """エージェントが報告した実行中・待機中のDPP交換の数（ローカルは0）"""
+        resolved = self._resolve(target)
+        return resolved[0].load(resolved[1]) if resolved is not None else 0
+
+    def affinity(self, target: str, channel: Optional[str], room: Optional[str]) -> Tuple[int, int]:
+        """
+        デバイスとインターフェースの適合度 (部屋が一致するか, 動作チャンネルが一致するか)
+        チャンネルは "81/1,115/36" のような オペレーティングクラス/チャンネル のリストでも比較する
+        """
+        resolved = self._resolve(target)
+        if resolved is None:
+            return 0, 0
+        agent, interface = resolved
+        room_match = int(bool(room) and room in agent.rooms)
+        operating_channel = agent.interfaces.get(interface, {}).get('channel')
+        channel_match = int(bool(channel) and operating_channel is not None and any(
+            entry.rsplit('/', 1)[-1] == str(operating_channel) for entry in channel.split(',')
+        ))
+        return room_match, channel_match
+
+    def provision(self, target: str, device_data: Dict) -> Tuple[bool, str]:
+        """
+        エージェントでDPPプロビジョニングを実行し、結果イベントを受信するまで待つ
+        エージェントに接続できない場合は停止扱いにして AgentUnavailable を送出する
+        """
+        agent, interface = self._resolve(target)
+        try:
+            result = agent.request("POST", "/provision", {
+                "interface": interface,
+                "qr_code": build_qr_code(device_data),
+                "conf_json": build_conf_json(device_data),
+                "timeout": settings.dpp_timeout,
+                "correlation_id": current_correlation_id(),
+            }, timeout=settings.dpp_timeout + 15)
+        except AgentUnavailable as e:
+            self._mark_down(agent, str(e))
+            raise
+        return bool(result.get('success')), str(result.get('message', ''))
+
+
+_fleet: Optional[Fleet] = None
+_fleet_lock = threading.Lock()
+_fleet_started = False
+
+
+def get_fleet() -> Fleet:
+    """PROVISIONING_AGENTS のエージェントを管理するFleetを取得（未設定の場合はエージェント無し）"""
+    global _fleet
+    with _fleet_lock:
+        if _fleet is None:
+            _fleet = Fleet(settings.provisioning_agents)
+        return _fleet
+
+
+def start_fleet(listener: Callable[[], None]):
+    """エージェントの死活監視を開始（エージェントが無い場合は何もしない）"""
+    global _fleet_started
+    fleet = get_fleet()
+    with _fleet_lock:
+        if _fleet_started or not fleet.agents:
+            return
+        _fleet_started = True
+    fleet.add_listener(listener)
+    fleet.start()
+
+
+def stop_fleet():
+    """エージェントの死活監視を停止"""
+    global _fleet, _fleet_started
+    with _fleet_lock:
+        fleet, started = _fleet, _fleet_started
+        _fleet, _fleet_started = None, False
+    if fleet is not None and started:
+        fleet.stop()
+
+
+def _agent_up() -> Dict[Tuple[str, ...], float]:
+    fleet = _fleet
+    if fleet is None:
+        return {}
+    return {(agent.name,): 1 if agent.healthy else 0 for agent in fleet.agents.values()}
+
+
+metrics.gauge_callback("qrdia_agent_up", "エージェントが稼働中か（1: 稼働中）", ["agent"], _agent_up)
@@ -0,0 +1,50 @@
+import os
+import sys
+import threading
+from typing import Dict
+
+from .config import settings
+
+# インターフェースごとの常駐HostapdClient
+_hostapd_clients: Dict[str, object] = {}
+_hostapd_clients_lock = threading.Lock()
+
+
+def provisioning_cli():
+    """provisioning_cliパッケージを読み込む（未インストール時はCLIディレクトリから）"""
+    try:
+        import provisioning_cli
+    except ImportError:
+        cli_path = os.path.abspath(settings.cli_script_path)
+        if cli_path not in sys.path:
+            sys.path.append(cli_path)
+        import provisioning_cli
+    return provisioning_cli
+
+
+def get_hostapd_client(interface: str):
+    """インターフェースに対応する常駐HostapdClientを取得"""
+    client = _hostapd_clients.get(interface)
+    if client is not None:
+        return client
+
+    HostapdClient = provisioning_cli().HostapdClient
+    with _hostapd_clients_lock:
+        client = _hostapd_clients.get(interface)
+        if client is None:
+            client = HostapdClient(
+                interface,
+                socket_dir=settings.hostapd_socket_dir,
+                max_connections=settings.hostapd_max_connections
+            )
+            _hostapd_clients[interface] = client
+    return client
+
+
+def close_hostapd_clients():
+    """常駐HostapdClientの制御ソケットを全て閉じる"""
+    with _hostapd_clients_lock:
+        clients = list(_hostapd_clients.values())
+        _hostapd_clients.clear()
+    for client in clients:
+        client.close()
@@ -0,0 +1,760 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Tuple
+
+from . import metrics
+from .config import settings
+from .database import (
+    claim_devices_by_status, record_provisioning_attempt, set_devices_status, update_device,
+    upsert_provisioning_devices
+)
+from .dpp import DPP_STEP_SECONDS, apply_dpp_configuration, register_bootstrap
+from .fleet import AgentUnavailable, get_fleet, start_fleet, stop_fleet
+from .tracing import correlation_scope
+
+logger = logging.getLogger(__name__)
+
+_OUTCOMES = metrics.counter(
+    "qrdia_provisioning_outcomes",
+    "プロビジョニングの結果（configured / retry / dead_letter / deduplicated / already_configured）",
+    ["outcome"]
+)
+_ATTEMPT_SECONDS = metrics.histogram(
+    "qrdia_provisioning_attempt_duration_seconds",
+    "1回のプロビジョニング試行（DPP結果イベントの受信まで）の所要時間",
+    ["interface"]
+)
+_QUEUE_WAIT_SECONDS = metrics.histogram(
+    "qrdia_provisioning_queue_wait_seconds",
+    "ジョブがキューに投入されてからワーカーが処理を始めるまでの時間",
+    ["interface"]
+)
+
+# 完了済みジョブを保持する最大件数
+_MAX_FINISHED_JOBS = 1000
+# 起動時に"configuring"から戻す1回あたりのデバイス数
+_RECOVER_CHUNK_SIZE = 500
+
+
+class ProvisioningJob:
+    def __init__(self, device_id: Optional[int], device_data: Dict, bootstrap_id: Optional[str] = None):
+        self.job_id = uuid.uuid4().hex
+        # デバイスの登録前に実行中ジョブとして予約した場合はNone
+        self.device_id = device_id
+        self.device_data = device_data
+        # 一括登録で事前にQRコードを登録済みの場合のbootstrap ID
+        self.bootstrap_id = bootstrap_id
+        self.channel = device_data.get('channel', '')
+        # 投入先のインターフェース（bootstrap IDはこのインターフェースでのみ有効）
+        self.interface: Optional[str] = None
+        self.enqueued_at = 0.0
+        self.attempts = 0
+        self.next_attempt_at: Optional[str] = None
+        self.status = "queued"
+        self.message = "プロビジョニング待ちです"
+        self.created_at = datetime.now().isoformat()
+        self.finished_at: Optional[str] = None
+        # デバイスがデータベースに登録された（device_idが確定した）
+        self.registered = threading.Event()
+        self.done = threading.Event()
+
+    @property
+    def bootstrap_key(self) -> Tuple[str, str]:
+        return _bootstrap_key(self.device_data)
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "device_id": self.device_id,
+            "status": self.status,
+            "message": self.message,
+            "interface": self.interface,
+            "channel": self.channel,
+            "attempts": self.attempts,
+            "next_attempt_at": self.next_attempt_at,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+def _bootstrap_key(device_data: Dict) -> Tuple[str, str]:
+    """デバイスを識別するキー（MACアドレスと公開鍵）"""
+    return device_data.get('mac_address', ''), device_data.get('key', '')
+
+
+class ProvisioningQueue:
+    """
+    hostapdインターフェースごとのプロビジョニングジョブキューとワーカー
+    待機中のジョブをチャンネルごとにまとめ、同じチャンネルのジョブを続けて処理してチャンネル切り替えを減らす
+    ただし他チャンネルのジョブが dpp_channel_max_wait 秒以上待っている場合は最も古いジョブのチャンネルに切り替える
+    """
+
+    def __init__(self, interface: str, concurrency: int):
+        self.interface = interface
+        self.concurrency = concurrency
+        # channel -> 待機中のジョブ（投入順）
+        self._channels: Dict[str, Deque[ProvisioningJob]] = {}
+        self._current_channel: Optional[str] = None
+        self._waiting = 0
+        self._running = 0
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+
+    def start(self):
+        self._stopping = False
+        for i in range(self.concurrency):
+            worker = threading.Thread(
+                target=self._work, name=f"dpp-worker-{self.interface}-{i}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        """
+        新しいジョブの処理をやめ、実行中のジョブの終了を待ってワーカーを停止する
+        待機中のジョブは"dead_letter"にする（APIから再投入できる）
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        jobs = self.drain()
+        for worker in self._workers:
+            worker.join()
+        self._workers.clear()
+        if jobs:
+            logger.warning(f"停止のため待機中のジョブを中止: interface={self.interface}, {len(jobs)}件")
+            _abandon_jobs(jobs, "サーバー停止のためプロビジョニングを中止しました")
+
+    def submit(self, job: ProvisioningJob):
+        with self._condition:
+            stopping = self._stopping
+            if not stopping:
+                job.interface = self.interface
+                job.enqueued_at = time.monotonic()
+                self._channels.setdefault(job.channel, deque()).append(job)
+                self._waiting += 1
+                self._condition.notify()
+        if stopping:
+            _abandon_jobs([job], "サーバー停止中のためプロビジョニングを開始できません")
+
+    def depth(self) -> int:
+        return self._waiting
+
+    def drain(self) -> List[ProvisioningJob]:
+        """待機中のジョブを全て取り出す（エージェント停止時に他のキューへ移す）"""
+        with self._condition:
+            jobs = sorted(
+                (job for channel_jobs in self._channels.values() for job in channel_jobs),
+                key=lambda job: job.enqueued_at
+            )
+            self._channels.clear()
+            self._waiting = 0
+            return jobs
+
+    def load(self) -> int:
+        """待機中と実行中のジョブ数"""
+        return self._waiting + self._running
+
+    def _select_channel(self) -> str:
+        oldest_channel = min(self._channels, key=lambda channel: self._channels[channel][0].enqueued_at)
+        if self._current_channel in self._channels:
+            oldest_wait = time.monotonic() - self._channels[oldest_channel][0].enqueued_at
+            if oldest_wait < settings.dpp_channel_max_wait:
+                return self._current_channel
+        return oldest_channel
+
+    def _next_job(self) -> Optional[ProvisioningJob]:
+        with self._condition:
+            while not self._channels:
+                if self._stopping:
+                    return None
+                self._condition.wait()
+
+            channel = self._select_channel()
+            jobs = self._channels[channel]
+            job = jobs.popleft()
+            if not jobs:
+                del self._channels[channel]
+            _QUEUE_WAIT_SECONDS.labels(interface=self.interface).observe(time.monotonic() - job.enqueued_at)
+            if channel != self._current_channel:
+                logger.info(f"DPPチャンネル切り替え: interface={self.interface}, channel={channel}")
+                self._current_channel = channel
+            self._waiting -= 1
+            self._running += 1
+            return job
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            with correlation_scope(job.job_id):
+                self._process(job)
+
+    def _process(self, job: ProvisioningJob):
+        started_at = datetime.now().isoformat()
+        start = time.perf_counter()
+        try:
+            success, message = _run_job(job)
+        except Exception as e:
+            logger.error(f"プロビジョニングジョブでエラーが発生しました: job={job.job_id}, {str(e)}")
+            success, message = False, f"プロビジョニング中にエラーが発生しました: {str(e)}"
+        finally:
+            with self._condition:
+                self._running -= 1
+        _ATTEMPT_SECONDS.labels(interface=self.interface).observe(time.perf_counter() - start)
+        try:
+            _complete_attempt(job, started_at, success, message)
+        except Exception as e:
+            logger.error(f"プロビジョニング結果の保存に失敗しました: job={job.job_id}, {str(e)}")
+            _abandon_job(job, f"プロビジョニング結果の保存に失敗しました: {str(e)}")
+
+
+class RetryScheduler:
+    """
+    失敗したジョブをバックオフ時間だけ保持し、再試行時刻になったら元のインターフェースのキューに戻す
+    停止時に待機中のジョブは"dead_letter"にする（APIから再投入できる）
+    """
+
+    def __init__(self):
+        # (再試行時刻, 登録順, ジョブ)
+        self._heap: List[Tuple[float, int, ProvisioningJob]] = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="dpp-retry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._condition:
+            jobs = [job for _, _, job in self._heap]
+            self._heap.clear()
+        for job in jobs:
+            _finish_job(job, False, "サーバー停止のため再試行を中止しました")
+
+    def schedule(self, job: ProvisioningJob, delay: float) -> bool:
+        """再試行を予約する（停止中はFalse）"""
+        with self._condition:
+            if self._stopping:
+                return False
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._order), job))
+            self._condition.notify()
+            return True
+
+    def depth(self) -> int:
+        with self._condition:
+            return len(self._heap)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    if self._heap:
+                        timeout = self._heap[0][0] - time.monotonic()
+                        if timeout <= 0:
+                            break
+                        self._condition.wait(timeout)
+                    else:
+                        self._condition.wait()
+                if self._stopping:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+            _resubmit(job)
+
+
+def _run_job(job: ProvisioningJob) -> Tuple[bool, str]:
+    """
+    DPP設定を適用し、最終結果が出るまでワーカーを占有する
+    Returns: (成功したか, メッセージ)
+    """
+    job.status = "running"
+    job.message = "DPP設定を適用しています"
+    job.next_attempt_at = None
+    job.attempts += 1
+
+    result = {}
+    completed = threading.Event()
+
+    def on_complete(success: bool, message: str):
+        result["success"] = success
+        result["message"] = message
+        completed.set()
+
+    fleet = get_fleet()
+    if fleet.is_remote(job.interface):
+        # エージェントがDPP結果イベントの受信まで行う
+        try:
+            with DPP_STEP_SECONDS.labels(step="agent").time():
+                success, message = fleet.provision(job.interface, job.device_data)
+        except AgentUnavailable as e:
+            return False, str(e)
+        if not success:
+            return False, f"デバイス設定の適用に失敗しました: {message}"
+        return True, "デバイスの設定が正常に完了しました"
+
+    wait_events = settings.dpp_wait_events
+    started = apply_dpp_configuration(
+        job.device_data,
+        on_complete=on_complete if wait_events else None,
+        bootstrap_id=job.bootstrap_id,
+        interface=job.interface
+    )
+
+    if not started:
+        return False, "デバイス設定の適用に失敗しました"
+
+    if wait_events:
+        # タイムアウトはイベント監視側で判定されるため、ここでは余裕を持って待つ
+        # DPP_AUTH_INITの受付から結果イベント（DPP-CONF-SENT など）の受信まで
+        with DPP_STEP_SECONDS.labels(step="conf_result").time():
+            received = completed.wait(settings.dpp_timeout + 5)
+        if not received:
+            return False, "DPP設定適用がタイムアウトしました"
+        if not result["success"]:
+            return False, f"デバイス設定の適用に失敗しました: {result['message']}"
+
+    return True, "デバイスの設定が正常に完了しました"
+
+
+def retry_delay(attempt: int) -> float:
+    """attempt回目の失敗後の待ち時間（指数バックオフ、上限あり、前半をランダムに揺らす）"""
+    delay = min(settings.dpp_retry_max_delay, settings.dpp_retry_base_delay * (2 ** (attempt - 1)))
+    return random.uniform(delay / 2, delay)
+
+
+def _complete_attempt(job: ProvisioningJob, started_at: str, success: bool, message: str):
+    """試行結果を履歴に記録し、成功・再試行・dead_letterのいずれかに進める"""
+    record_provisioning_attempt({
+        "device_id": job.device_id,
+        "job_id": job.job_id,
+        "attempt": job.attempts,
+        "interface": job.interface,
+        "success": success,
+        "message": message,
+        "started_at": started_at,
+        "finished_at": datetime.now().isoformat()
+    })
+
+    if success or job.attempts >= settings.dpp_max_attempts:
+        _OUTCOMES.labels(outcome="configured" if success else "dead_letter").inc()
+        _finish_job(job, success, message)
+        return
+
+    _OUTCOMES.labels(outcome="retry").inc()
+
+    delay = retry_delay(job.attempts)
+    # 失敗の原因がhostapd側のbootstrap情報の消失である場合に備えて、再試行時はQRコードを登録し直す
+    job.bootstrap_id = None
+    job.status = "retrying"
+    job.message = f"{job.attempts}回目の試行に失敗したため再試行します: {message}"
+    job.next_attempt_at = (datetime.now() + timedelta(seconds=delay)).isoformat()
+    if not _retry_scheduler.schedule(job, delay):
+        _finish_job(job, False, message)
+        return
+    logger.info(f"DPP再試行予約: job={job.job_id}, デバイスID={job.device_id}, {delay:.1f}秒後")
+
+
+def _resubmit(job: ProvisioningJob):
+    """
+    再試行時刻になったジョブを元のインターフェースのキューに戻す
+    インターフェースが無くなった、またはエージェントが停止している場合は他のキューを選び直す
+    """
+    with _queues_lock:
+        provisioning_queue = _queues.get(job.interface)
+    if provisioning_queue is None or not get_fleet().is_available(job.interface):
+        try:
+            provisioning_queue = _select_queue(job.device_data)
+        except RuntimeError as e:
+            _abandon_job(job, str(e))
+            return
+    job.status = "queued"
+    job.message = "プロビジョニング待ちです（再試行）"
+    provisioning_queue.submit(job)
+
+
+def _finish_job(job: ProvisioningJob, success: bool, message: str):
+    status = "configured" if success else "dead_letter"
+    update_device(job.device_id, {'status': status})
+    logger.info(
+        f"DPP設定結果: job={job.job_id}, デバイスID={job.device_id}, status={status}, 試行回数={job.attempts}"
+    )
+    _mark_finished(job, success, message)
+
+
+def _abandon_job(job: ProvisioningJob, message: str):
+    """
+    結果を保存できない、または投入先が無いジョブを失敗として終了する
+    デバイスを"configuring"のまま残さないよう"dead_letter"にし（APIから再投入できる）、実行中のジョブから外す
+    """
+    _abandon_jobs([job], message)
+
+
+def _abandon_jobs(jobs: List[ProvisioningJob], message: str):
+    device_ids = [job.device_id for job in jobs if job.device_id is not None]
+    try:
+        if device_ids:
+            set_devices_status(device_ids, 'dead_letter')
+    except Exception as e:
+        logger.error(f"デバイスのステータスを戻せませんでした: デバイスID={device_ids}, {str(e)}")
+    for job in jobs:
+        _mark_finished(job, False, message)
+
+
+def _mark_finished(job: ProvisioningJob, success: bool, message: str):
+    job.status = "completed" if success else "failed"
+    job.message = message
+    job.finished_at = datetime.now().isoformat()
+    with _jobs_lock:
+        if _inflight.get(job.bootstrap_key) is job:
+            del _inflight[job.bootstrap_key]
+    job.done.set()
+    _trim_finished_jobs()
+
+
+# インターフェースごとのキューとジョブ一覧
+_queues: Dict[str, ProvisioningQueue] = {}
+_queues_lock = threading.Lock()
+_jobs: "OrderedDict[str, ProvisioningJob]" = OrderedDict()
+# 実行中（未完了）のジョブ: (mac_address, key) -> ProvisioningJob
+_inflight: Dict[Tuple[str, str], ProvisioningJob] = {}
+_jobs_lock = threading.Lock()
+_retry_scheduler = RetryScheduler()
+_retry_scheduler_started = False
+
+
+def _trim_finished_jobs():
+    with _jobs_lock:
+        finished = [job_id for job_id, job in _jobs.items() if job.done.is_set()]
+        for job_id in finished[:max(0, len(finished) - _MAX_FINISHED_JOBS)]:
+            del _jobs[job_id]
+
+
+def _workers_for(interface: str) -> int:
+    """
+    インターフェースのワーカー数
+    DPPイベントで結果を判定するローカルのインターフェースでは、peerを含まないイベント（DPP-CONF-SENT など）を
+    交換に対応付けられるよう、同時に行うDPP交換を1つに制限する
+    """
+    workers = settings.dpp_workers_per_interface
+    if workers > 1 and settings.dpp_wait_events and not get_fleet().is_remote(interface):
+        logger.warning(
+            f"DPP_WAIT_EVENTSが有効なため DPP_WORKERS_PER_INTERFACE={workers} を1に制限します: interface={interface}"
+        )
+        return 1
+    return workers
+
+
+def _start_queues(interfaces: List[str]):
+    with _queues_lock:
+        for interface in interfaces:
+            if interface not in _queues:
+                provisioning_queue = ProvisioningQueue(interface, _workers_for(interface))
+                provisioning_queue.start()
+                _queues[interface] = provisioning_queue
+
+
+def _on_fleet_change():
+    """エージェントのインターフェースのキューを作成し、停止したエージェントの待機中ジョブを他のキューへ移す"""
+    fleet = get_fleet()
+    _start_queues(fleet.targets())
+    with _queues_lock:
+        unavailable = [
+            provisioning_queue for interface, provisioning_queue in _queues.items()
+            if not fleet.is_available(interface)
+        ]
+    for provisioning_queue in unavailable:
+        jobs = provisioning_queue.drain()
+        if jobs:
+            logger.warning(f"停止したエージェントの待機中ジョブを移動: interface={provisioning_queue.interface}, {len(jobs)}件")
+        for job in jobs:
+            _resubmit(job)
+
+
+def start_provisioning_workers():
+    """設定された全インターフェース（エージェントを含む）のワーカーと再試行スケジューラを起動"""
+    global _retry_scheduler_started
+    with _queues_lock:
+        if not _retry_scheduler_started:
+            _retry_scheduler.start()
+            _retry_scheduler_started = True
+    _start_queues(settings.provisioning_interfaces)
+    start_fleet(_on_fleet_change)
+
+
+def recover_interrupted_devices() -> int:
+    """
+    前回の停止・クラッシュで"configuring"のまま残ったデバイスを"dead_letter"にする（APIから再投入できる）
+    ジョブはメモリ上にのみあるため、起動時にワーカーを開始する前に呼び出す
+    """
+    recovered = 0
+    while True:
+        devices = claim_devices_by_status('configuring', 'dead_letter', None, _RECOVER_CHUNK_SIZE)
+        recovered += len(devices)
+        if len(devices) < _RECOVER_CHUNK_SIZE:
+            break
+    if recovered:
+        logger.warning(f"前回の実行で中断したプロビジョニングをdead_letterにしました: {recovered}件")
+    return recovered
+
+
+def stop_provisioning_workers():
+    """全てのワーカーを停止（再試行待ちのジョブは"dead_letter"になる）"""
+    global _retry_scheduler_started
+    stop_fleet()
+    with _queues_lock:
+        queues = list(_queues.values())
+        _queues.clear()
+        stop_retries, _retry_scheduler_started = _retry_scheduler_started, False
+    if stop_retries:
+        _retry_scheduler.stop()
+    for provisioning_queue in queues:
+        provisioning_queue.stop()
+
+
+def _provisioning_queues() -> List[ProvisioningQueue]:
+    """ジョブを投入できるキュー（停止中のエージェントのキューは全て停止中の場合のみ含める）"""
+    start_provisioning_workers()
+    with _queues_lock:
+        queues = list(_queues.values())
+    fleet = get_fleet()
+    available = [provisioning_queue for provisioning_queue in queues if fleet.is_available(provisioning_queue.interface)]
+    if not (available or queues):
+        raise RuntimeError("プロビジョニングに使用できるインターフェースがありません")
+    return available or queues
+
+
+def _queue_rank(provisioning_queue: ProvisioningQueue, load: int, device_data: Dict) -> Tuple[int, int]:
+    """
+    キューの選択順（小さいほど優先）
+    部屋が一致するエージェントを優先し、その中で負荷の少ないものを選ぶ
+    デバイスのチャンネルで動作しているインターフェースは待機中のジョブ1件分だけ優先する
+    """
+    fleet = get_fleet()
+    room_match, channel_match = fleet.affinity(
+        provisioning_queue.interface, device_data.get('channel'), device_data.get('room')
+    )
+    return -room_match, load + fleet.remote_load(provisioning_queue.interface) - channel_match
+
+
+def _select_queue(device_data: Dict) -> ProvisioningQueue:
+    """デバイスの部屋・チャンネルとインターフェースの負荷から投入先のキューを選ぶ"""
+    return min(
+        _provisioning_queues(),
+        key=lambda provisioning_queue: _queue_rank(provisioning_queue, provisioning_queue.load(), device_data)
+    )
+
+
+def _reserve_jobs(devices_data: List[Dict]) -> Tuple[List[ProvisioningJob], List[ProvisioningJob]]:
+    """
+    同じ (mac_address, key) の実行中ジョブがあればそれを使い、無ければ新しいジョブを予約する
+    Returns: (デバイスごとのジョブ, 新たに予約したジョブ)
+    """
+    jobs = []
+    reserved = []
+    with _jobs_lock:
+        for device_data in devices_data:
+            job = _inflight.get(_bootstrap_key(device_data))
+            if job is None:
+                job = ProvisioningJob(None, device_data)
+                _inflight[job.bootstrap_key] = job
+                reserved.append(job)
+            jobs.append(job)
+    return jobs, reserved
+
+
+def _register_jobs(reserved: List[ProvisioningJob]) -> List[ProvisioningJob]:
+    """
+    予約したジョブのデバイスを登録し、プロビジョニングが必要なジョブを返す
+    同じSSID/パスワードで設定済みのデバイスのジョブは完了済みにする
+    """
+    devices_data = [{**job.device_data, 'status': 'configuring'} for job in reserved]
+    try:
+        results = upsert_provisioning_devices(devices_data)
+    except Exception:
+        with _jobs_lock:
+            for job in reserved:
+                _inflight.pop(job.bootstrap_key, None)
+        for job in reserved:
+            job.registered.set()
+        raise
+
+    pending = []
+    configured = []
+    with _jobs_lock:
+        for job, device_data, (device_id, needs_provisioning) in zip(reserved, devices_data, results):
+            job.device_id = device_id
+            job.device_data['room'] = device_data.get('room')
+            _jobs[job.job_id] = job
+            (pending if needs_provisioning else configured).append(job)
+    for job in reserved:
+        job.registered.set()
+    for job in configured:
+        _OUTCOMES.labels(outcome="already_configured").inc()
+        _mark_finished(job, True, "同じ設定で構成済みのデバイスです")
+    return pending
+
+
+def _wait_registered(jobs: List[ProvisioningJob]):
+    """他のリクエストが予約したジョブのデバイス登録を待つ"""
+    for job in jobs:
+        job.registered.wait()
+        if job.device_id is None:
+            raise RuntimeError("同じデバイスのプロビジョニング開始に失敗しました")
+
+
+def enqueue_new_device(device_data: Dict) -> ProvisioningJob:
+    """
+    デバイスを"configuring"状態で登録し、プロビジョニングジョブを投入する
+    同じデバイス（mac_addressとkey）のジョブが実行中の場合は新たなDPP交換を始めずにそのジョブを返す
+    DPPの実行結果はワーカーがステータスに反映する
+    """
+    # 投入先が無い場合はデバイスを登録する前に失敗させる
+    provisioning_queue = _select_queue(device_data)
+    (job,), reserved = _reserve_jobs([{**device_data, 'date': datetime.now().isoformat()}])
+    if not reserved:
+        _OUTCOMES.labels(outcome="deduplicated").inc()
+        _wait_registered([job])
+        logger.info(f"実行中のプロビジョニングジョブを再利用: job={job.job_id}, デバイスID={job.device_id}")
+        return job
+
+    if not _register_jobs(reserved):
+        return job
+
+    provisioning_queue.submit(job)
+    logger.info(
+        f"プロビジョニングジョブ投入: job={job.job_id}, デバイスID={job.device_id}, "
+        f"interface={provisioning_queue.interface}"
+    )
+    return job
+
+
+def enqueue_new_devices(devices_data: List[Dict]) -> List[ProvisioningJob]:
+    """
+    複数デバイスを1つのトランザクションで"configuring"状態で登録し、
+    負荷の少ないインターフェースに振り分けてQRコードをまとめてhostapdに登録してからDPP認証ジョブを投入する
+    実行中のデバイスやリクエスト内で重複したデバイスには同じジョブを返す
+    QRコード登録に失敗したデバイスはワーカーが登録からやり直す
+    """
+    date = datetime.now().isoformat()
+    devices_data = [{**device_data, 'date': date} for device_data in devices_data]
+    queues = _provisioning_queues()
+    jobs, reserved = _reserve_jobs(devices_data)
+    pending = _register_jobs(reserved) if reserved else []
+
+    loads = {provisioning_queue.interface: provisioning_queue.load() for provisioning_queue in queues}
+    fleet = get_fleet()
+
+    unregistered = 0
+    assigned = []
+    for job in pending:
+        # bootstrap IDは登録したインターフェースでのみ有効なため、登録前に投入先を決める
+        provisioning_queue = min(
+            queues,
+            key=lambda candidate: _queue_rank(candidate, loads[candidate.interface], job.device_data)
+        )
+        loads[provisioning_queue.interface] += 1
+        # エージェントのインターフェースではエージェントがQRコードの登録から行う
+        if not fleet.is_remote(provisioning_queue.interface):
+            job.bootstrap_id = register_bootstrap(job.device_data, provisioning_queue.interface)
+            if job.bootstrap_id is None:
+                unregistered += 1
+        job.interface = provisioning_queue.interface
+        assigned.append((provisioning_queue, job))
+
+    for provisioning_queue, job in assigned:
+        provisioning_queue.submit(job)
+
+    reserved_ids = {job.job_id for job in reserved}
+    _OUTCOMES.labels(outcome="deduplicated").inc(len(jobs) - len(reserved))
+    _wait_registered([job for job in jobs if job.job_id not in reserved_ids])
+    logger.info(
+        f"一括プロビジョニングジョブ投入: {len(pending)}件"
+        f"（QRコード事前登録失敗 {unregistered}件、重複・設定済み {len(jobs) - len(pending)}件）"
+    )
+    return jobs
+
+
+def requeue_dead_letter_devices(device_ids: Optional[List[int]] = None, limit: int = 500) -> List[ProvisioningJob]:
+    """
+    "dead_letter"のデバイスを"configuring"に戻し、試行回数をリセットしたジョブとして再投入する
+    device_idsを省略した場合は古い順にlimit件まで再投入する
+    """
+    # 投入先が無い場合はデバイスを"configuring"にする前に失敗させる
+    _provisioning_queues()
+    devices = claim_devices_by_status('dead_letter', 'configuring', device_ids, limit)
+
+    jobs = []
+    with _jobs_lock:
+        for device in devices:
+            job = ProvisioningJob(device['id'], device)
+            job.registered.set()
+            # 同じデバイスが再スキャンされて既に実行中の場合はそのジョブに任せる
+            if job.bootstrap_key in _inflight:
+                continue
+            _inflight[job.bootstrap_key] = job
+            _jobs[job.job_id] = job
+            jobs.append(job)
+
+    submitted = 0
+    try:
+        for job in jobs:
+            _select_queue(job.device_data).submit(job)
+            submitted += 1
+    except Exception as e:
+        for job in jobs[submitted:]:
+            _abandon_job(job, f"再投入に失敗しました: {str(e)}")
+        raise
+
+    logger.info(f"dead_letterのデバイスを再投入: {len(jobs)}件")
+    return jobs
+
+
+def _queue_depths() -> Dict[Tuple[str, ...], float]:
+    with _queues_lock:
+        queues = list(_queues.values())
+    return {(provisioning_queue.interface,): provisioning_queue.depth() for provisioning_queue in queues}
+
+
+def _running_jobs() -> Dict[Tuple[str, ...], float]:
+    with _queues_lock:
+        queues = list(_queues.values())
+    return {
+        (provisioning_queue.interface,): provisioning_queue.load() - provisioning_queue.depth()
+        for provisioning_queue in queues
+    }
+
+
+metrics.gauge_callback(
+    "qrdia_provisioning_queue_depth", "インターフェースごとの待機中のジョブ数", ["interface"], _queue_depths
+)
+metrics.gauge_callback(
+    "qrdia_provisioning_running", "インターフェースごとの実行中のジョブ数", ["interface"], _running_jobs
+)
+metrics.gauge_callback(
+    "qrdia_provisioning_retry_scheduled", "再試行待ちのジョブ数", [],
+    lambda: {(): _retry_scheduler.depth()}
+)
+
+
+def get_job(job_id: str) -> Optional[ProvisioningJob]:
+    """ジョブIDでジョブを取得"""
+    with _jobs_lock:
+        return _jobs.get(job_id)
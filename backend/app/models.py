@@ -14,11 +14,19 @@ class Device(BaseModel):
     password: Optional[str] = None
     room: Optional[str] = None
     desc: Optional[str] = None
+    # hostapdのステーション一覧で最後に接続を確認した日時
+    last_seen: Optional[str] = None
+    # 認証情報プロファイルを使用したデバイスはパスワードを持たずプロファイルを参照する
+    profile_id: Optional[int] = None
 
 
 class DeviceResponse(BaseModel):
     success: bool
+    # fields= でフィールドを限定した応答はこのモデルを経由しない（各要素はDeviceのフィールドの部分集合）
     data: List[Device]
+    next_cursor: Optional[str] = None
+    # 次回の差分取得（since）に指定するカーソル
+    next_since: Optional[str] = None
 
 
 class ErrorResponse(BaseModel):
@@ -28,11 +36,17 @@ class ErrorResponse(BaseModel):
 
 
 class NewDeviceRequest(BaseModel):
-    mac_address: str
-    channel: str
-    key: str
-    ssid: str
-    password: str
+    # QRコードのDPP URIをそのまま渡す場合は mac_address / channel / key を省略できる
+    uri: Optional[str] = None
+    mac_address: str = ""
+    channel: str = ""
+    key: str = ""
+    # 認証情報プロファイルを指定する場合は ssid / password を省略できる
+    ssid: str = ""
+    password: str = ""
+    profile_id: Optional[int] = None
+    # 設置する部屋（部屋を担当するAPのエージェントでプロビジョニングする）
+    room: Optional[str] = None
 
 
 class NewDeviceResponseData(BaseModel):
@@ -41,6 +55,7 @@ class NewDeviceResponseData(BaseModel):
     status: str
     message: str
     date: str
+    job_id: str
 
 
 class NewDeviceResponse(BaseModel):
@@ -48,6 +63,80 @@ class NewDeviceResponse(BaseModel):
     data: NewDeviceResponseData
 
 
+class BatchDeviceEntry(BaseModel):
+    uri: Optional[str] = None
+    mac_address: str = ""
+    channel: str = ""
+    key: str = ""
+    # 省略した場合は BatchDeviceRequest.room
+    room: Optional[str] = None
+
+
+class BatchDeviceRequest(BaseModel):
+    ssid: str = ""
+    password: str = ""
+    profile_id: Optional[int] = None
+    room: Optional[str] = None
+    devices: List[BatchDeviceEntry]
+
+
+class BatchDeviceResponse(BaseModel):
+    success: bool
+    data: List[NewDeviceResponseData]
+
+
+class ProvisioningJobData(BaseModel):
+    job_id: str
+    device_id: int
+    status: str
+    message: str
+    interface: Optional[str] = None
+    channel: Optional[str] = None
+    attempts: int = 0
+    next_attempt_at: Optional[str] = None
+    created_at: str
+    finished_at: Optional[str] = None
+
+
+class ProvisioningJobResponse(BaseModel):
+    success: bool
+    data: ProvisioningJobData
+
+
+class RequeueDevicesRequest(BaseModel):
+    # 省略時は"dead_letter"の全デバイス（古い順に上限件数まで）
+    device_ids: Optional[List[int]] = None
+
+
+class ProvisioningAttemptData(BaseModel):
+    id: int
+    device_id: int
+    job_id: str
+    attempt: int
+    interface: Optional[str] = None
+    success: bool
+    message: Optional[str] = None
+    started_at: str
+    finished_at: str
+
+
+class ProvisioningAttemptsResponse(BaseModel):
+    success: bool
+    data: List[ProvisioningAttemptData]
+
+
+class ImportDevicesResponseData(BaseModel):
+    imported: int
+    skipped: int
+    # 読み飛ばした行のエラー（先頭から最大100件）
+    errors: List[str]
+
+
+class ImportDevicesResponse(BaseModel):
+    success: bool
+    data: ImportDevicesResponseData
+
+
 class UpdateDeviceRequest(BaseModel):
     name: Optional[str] = None
     ssid: Optional[str] = None
@@ -61,3 +150,29 @@ class UpdateDeviceResponse(BaseModel):
     success: bool
     data: Optional[Device] = None
     message: str
+
+
+class CredentialProfileRequest(BaseModel):
+    name: str
+    ssid: str
+    akm: str = "psk"
+    password: str
+
+
+class CredentialProfile(BaseModel):
+    # パスワードは返さない
+    id: int
+    name: str
+    ssid: str
+    akm: str
+    created_at: str
+
+
+class CredentialProfileResponse(BaseModel):
+    success: bool
+    data: CredentialProfile
+
+
+class CredentialProfilesResponse(BaseModel):
+    success: bool
+    data: List[CredentialProfile]
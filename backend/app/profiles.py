@@ -0,0 +1,62 @@
+import json
+import threading
+from typing import Dict, Optional, Tuple
+
+from . import metrics
+from .database import get_credential_profile
+
+_CACHE_REQUESTS = metrics.counter(
+    "qrdia_profile_cache_requests", "認証情報プロファイルのキャッシュの参照回数（hit / miss）", ["result"]
+)
+
+# プロファイルID -> (プロファイル, 作成済みのconf_json)
+# プロファイルは作成後に変更しないため、キャッシュを無効化する必要はない
+_profiles: Dict[int, Tuple[Dict, str]] = {}
+_profiles_lock = threading.Lock()
+
+
+def encode_conf_json(ssid: str, akm: str, password: str) -> str:
+    """DPP_AUTH_INITで送信するWi-Fi設定（conf_json）を作成"""
+    return json.dumps({
+        "wi-fi_tech": "infra",
+        "discovery": {
+            "ssid": ssid
+        },
+        "cred": {
+            "akm": akm,
+            "pass": password
+        }
+    })
+
+
+def _load(profile_id: int) -> Optional[Tuple[Dict, str]]:
+    cached = _profiles.get(profile_id)
+    if cached is not None:
+        _CACHE_REQUESTS.labels(result="hit").inc()
+        return cached
+    _CACHE_REQUESTS.labels(result="miss").inc()
+    profile = get_credential_profile(profile_id)
+    if profile is None:
+        return None
+    cached = (profile, encode_conf_json(profile['ssid'], profile['akm'], profile['password']))
+    with _profiles_lock:
+        _profiles.setdefault(profile_id, cached)
+    return cached
+
+
+def get_profile(profile_id: int) -> Optional[Dict]:
+    """認証情報プロファイルを取得（パスワードを含む。存在しない場合はNone）"""
+    cached = _load(profile_id)
+    return cached[0] if cached is not None else None
+
+
+def get_conf_json(profile_id: int) -> str:
+    """
+    プロファイルのconf_jsonを取得（プロファイルごとに1回だけ作成してキャッシュする）
+    プロファイルが存在しない場合は LookupError を送出する
+    """
+    cached = _load(profile_id)
+    if cached is None:
+        raise LookupError(f"認証情報プロファイルが見つかりません: ID={profile_id}")
+    return cached[1]
+
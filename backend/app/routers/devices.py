@@ -1,23 +1,205 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import io
+import json
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from ..models import (
-    Device, DeviceResponse, NewDeviceRequest, NewDeviceResponse, 
-    NewDeviceResponseData, UpdateDeviceRequest, UpdateDeviceResponse
+    BatchDeviceRequest, BatchDeviceResponse, Device, DeviceResponse, ImportDevicesResponse,
+    ImportDevicesResponseData, NewDeviceRequest, NewDeviceResponse, NewDeviceResponseData,
+    ProvisioningAttemptData, ProvisioningAttemptsResponse, ProvisioningJobData, ProvisioningJobResponse,
+    RequeueDevicesRequest, UpdateDeviceRequest, UpdateDeviceResponse
 )
 from ..database import (
-    get_all_devices, create_new_device_with_configuration, 
-    get_device_by_id, update_device
+    DEVICE_FIELDS, DEVICE_STATUSES, get_change_cursor_async, get_device_by_id_async,
+    get_provisioning_attempts_async, query_device_rows_async, query_device_rows_since_async, update_device_async
 )
+from ..dpp_uri import DppUri, DppUriError, normalize_mac_prefix, parse_device_fields, parse_dpp_uri
+from ..events import device_events
+from ..profiles import get_profile
+from ..jobs import enqueue_new_device, enqueue_new_devices, get_job, requeue_dead_letter_devices
+from ..serialization import encode_device_list
+from ..transfer import EXPORT_FORMATS, AsyncByteStreamReader, export_devices, import_device_stream
 
 router = APIRouter(prefix="/api/devices", tags=["devices"])
 
+# 一括登録で受け付ける最大デバイス数
+MAX_BATCH_SIZE = 500
+
+# 一覧取得の1ページあたりの最大件数
+MAX_PAGE_SIZE = 1000
+
+# 一覧取得で指定できる応答形式（fast: Deviceモデルを経由せずDBの行から直接JSONにする）
+LIST_FORMATS = ("fast",)
+
+# SSE接続を維持するためのコメント送信間隔（秒）
+SSE_KEEPALIVE_INTERVAL = 15
+
+def _validation_error(message: str, error_code: str = "VALIDATION_ERROR") -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail={
+            "success": False,
+            "error": message,
+            "error_code": error_code
+        }
+    )
+
+
+def _parse_qr_code(uri: Optional[str], mac_address: str, channel: str, key: str, prefix: str = "") -> DppUri:
+    """
+    QRコードの内容（DPP URI、または個別のMACアドレス・チャンネル・キー）を検証する
+    不正なQRコードはhostapdに送る前にここで拒否する
+    """
+    if not uri and (not mac_address or not channel or not key):
+        raise _validation_error(f"{prefix}MACアドレス、チャンネル、キーは必須です（QRコードから取得）")
+    try:
+        return parse_dpp_uri(uri) if uri else parse_device_fields(mac_address, channel, key)
+    except DppUriError as e:
+        raise _validation_error(f"{prefix}{str(e)}", "INVALID_QR_CODE")
+
+
+async def _resolve_credentials(ssid: str, password: str, profile_id: Optional[int]) -> dict:
+    """
+    Wi-Fi設定（認証情報プロファイル、または個別のSSID・パスワード）を検証する
+    プロファイルを使用するデバイスにはパスワードを保存せず、profile_id で参照する
+    """
+    if profile_id is None:
+        if not ssid or not password:
+            raise _validation_error("SSID とパスワード、または認証情報プロファイルは必須です")
+        return {"ssid": ssid, "password": password, "profile_id": None}
+    profile = await run_in_threadpool(get_profile, profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "success": False,
+                "error": f"認証情報プロファイルが見つかりません: ID={profile_id}",
+                "error_code": "PROFILE_NOT_FOUND"
+            }
+        )
+    return {"ssid": profile['ssid'], "password": None, "profile_id": profile_id}
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[list]:
+    """カンマ区切りのフィールド指定を検証してリストにする"""
+    if not fields:
+        return None
+    field_list = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown_fields = [field for field in field_list if field not in DEVICE_FIELDS]
+    if unknown_fields:
+        raise _validation_error(
+            f"無効なフィールドです: {', '.join(unknown_fields)}。有効な値: {', '.join(DEVICE_FIELDS)}",
+            "INVALID_FIELDS"
+        )
+    return field_list
+
+
+def _parse_created_at(name: str, value: Optional[str]) -> Optional[str]:
+    """created_from / created_before を検証し、保存されている created_at（ローカル時刻のISO 8601）と比較できる形式にする"""
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise _validation_error(f"{name}はISO 8601形式の日時で指定してください: {value}", "INVALID_DATE")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
+
+
+def _device_list_response(
+    format: Optional[str],
+    field_list: Optional[List[str]],
+    columns: List[str],
+    rows: List[tuple],
+    next_cursor: Optional[str] = None,
+    next_since: Optional[str] = None
+):
+    """
+    既定ではDeviceResponse（Deviceモデル）で検証して返す
+    format=fast、またはfieldsでフィールドを限定した場合（Deviceの必須フィールドを含まない）は行から直接JSONにする
+    """
+    if format == "fast" or field_list is not None:
+        body = encode_device_list(columns, rows, next_cursor=next_cursor, next_since=next_since)
+        return Response(body, media_type="application/json")
+    return DeviceResponse(
+        success=True,
+        data=[dict(zip(columns, row)) for row in rows],
+        next_cursor=next_cursor,
+        next_since=next_since
+    )
+
 
 @router.get("", response_model=DeviceResponse)
-async def get_devices():
-    """デバイス一覧取得"""
+async def get_devices(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    room: Optional[str] = None,
+    ssid: Optional[str] = None,
+    mac_prefix: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_before: Optional[str] = None,
+    fields: Optional[str] = None,
+    since: Optional[str] = None,
+    format: Optional[str] = None
+):
+    """デバイス一覧取得
+    limitを指定するとページ単位で返し、次ページは next_cursor を cursor に指定して取得する
+    fieldsにカンマ区切りでフィールド名を指定すると、そのフィールドのみ返す
+    sinceに前回の next_since を指定すると、それ以降に作成・更新されたデバイスのみ返す（絞り込み・cursorとは併用できない）
+    format=fast を指定すると、Deviceモデルによる検証を行わずDBの行から直接JSONにする（件数の多い一覧で速い）"""
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise _validation_error(f"limitは1以上{MAX_PAGE_SIZE}以下で指定してください")
+    if format is not None and format not in LIST_FORMATS:
+        raise _validation_error(f"無効な形式です。有効な値: {', '.join(LIST_FORMATS)}", "INVALID_FORMAT")
+
+    if mac_prefix is not None:
+        # 保存されているMACアドレスと同じ区切り文字なしの小文字16進にしてから前方一致検索する
+        try:
+            mac_prefix = normalize_mac_prefix(mac_prefix)
+        except DppUriError:
+            raise _validation_error("mac_prefixには16進数と区切り文字（: - .）のみ指定できます")
+
+    created_from = _parse_created_at("created_from", created_from)
+    created_before = _parse_created_at("created_before", created_before)
+    field_list = _parse_fields(fields)
+
+    if since is not None:
+        # 差分取得は絞り込めない（条件から外れたデバイスの変更を通知できないため）
+        filters = {
+            "cursor": cursor, "status": status, "room": room, "ssid": ssid, "mac_prefix": mac_prefix,
+            "created_from": created_from, "created_before": created_before
+        }
+        combined = [name for name, value in filters.items() if value is not None]
+        if combined:
+            raise _validation_error(f"sinceと同時に指定できません: {', '.join(combined)}", "INVALID_PARAMETERS")
+
     try:
-        devices_data = get_all_devices()
-        devices = [Device(**device) for device in devices_data]
-        return DeviceResponse(success=True, data=devices)
+        if since is not None:
+            columns, rows, next_since = await query_device_rows_since_async(since, limit=limit, fields=field_list)
+            return _device_list_response(format, field_list, columns, rows, next_since=next_since)
+
+        # 一覧取得より前の時点を基準にし、取得中の更新は次回の差分取得に含める
+        next_since = await get_change_cursor_async()
+        columns, rows, next_cursor = await query_device_rows_async(
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            room=room,
+            ssid=ssid,
+            mac_prefix=mac_prefix,
+            created_from=created_from,
+            created_before=created_before,
+            fields=field_list
+        )
+        return _device_list_response(format, field_list, columns, rows, next_cursor=next_cursor, next_since=next_since)
+    except ValueError as e:
+        raise _validation_error(f"無効なカーソルです: {str(e)}", "INVALID_CURSOR")
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -29,55 +211,77 @@ async def get_devices():
         )
 
 
-@router.post("/new", response_model=NewDeviceResponse)
+@router.get("/export")
+async def export_devices_endpoint(format: str = "ndjson", fields: Optional[str] = None, status: Optional[str] = None):
+    """デバイス一覧をNDJSONまたはCSVでストリーミング出力（全件をメモリに載せずに順次送信する）"""
+    if format not in EXPORT_FORMATS:
+        raise _validation_error(f"無効な形式です。有効な値: {', '.join(EXPORT_FORMATS)}", "INVALID_FORMAT")
+    field_list = _parse_fields(fields)
+
+    return StreamingResponse(
+        export_devices(format, field_list, status),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="devices.{format}"'}
+    )
+
+
+@router.post("/import", response_model=ImportDevicesResponse)
+async def import_devices_endpoint(request: Request, format: Optional[str] = None):
+    """NDJSONまたはCSVのデバイス一覧を取り込む（同じMACアドレスとキーのデバイスは上書き）
+    formatを省略した場合はContent-Typeから判定する"""
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "csv" if content_type.startswith("text/csv") else "ndjson"
+    if format not in EXPORT_FORMATS:
+        raise _validation_error(f"無効な形式です。有効な値: {', '.join(EXPORT_FORMATS)}", "INVALID_FORMAT")
+
+    def run_import():
+        stream = io.BufferedReader(AsyncByteStreamReader(request.stream()))
+        return import_device_stream(stream, format)
+
+    try:
+        result = await run_in_threadpool(run_import)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise _validation_error(f"インポートできません: {str(e)}", "INVALID_IMPORT")
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "success": False,
+                "error": f"デバイスのインポート中にエラーが発生しました: {str(e)}",
+                "error_code": "INTERNAL_SERVER_ERROR"
+            }
+        )
+    return ImportDevicesResponse(success=True, data=ImportDevicesResponseData(**result))
+
+
+@router.post("/new", response_model=NewDeviceResponse, status_code=202)
 async def create_new_device(device_request: NewDeviceRequest):
-    """新規デバイス登録・設定（QRコードスキャン専用 - 最小限の情報）"""
+    """新規デバイス登録・設定（QRコードスキャン専用 - 最小限の情報）
+    デバイスを"configuring"で登録してプロビジョニングジョブを投入し、完了を待たずに応答する"""
     try:
         # QRコードから取得される必須データの検証
-        if not device_request.mac_address:
-            raise HTTPException(
-                status_code=400,
-                detail={
-                    "success": False,
-                    "error": "MACアドレスは必須です（QRコードから取得）",
-                    "error_code": "VALIDATION_ERROR"
-                }
-            )
-        
-        if not device_request.channel or not device_request.key:
-            raise HTTPException(
-                status_code=400,
-                detail={
-                    "success": False,
-                    "error": "チャンネルとキーは必須です（QRコードから取得）",
-                    "error_code": "VALIDATION_ERROR"
-                }
-            )
-        
+        qr_code = _parse_qr_code(
+            device_request.uri, device_request.mac_address, device_request.channel, device_request.key
+        )
+
         # WiFi設定の検証
-        if not device_request.ssid or not device_request.password:
-            raise HTTPException(
-                status_code=400,
-                detail={
-                    "success": False,
-                    "error": "SSID とパスワードは必須です",
-                    "error_code": "VALIDATION_ERROR"
-                }
-            )
+        credentials = await _resolve_credentials(
+            device_request.ssid, device_request.password, device_request.profile_id
+        )
         device_data = {
-            "mac_address": device_request.mac_address,
-            "channel": device_request.channel,
-            "key": device_request.key,
-            "ssid": device_request.ssid,
-            "password": device_request.password,
+            "mac_address": qr_code.mac_address,
+            "channel": qr_code.channel,
+            "key": qr_code.key,
+            **credentials,
             "name": None,
-            "room": None,
+            "room": device_request.room or None,
             "desc": None
         }
         
-        device_id, status_message = create_new_device_with_configuration(device_data)
+        job = await run_in_threadpool(enqueue_new_device, device_data)
         
-        created_device = get_device_by_id(device_id)
+        created_device = await get_device_by_id_async(job.device_id)
         if not created_device:
             raise HTTPException(
                 status_code=500,
@@ -89,11 +293,12 @@ async def create_new_device(device_request: NewDeviceRequest):
             )
         
         response_data = NewDeviceResponseData(
-            id=device_id,
-            mac_address=device_request.mac_address,
+            id=job.device_id,
+            mac_address=qr_code.mac_address,
             status=created_device["status"],
-            message=status_message,
-            date=created_device["date"]
+            message=job.message,
+            date=created_device["date"],
+            job_id=job.job_id
         )
         
         return NewDeviceResponse(success=True, data=response_data)
@@ -111,22 +316,168 @@ async def create_new_device(device_request: NewDeviceRequest):
         )
 
 
-@router.put("/{device_id}", response_model=UpdateDeviceResponse)
-async def update_device_endpoint(device_id: int, update_request: UpdateDeviceRequest):
-    """デバイス情報更新"""
+@router.get("/events")
+async def stream_device_events():
+    """デバイスの作成・ステータス変更をServer-Sent Eventsで配信"""
+    queue = device_events.subscribe()
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            device_events.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _job_device_status(job) -> str:
+    """ジョブの状態に対応するデバイスのステータス"""
+    if job.status == "completed":
+        return "configured"
+    if job.status == "failed":
+        return "dead_letter"
+    return "configuring"
+
+
+@router.post("/batch", response_model=BatchDeviceResponse, status_code=202)
+async def create_new_devices_batch(batch_request: BatchDeviceRequest):
+    """複数デバイスの一括登録・設定（同一のSSID/パスワード、または認証情報プロファイルを使用）"""
     try:
-        # デバイスの存在確認
-        existing_device = get_device_by_id(device_id)
-        if not existing_device:
+        if not batch_request.devices or len(batch_request.devices) > MAX_BATCH_SIZE:
             raise HTTPException(
-                status_code=404,
+                status_code=400,
                 detail={
                     "success": False,
-                    "error": "指定されたデバイスが見つかりません",
-                    "error_code": "DEVICE_NOT_FOUND"
+                    "error": f"デバイスは1件以上{MAX_BATCH_SIZE}件以下で指定してください",
+                    "error_code": "VALIDATION_ERROR"
                 }
             )
-        
+
+        credentials = await _resolve_credentials(batch_request.ssid, batch_request.password, batch_request.profile_id)
+        devices_data = []
+        for index, entry in enumerate(batch_request.devices):
+            qr_code = _parse_qr_code(entry.uri, entry.mac_address, entry.channel, entry.key, f"{index + 1}件目: ")
+            devices_data.append({
+                "mac_address": qr_code.mac_address,
+                "channel": qr_code.channel,
+                "key": qr_code.key,
+                **credentials,
+                "name": None,
+                "room": entry.room or batch_request.room or None,
+                "desc": None
+            })
+
+        # QRコードの一括登録でhostapdとの通信が発生するためスレッドプールで実行する
+        jobs = await run_in_threadpool(enqueue_new_devices, devices_data)
+
+        results = [
+            NewDeviceResponseData(
+                id=job.device_id,
+                mac_address=job.device_data["mac_address"],
+                status=_job_device_status(job),
+                message=job.message,
+                date=job.device_data["date"],
+                job_id=job.job_id
+            )
+            for job in jobs
+        ]
+        return BatchDeviceResponse(success=True, data=results)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "success": False,
+                "error": f"デバイスの一括設定中にエラーが発生しました: {str(e)}",
+                "error_code": "CONFIGURATION_FAILED"
+            }
+        )
+
+
+@router.post("/requeue", response_model=BatchDeviceResponse, status_code=202)
+async def requeue_dead_letter(requeue_request: RequeueDevicesRequest):
+    """再試行上限に達した（"dead_letter"の）デバイスを一括でプロビジョニングし直す"""
+    device_ids = requeue_request.device_ids
+    if device_ids is not None and len(device_ids) > MAX_BATCH_SIZE:
+        raise _validation_error(f"デバイスは{MAX_BATCH_SIZE}件以下で指定してください")
+
+    try:
+        jobs = await run_in_threadpool(requeue_dead_letter_devices, device_ids, MAX_BATCH_SIZE)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "success": False,
+                "error": f"デバイスの再投入中にエラーが発生しました: {str(e)}",
+                "error_code": "INTERNAL_SERVER_ERROR"
+            }
+        )
+
+    results = [
+        NewDeviceResponseData(
+            id=job.device_id,
+            mac_address=job.device_data["mac_address"],
+            status=_job_device_status(job),
+            message=job.message,
+            date=job.device_data["date"],
+            job_id=job.job_id
+        )
+        for job in jobs
+    ]
+    return BatchDeviceResponse(success=True, data=results)
+
+
+@router.get("/jobs/{job_id}", response_model=ProvisioningJobResponse)
+async def get_provisioning_job(job_id: str):
+    """プロビジョニングジョブの状態取得"""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "success": False,
+                "error": "指定されたジョブが見つかりません",
+                "error_code": "JOB_NOT_FOUND"
+            }
+        )
+    return ProvisioningJobResponse(success=True, data=ProvisioningJobData(**job.to_dict()))
+
+
+@router.get("/{device_id}/attempts", response_model=ProvisioningAttemptsResponse)
+async def get_device_attempts(device_id: int):
+    """デバイスのプロビジョニング試行履歴取得"""
+    if not await get_device_by_id_async(device_id):
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "success": False,
+                "error": "指定されたデバイスが見つかりません",
+                "error_code": "DEVICE_NOT_FOUND"
+            }
+        )
+    attempts = await get_provisioning_attempts_async(device_id)
+    return ProvisioningAttemptsResponse(
+        success=True, data=[ProvisioningAttemptData(**attempt) for attempt in attempts]
+    )
+
+
+@router.put("/{device_id}", response_model=UpdateDeviceResponse)
+async def update_device_endpoint(device_id: int, update_request: UpdateDeviceRequest):
+    """デバイス情報更新"""
+    try:
         # 更新データの準備（Noneでない値のみ）
         update_data = {}
         for field, value in update_request.dict().items():
@@ -145,32 +496,29 @@ async def update_device_endpoint(device_id: int, update_request: UpdateDeviceReq
         
         # statusの値の検証
         if 'status' in update_data:
-            valid_statuses = ['scanned', 'configuring', 'configured', 'error']
-            if update_data['status'] not in valid_statuses:
+            if update_data['status'] not in DEVICE_STATUSES:
                 raise HTTPException(
                     status_code=400,
                     detail={
                         "success": False,
-                        "error": f"無効なステータスです。有効な値: {', '.join(valid_statuses)}",
+                        "error": f"無効なステータスです。有効な値: {', '.join(DEVICE_STATUSES)}",
                         "error_code": "INVALID_STATUS"
                     }
                 )
         
-        # デバイス情報の更新
-        update_success = update_device(device_id, update_data)
+        # デバイス情報の更新（更新後のデバイスをUPDATE文のRETURNINGで受け取り、該当行が無ければNone）
+        updated_device = await update_device_async(device_id, update_data)
         
-        if not update_success:
+        if not updated_device:
             raise HTTPException(
-                status_code=500,
+                status_code=404,
                 detail={
                     "success": False,
-                    "error": "デバイス情報の更新に失敗しました",
-                    "error_code": "UPDATE_FAILED"
+                    "error": "指定されたデバイスが見つかりません",
+                    "error_code": "DEVICE_NOT_FOUND"
                 }
             )
         
-        # 更新後のデバイス情報を取得
-        updated_device = get_device_by_id(device_id)
         device = Device(**updated_device)
         
         return UpdateDeviceResponse(
@@ -0,0 +1,71 @@
+import sqlite3
+
+from fastapi import APIRouter, HTTPException
+from ..models import CredentialProfile, CredentialProfileRequest, CredentialProfileResponse, CredentialProfilesResponse
+from ..database import CREDENTIAL_AKMS, create_credential_profile_async, list_credential_profiles_async
+
+router = APIRouter(prefix="/api/profiles", tags=["profiles"])
+
+
+def _validation_error(message: str, error_code: str = "VALIDATION_ERROR") -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail={
+            "success": False,
+            "error": message,
+            "error_code": error_code
+        }
+    )
+
+
+@router.get("", response_model=CredentialProfilesResponse)
+async def get_profiles():
+    """認証情報プロファイル一覧（パスワードは含まない）"""
+    try:
+        profiles = await list_credential_profiles_async()
+        return CredentialProfilesResponse(
+            success=True, data=[CredentialProfile(**profile) for profile in profiles]
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "success": False,
+                "error": f"プロファイル取得エラー: {str(e)}",
+                "error_code": "DATABASE_ERROR"
+            }
+        )
+
+
+@router.post("", response_model=CredentialProfileResponse, status_code=201)
+async def create_profile(profile_request: CredentialProfileRequest):
+    """
+    認証情報プロファイルを作成
+    プロファイルは作成後に変更できない（認証情報を変える場合は新しいプロファイルを作成する）
+    """
+    if not profile_request.name or not profile_request.ssid or not profile_request.password:
+        raise _validation_error("名前、SSID、パスワードは必須です")
+    if profile_request.akm not in CREDENTIAL_AKMS:
+        raise _validation_error(f"無効なAKMです。有効な値: {', '.join(CREDENTIAL_AKMS)}")
+
+    try:
+        profile = await create_credential_profile_async(profile_request.dict())
+    except sqlite3.IntegrityError:
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "success": False,
+                "error": f"同じ名前のプロファイルが既に存在します: {profile_request.name}",
+                "error_code": "PROFILE_EXISTS"
+            }
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "success": False,
+                "error": f"プロファイル作成エラー: {str(e)}",
+                "error_code": "DATABASE_ERROR"
+            }
+        )
+    return CredentialProfileResponse(success=True, data=CredentialProfile(**profile))
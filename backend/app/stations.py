@@ -0,0 +1,188 @@
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from . import metrics
+from .config import settings
+from .database import PROVISIONED_STATUSES, apply_station_status, encode_cursor, query_devices_since
+from .hostapd import provisioning_cli
+
+logger = logging.getLogger(__name__)
+
+# 変更されたデバイスを差分取得する際の1回あたりの件数
+_INDEX_PAGE_SIZE = 5000
+
+_SYNC_SECONDS = metrics.histogram(
+    "qrdia_station_sync_duration_seconds", "ステーション一覧の取得からステータス反映までの時間"
+)
+_TRANSITIONS = metrics.counter(
+    "qrdia_station_transitions", "ステーション一覧との照合で変更したデバイスのステータス", ["status"]
+)
+
+
+def normalize_mac(mac: str) -> str:
+    """MACアドレスを小文字のコロン区切り（aa:bb:cc:dd:ee:ff）に揃える"""
+    digits = mac.strip().lower().replace(':', '').replace('-', '').replace('.', '')
+    if len(digits) != 12:
+        return mac.strip().lower()
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+class _TrackedDevice:
+    __slots__ = ('mac', 'status', 'last_seen')
+
+    def __init__(self, mac: str, status: str, last_seen: Optional[str]):
+        self.mac = mac
+        self.status = status
+        # 最後にステーション一覧で確認した日時（onlineの間は照合N回ごとにだけDBに書き込む）
+        self.last_seen = last_seen
+
+
+class StationReconciler:
+    """
+    hostapdのステーション一覧（STA-FIRST / STA-NEXT）を定期的に取得し、
+    プロビジョニング済みのデバイスの接続状態を "online" / "offline" として反映する
+    デバイスはMACアドレスのメモリ上の索引で照合し、変化したデバイスだけをまとめて更新する
+    """
+
+    def __init__(self, interfaces: List[str], interval: float, last_seen_write_every: int = 10):
+        self.interfaces = interfaces
+        self.interval = interval
+        self.last_seen_write_every = last_seen_write_every
+        self._syncs = 0
+        # デバイスID -> 照合対象のデバイス（プロビジョニング済みのもののみ）
+        self._devices: Dict[int, _TrackedDevice] = {}
+        # 索引に反映済みの変更を指す差分取得用カーソル
+        self._since = encode_cursor('', 0)
+        self._clients: Dict[str, object] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="station-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            client.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync_once()
+            except Exception as e:
+                logger.error(f"ステーション照合中にエラーが発生しました: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def sync_once(self) -> int:
+        """1回分の照合を行い、ステータスを変更したデバイス数を返す"""
+        with _SYNC_SECONDS.time():
+            self._refresh_index()
+            stations, complete = self._collect_stations()
+            now = datetime.now().isoformat()
+            self._syncs += 1
+            write_last_seen = self.last_seen_write_every > 0 and self._syncs % self.last_seen_write_every == 0
+
+            changes: List[Tuple[int, str, str]] = []
+            # ステータスは変わらず last_seen だけを書き込むonlineのデバイス
+            seen: List[Tuple[int, str, str]] = []
+            for device_id, device in self._devices.items():
+                if device.mac in stations:
+                    if device.status != 'online':
+                        changes.append((device_id, 'online', now))
+                    elif write_last_seen:
+                        seen.append((device_id, 'online', now))
+                    device.last_seen = now
+                elif complete and device.status != 'offline':
+                    # 一度も接続を確認していないデバイスは last_seen を空のままにする
+                    changes.append((device_id, 'offline', device.last_seen))
+
+            if not changes and not seen:
+                return 0
+            # last_seen の書き込みもステータスの変更と同じexecutemanyにまとめる
+            apply_station_status(changes + seen)
+            if not changes:
+                return 0
+            for device_id, status, _ in changes:
+                self._devices[device_id].status = status
+                _TRANSITIONS.labels(status=status).inc()
+            online = sum(1 for _, status, _ in changes if status == 'online')
+            logger.info(f"ステーション照合: online={online}件, offline={len(changes) - online}件")
+            return len(changes)
+
+    def _refresh_index(self):
+        """前回以降に作成・更新されたデバイスだけを読み込んで索引を更新する"""
+        fields = ['id', 'mac_address', 'status', 'last_seen']
+        while True:
+            rows, self._since = query_devices_since(self._since, limit=_INDEX_PAGE_SIZE, fields=fields)
+            for row in rows:
+                if row['status'] in PROVISIONED_STATUSES:
+                    device = self._devices.get(row['id'])
+                    if device is None:
+                        self._devices[row['id']] = _TrackedDevice(
+                            normalize_mac(row['mac_address']), row['status'], row['last_seen']
+                        )
+                    else:
+                        device.status = row['status']
+                        device.mac = normalize_mac(row['mac_address'])
+                else:
+                    self._devices.pop(row['id'], None)
+            if len(rows) < _INDEX_PAGE_SIZE:
+                return
+
+    def _collect_stations(self) -> Tuple[Set[str], bool]:
+        """
+        全インターフェースの接続中ステーションのMACアドレスを取得
+        Returns: (MACアドレスの集合, 全インターフェースから取得できたか)
+        """
+        stations: Set[str] = set()
+        complete = True
+        for interface in self.interfaces:
+            try:
+                for mac, _ in self._client(interface).iter_stations():
+                    stations.add(normalize_mac(mac))
+            except (OSError, TimeoutError) as e:
+                # 取得できなかったインターフェースに接続しているデバイスを誤ってofflineにしない
+                logger.warning(f"ステーション一覧を取得できませんでした: interface={interface}, {str(e)}")
+                complete = False
+        return stations, complete
+
+    def _client(self, interface: str):
+        """インターフェースごとに1本の制御ソケットを使い続ける"""
+        client = self._clients.get(interface)
+        if client is None:
+            client = provisioning_cli().HostapdClient(
+                interface, socket_dir=settings.hostapd_socket_dir, max_connections=1
+            )
+            self._clients[interface] = client
+        return client
+
+
+_reconciler: Optional[StationReconciler] = None
+
+
+def start_station_reconciler():
+    """ステーション照合を開始（STATION_SYNC_INTERVAL=0 の場合は起動しない）"""
+    global _reconciler
+    # エージェント経由で設定したデバイスはローカルのステーション一覧に現れず、誤ってofflineになるため照合しない
+    if settings.station_sync_interval <= 0 or settings.provisioning_agents or _reconciler is not None:
+        return
+    _reconciler = StationReconciler(
+        settings.provisioning_interfaces, settings.station_sync_interval, settings.station_last_seen_write_every
+    )
+    _reconciler.start()
+
+
+def stop_station_reconciler():
+    """ステーション照合を停止"""
+    global _reconciler
+    reconciler, _reconciler = _reconciler, None
+    if reconciler is not None:
+        reconciler.stop()
@@ -0,0 +1,38 @@
+import contextvars
+import logging
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# 処理中のプロビジョニングジョブを識別するID（ログとCLI呼び出しに付与する）
+_correlation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("correlation_id", default=None)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(correlation_id)s] %(message)s"
+
+
+def current_correlation_id() -> Optional[str]:
+    return _correlation_id.get()
+
+
+@contextmanager
+def correlation_scope(correlation_id: Optional[str]) -> Iterator[None]:
+    """このブロック内のログに correlation_id を付与する（スレッドをまたぐ場合は呼び出し先で再設定する）"""
+    token = _correlation_id.set(correlation_id)
+    try:
+        yield
+    finally:
+        _correlation_id.reset(token)
+
+
+def install_log_record_factory():
+    """全てのログレコードに correlation_id 属性を追加する（未設定時は "-"）"""
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "_with_correlation_id", False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.correlation_id = _correlation_id.get() or "-"
+        return record
+
+    record_factory._with_correlation_id = True
+    logging.setLogRecordFactory(record_factory)
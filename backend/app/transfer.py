@@ -0,0 +1,187 @@
+import csv
+import io
+import json
+import logging
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence
+
+from anyio import from_thread
+
+from .database import DEVICE_FIELDS, DEVICE_STATUSES, import_devices, iter_devices
+from .dpp_uri import DppUriError, decode_bootstrap_key, parse_channel_list, parse_mac
+from .events import device_events
+from .profiles import get_profile
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# エクスポートで1回に読み出す行数
+EXPORT_CHUNK_SIZE = 1000
+
+# インポートで1回のexecutemanyにまとめる行数
+IMPORT_CHUNK_SIZE = 1000
+
+# インポート結果に含めるエラーの最大件数
+_MAX_IMPORT_ERRORS = 100
+
+# インポートでは id は無視し、(mac_address, key) で既存のデバイスと照合する
+# last_seen はステーション一覧との照合で更新するため取り込まない
+_IMPORT_FIELDS = [field for field in DEVICE_FIELDS if field not in ('id', 'last_seen')]
+_REQUIRED_FIELDS = ['mac_address', 'channel', 'key']
+# プロビジョニング中を示すステータス（取り込んでも処理するジョブが無く、そのまま残ってしまう）
+_UNIMPORTABLE_STATUSES = ('configuring',)
+
+
+def export_devices(
+    export_format: str, fields: Optional[Sequence[str]] = None, status: Optional[str] = None
+) -> Iterator[str]:
+    """デバイスをNDJSONまたはCSVの文字列として少しずつ返す"""
+    columns = list(fields) if fields else DEVICE_FIELDS
+    rows = iter_devices(columns, status=status, chunk_size=EXPORT_CHUNK_SIZE)
+
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for chunk in rows:
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+        return
+
+    for chunk in rows:
+        yield ''.join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in chunk
+        )
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.errors: List[str] = []
+
+    def reject(self, line: int, message: str):
+        self.skipped += 1
+        if len(self.errors) < _MAX_IMPORT_ERRORS:
+            self.errors.append(f"{line}行目: {message}")
+
+    def to_dict(self) -> Dict:
+        return {"imported": self.imported, "skipped": self.skipped, "errors": self.errors}
+
+
+def _read_ndjson(stream: io.TextIOBase, result: ImportResult) -> Iterator[tuple]:
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            result.reject(line_number, f"JSONとして解析できません: {str(e)}")
+            continue
+        if not isinstance(record, dict):
+            result.reject(line_number, "オブジェクトではありません")
+            continue
+        yield line_number, record
+
+
+def _read_csv(stream: io.TextIOBase, result: ImportResult) -> Iterator[tuple]:
+    reader = csv.DictReader(stream)
+    unknown_fields = [field for field in reader.fieldnames or [] if field not in DEVICE_FIELDS]
+    if unknown_fields:
+        raise ValueError(f"無効な列です: {', '.join(unknown_fields)}")
+    for record in reader:
+        # 空欄は未設定として扱う
+        yield reader.line_num, {field: value for field, value in record.items() if value != ''}
+
+
+def _validate(record: Dict) -> Optional[str]:
+    """
+    行を検証し、MACアドレスとチャンネルをQRコードの登録と同じ形式に揃える
+    （スキャンで登録済みのデバイスと (mac_address, key) で照合できるようにする）
+    """
+    missing = [field for field in _REQUIRED_FIELDS if not record.get(field)]
+    if missing:
+        return f"必須項目がありません: {', '.join(missing)}"
+    try:
+        record['mac_address'] = parse_mac(str(record['mac_address']))
+        record['channel'] = parse_channel_list(str(record['channel']))
+        decode_bootstrap_key(str(record['key']))
+    except DppUriError as e:
+        return str(e)
+    status = record.get('status')
+    if status is not None and status not in DEVICE_STATUSES:
+        return f"無効なステータスです: {status}"
+    if status in _UNIMPORTABLE_STATUSES:
+        return f"取り込めないステータスです: {status}"
+    profile_id = record.get('profile_id')
+    if profile_id is not None:
+        try:
+            record['profile_id'] = int(profile_id)
+        except (TypeError, ValueError):
+            return f"無効なprofile_idです: {profile_id}"
+        if get_profile(record['profile_id']) is None:
+            return f"認証情報プロファイルが見つかりません: ID={profile_id}"
+    return None
+
+
+def import_device_stream(stream: BinaryIO, import_format: str) -> Dict:
+    """
+    NDJSONまたはCSVのストリームからデバイスを取り込む
+    IMPORT_CHUNK_SIZE件ごとにまとめて書き込むため、ファイル全体をメモリに読み込まない
+    不正な行は読み飛ばし、行番号付きのエラーとして返す
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    result = ImportResult()
+    records = _read_csv(text, result) if import_format == "csv" else _read_ndjson(text, result)
+
+    chunk: List[Dict] = []
+    for line_number, record in records:
+        error = _validate(record)
+        if error is not None:
+            result.reject(line_number, error)
+            continue
+        chunk.append({field: record.get(field) for field in _IMPORT_FIELDS if field in record})
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            result.imported += import_devices(chunk)
+            chunk = []
+    if chunk:
+        result.imported += import_devices(chunk)
+
+    if result.imported:
+        # 個別の作成・更新イベントは送らず、購読者に再取得を促す
+        device_events.publish({"event": "resync"})
+    logger.info(f"デバイスのインポート完了: {result.imported}件（スキップ {result.skipped}件）")
+    return result.to_dict()
+
+
+class AsyncByteStreamReader(io.RawIOBase):
+    """
+    リクエストボディの非同期イテレータをワーカースレッドから同期的に読み出すファイルオブジェクト
+    （run_in_threadpool で実行した関数の中で使用する）
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks.__aiter__()
+        self._buffer = b''
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer and not self._eof:
+            try:
+                self._buffer = from_thread.run(self._chunks.__anext__)
+            except StopAsyncIteration:
+                self._eof = True
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
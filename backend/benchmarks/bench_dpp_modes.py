@@ -0,0 +1,74 @@
+"""
+デバイス1台あたりのDPPプロビジョニング時間を実行モード別に計測する
+
+    cd backend
+    python -m benchmarks.bench_dpp_modes --devices 50
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from app import database, dpp
+from app.config import settings
+
+from .fake_hostapd import FakeHostapd
+
+INTERFACE = "bench0"
+
+
+def run(mode: str, devices: int) -> list:
+    settings.dpp_mode = mode
+    dpp._configurators.clear()
+    conf_json = '{"wi-fi_tech": "infra", "discovery": {"ssid": "bench"}, "cred": {"akm": "psk", "pass": "password"}}'
+    timings = []
+    for i in range(devices):
+        device_data = {
+            "mac_address": f"02:00:00:00:{i // 256:02x}:{i % 256:02x}",
+            "channel": "81/1",
+            "key": "MDkwEwYHKoZIzj0CAQYIKoZIzj0DAQcDIgADbench",
+        }
+        start = time.perf_counter()
+        if not dpp._execute_dpp_provisioning(device_data, conf_json):
+            raise RuntimeError(f"プロビジョニングに失敗しました: mode={mode}")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(mode: str, timings: list):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(
+        f"{mode:<10} n={len(timings):<5} "
+        f"mean={statistics.mean(timings) * 1000:8.2f}ms "
+        f"p50={statistics.median(timings) * 1000:8.2f}ms "
+        f"p99={p99 * 1000:8.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DPP実行モード別のプロビジョニング時間計測")
+    parser.add_argument("--devices", type=int, default=20, help="計測するデバイス数")
+    parser.add_argument("--modes", default="inprocess,subprocess", help="計測するモード（カンマ区切り）")
+    args = parser.parse_args()
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as socket_dir:
+        database.DATABASE_FILE = os.path.join(socket_dir, "bench.db")
+        database.init_database()
+        settings.hostapd_socket_dir = socket_dir
+        settings.dpp_interface = INTERFACE
+        hostapd = FakeHostapd(socket_dir, INTERFACE)
+        hostapd.start()
+        try:
+            for mode in args.modes.split(","):
+                report(mode, run(mode, args.devices))
+        finally:
+            hostapd.stop()
+
+
+if __name__ == "__main__":
+    main()
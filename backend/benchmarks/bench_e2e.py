@@ -0,0 +1,225 @@
+"""
+疑似hostapdに対してFastAPIアプリ全体（POST /api/devices/new → ジョブキュー → DPP → DB更新）を
+一定の到着レートで動かし、スループット・応答時間・DBの競合状況を計測する
+
+    cd backend
+    python -m benchmarks.bench_e2e --rate 20 --duration 10 --interfaces 2 --exchange-time 0.05
+
+完了はSSE（GET /api/devices/events）でステータスが configured / dead_letter になった時点とする
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import re
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import uvicorn
+
+from app import database
+from app.config import settings
+
+from . import fake_hostapd
+
+FINAL_STATUSES = ("configured", "dead_letter")
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (\S+)$')
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def scrape(base_url: str) -> Dict[str, float]:
+    """/metrics のサンプルをラベルごとに合算して返す"""
+    with urllib.request.urlopen(f"{base_url}/metrics") as response:
+        text = response.read().decode()
+    samples: Dict[str, float] = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match:
+            name = match.group(1)
+            samples[name] = samples.get(name, 0.0) + float(match.group(3))
+    return samples
+
+
+def watch_events(connection: http.client.HTTPConnection, completed: Dict[int, tuple], ready: threading.Event):
+    """SSEを購読し、最終ステータスになった時刻をデバイスIDごとに記録する"""
+    connection.request("GET", "/api/devices/events")
+    response = connection.getresponse()
+    ready.set()
+    try:
+        for line in response:
+            if not line.startswith(b"data: "):
+                continue
+            event = json.loads(line[6:])
+            status = event.get("fields", {}).get("status")
+            if event.get("event") == "updated" and status in FINAL_STATUSES:
+                # POSTの応答より先に届くことがあるため、IDで後から突き合わせる
+                completed.setdefault(event["id"], (time.perf_counter(), status))
+    except (OSError, http.client.HTTPException):
+        # 計測終了時に接続を切断する
+        pass
+
+
+def post_device(base_url: str, index: int) -> tuple:
+    body = json.dumps({
+        "mac_address": f"02:30:{index // 16777216 % 256:02x}:{index // 65536 % 256:02x}:"
+                       f"{index // 256 % 256:02x}:{index % 256:02x}",
+        "channel": f"81/{1 + index % 3 * 5}",
+        "key": fake_hostapd.sample_bootstrap_key(index),
+        "ssid": "bench",
+        "password": "password",
+    }).encode()
+    request = urllib.request.Request(
+        f"{base_url}/api/devices/new", data=body, headers={"Content-Type": "application/json"}
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        device_id = json.loads(response.read())["data"]["id"]
+    return device_id, start, time.perf_counter() - start
+
+
+def drive(base_url: str, rate: float, duration: float, concurrency: int) -> list:
+    """rate件/秒の間隔でデバイス登録を送信する（応答を待たずに次を送る）"""
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        total = int(rate * duration)
+        for i in range(total):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(post_device, base_url, i))
+    return [future.result() for future in futures]
+
+
+def sample_queue_depth(base_url: str, stop: threading.Event, depths: list):
+    while not stop.wait(0.2):
+        depths.append(scrape(base_url).get("qrdia_db_write_queue_depth", 0.0))
+
+
+def report(args, posts: list, completed: Dict[int, tuple], elapsed: float, before: dict, after: dict,
+           depths: list, servers: list):
+    end_to_end = []
+    outcomes: Dict[str, int] = {}
+    for device_id, start, _ in posts:
+        if device_id in completed:
+            finished_at, status = completed[device_id]
+            end_to_end.append(finished_at - start)
+            outcomes[status] = outcomes.get(status, 0) + 1
+    post_latencies = [latency for _, _, latency in posts]
+
+    def delta(name: str) -> float:
+        return after.get(name, 0.0) - before.get(name, 0.0)
+
+    def mean_of(name: str) -> float:
+        count = delta(f"{name}_count")
+        return delta(f"{name}_sum") / count if count else 0.0
+
+    print(f"offered        {args.rate:.1f}/s x {args.duration:.0f}s = {len(posts)} devices "
+          f"on {args.interfaces} interface(s)")
+    print(f"completed      {len(end_to_end)} ({', '.join(f'{k}={v}' for k, v in sorted(outcomes.items()))}) "
+          f"in {elapsed:.2f}s -> {len(end_to_end) / elapsed:.1f}/s")
+    print(f"POST /new      p50={statistics.median(post_latencies) * 1000:8.2f}ms "
+          f"p99={percentile(post_latencies, 0.99) * 1000:8.2f}ms")
+    if end_to_end:
+        print(f"end-to-end     p50={statistics.median(end_to_end) * 1000:8.2f}ms "
+              f"p99={percentile(end_to_end, 0.99) * 1000:8.2f}ms")
+    print(f"db pool wait   mean={mean_of('qrdia_db_pool_wait_seconds') * 1000:8.3f}ms "
+          f"n={delta('qrdia_db_pool_wait_seconds_count'):.0f}")
+    print(f"db write       mean={mean_of('qrdia_db_write_duration_seconds') * 1000:8.3f}ms "
+          f"n={delta('qrdia_db_write_duration_seconds_count'):.0f}")
+    print(f"db commit      mean={mean_of('qrdia_db_commit_duration_seconds') * 1000:8.3f}ms "
+          f"batch={mean_of('qrdia_db_write_batch_size'):.2f} writes/commit")
+    if depths:
+        print(f"write queue    mean={statistics.mean(depths):.2f} max={max(depths):.0f}")
+    print(f"hostapd        exchanges={sum(s.exchanges for s in servers)} "
+          f"busy={sum(s.busy_rejections for s in servers)} commands={sum(s.commands for s in servers)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="疑似hostapdを使ったプロビジョニングのエンドツーエンド計測")
+    parser.add_argument("--rate", type=float, default=20.0, help="デバイス登録の到着レート（件/秒）")
+    parser.add_argument("--duration", type=float, default=10.0, help="登録を送信する時間（秒）")
+    parser.add_argument("--interfaces", type=int, default=1, help="疑似hostapdのインターフェース数")
+    parser.add_argument("--concurrency", type=int, default=32, help="登録リクエストを送るスレッド数")
+    parser.add_argument("--mode", default="inprocess", help="DPPの実行モード（inprocess / subprocess）")
+    parser.add_argument("--dpp-timeout", type=float, default=2.0, help="DPP結果イベントの待ち時間（秒）")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="送信後に完了を待つ最大時間（秒）")
+    parser.add_argument("--port", type=int, default=8766)
+    fake_hostapd.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as socket_dir:
+        interfaces = [f"bench{i}" for i in range(args.interfaces)]
+        database.DATABASE_FILE = os.path.join(socket_dir, "e2e.db")
+        settings.hostapd_socket_dir = socket_dir
+        settings.dpp_interfaces = interfaces
+        settings.dpp_mode = args.mode
+        settings.dpp_timeout = args.dpp_timeout
+        # 再試行の待ち時間で計測が間延びしないようにする
+        settings.dpp_retry_base_delay = 0.1
+        settings.dpp_retry_max_delay = 1.0
+        servers = [fake_hostapd.from_arguments(args, socket_dir, interface) for interface in interfaces]
+        for hostapd in servers:
+            hostapd.start()
+
+        from main import app
+
+        server = uvicorn.Server(uvicorn.Config(app, port=args.port, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+        base_url = f"http://127.0.0.1:{args.port}"
+        completed: Dict[int, tuple] = {}
+        ready = threading.Event()
+        events = http.client.HTTPConnection("127.0.0.1", args.port)
+        watcher = threading.Thread(target=watch_events, args=(events, completed, ready))
+        watcher.start()
+        ready.wait()
+        try:
+
+            before = scrape(base_url)
+            stop = threading.Event()
+            depths: list = []
+            sampler = threading.Thread(target=sample_queue_depth, args=(base_url, stop, depths))
+            sampler.start()
+
+            start = time.perf_counter()
+            posts = drive(base_url, args.rate, args.duration, args.concurrency)
+            deadline = time.perf_counter() + args.drain_timeout
+            ids = [device_id for device_id, _, _ in posts]
+            while time.perf_counter() < deadline and not all(device_id in completed for device_id in ids):
+                time.sleep(0.05)
+            elapsed = time.perf_counter() - start
+
+            stop.set()
+            sampler.join()
+            after = scrape(base_url)
+            report(args, posts, completed, elapsed, before, after, depths, servers)
+        finally:
+            # SSEの接続が残っているとサーバーが終了しないため、先に切断する
+            events.sock.shutdown(socket.SHUT_RDWR)
+            watcher.join()
+            events.close()
+            server.should_exit = True
+            thread.join()
+            for hostapd in servers:
+                hostapd.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+GET /api/devices の一覧の読み出しとJSON化を、Pydanticのモデルを経由する既定の方法と
+DBの行から直接JSONにする方法（format=fast、app.serialization）で比較する
+direct はorjson、direct(json) はorjsonが無い環境での標準のjsonによるフォールバックの計測
+
+    cd backend
+    python -m benchmarks.bench_list_serialization --rows 1000,10000,100000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app import database, serialization
+from app.models import DeviceResponse
+
+from .fake_hostapd import sample_bootstrap_key
+
+_RESPONSE_FIELD = create_model_field("response", DeviceResponse)
+
+
+def seed(count: int):
+    devices_data = [
+        {
+            "mac_address": f"02:40:00:{i // 65536 % 256:02x}:{i // 256 % 256:02x}:{i % 256:02x}",
+            "channel": "81/1",
+            "key": sample_bootstrap_key(i),
+            "name": f"device-{i}",
+            "ssid": "bench",
+            "password": "password",
+            "status": "configured",
+            "room": str(100 + i % 50),
+        }
+        for i in range(count)
+    ]
+    for start in range(0, count, 5000):
+        database.import_devices(devices_data[start:start + 5000])
+
+
+def model_path(limit: int) -> bytes:
+    """既定の方法: 行を辞書にし、FastAPIがresponse_modelで検証してからJSONにする"""
+    devices, next_cursor = database.query_devices(limit=limit)
+    response = DeviceResponse(success=True, data=devices, next_cursor=next_cursor)
+    content = asyncio.run(serialize_response(field=_RESPONSE_FIELD, response_content=response))
+    return JSONResponse(content).body
+
+
+def direct_path(limit: int) -> bytes:
+    """format=fast: DBの行（タプル）から直接JSONにする"""
+    columns, rows, next_cursor = database.query_device_rows(limit=limit)
+    return serialization.encode_device_list(columns, rows, next_cursor=next_cursor)
+
+
+def measure(fn, limit: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(limit)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="デバイス一覧のJSON化の方法別の所要時間計測")
+    parser.add_argument("--rows", default="1000,10000,100000", help="一覧の件数（カンマ区切り）")
+    parser.add_argument("--repeat", type=int, default=5, help="各計測の繰り返し回数（最短時間を表示）")
+    args = parser.parse_args()
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+    sizes = [int(size) for size in args.rows.split(",")]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database.DATABASE_FILE = os.path.join(temp_dir, "bench.db")
+        database.init_database()
+        seed(max(sizes))
+        orjson = serialization.orjson
+        try:
+            print(f"{'rows':>8} {'model':>10} {'direct':>10} {'direct(json)':>13} {'speedup':>8}")
+            for size in sizes:
+                if json.loads(model_path(size)) != json.loads(direct_path(size)):
+                    raise RuntimeError(f"出力が一致しません: rows={size}")
+                model = measure(model_path, size, args.repeat)
+                direct = measure(direct_path, size, args.repeat)
+                serialization.orjson = None
+                direct_json = measure(direct_path, size, args.repeat)
+                serialization.orjson = orjson
+                print(
+                    f"{size:>8} {model * 1000:>8.1f}ms {direct * 1000:>8.1f}ms {direct_json * 1000:>11.1f}ms "
+                    f"{model / direct:>7.1f}x"
+                )
+        finally:
+            serialization.orjson = orjson
+            database.close_database()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+ベンチマーク用の疑似hostapd制御ソケット
+DPP_CONFIGURATOR_ADD / DPP_CONFIGURATOR_GET_KEY / DPP_QR_CODE / DPP_AUTH_INIT / STA-FIRST / STA-NEXT に応答し、
+ATTACHしたソケットには DPP_AUTH_INIT 後に DPP-AUTH-SUCCESS / DPP-CONF-SENT などのイベントを送信する
+
+コマンドの応答遅延、DPP交換にかかる時間、失敗率を指定できる
+hostapdと同様に制御ソケットのコマンドは1つずつ処理し、DPP交換は同時に1つしか実行しない
+
+単体で起動してバックエンドから接続することもできる:
+
+    cd backend
+    python -m benchmarks.fake_hostapd --socket-dir /tmp/hostapd --interface test --exchange-time 0.5
+    HOSTAPD_SOCKET_DIR=/tmp/hostapd python main.py
+"""
+import argparse
+import base64
+import itertools
+import os
+import random
+import socket
+import threading
+import time
+from typing import List, Optional
+
+
+# prime256v1の圧縮形式の公開鍵（SubjectPublicKeyInfo）のうち、X座標より前の部分
+_BOOTSTRAP_KEY_PREFIX = bytes.fromhex("3039301306072a8648ce3d020106082a8648ce3d030107032200")
+
+
+def sample_bootstrap_key(index: int) -> str:
+    """ベンチマーク用のブートストラップ鍵（サーバー側の形式チェックを通る、番号ごとに異なる値）"""
+    point = bytes([2 + index % 2]) + index.to_bytes(32, 'big')
+    return base64.b64encode(_BOOTSTRAP_KEY_PREFIX + point).decode()
+
+
+class FakeHostapd:
+    def __init__(
+        self,
+        socket_dir: str,
+        interface: str,
+        command_latency: float = 0.0,
+        exchange_time: float = 0.0,
+        auth_failure_rate: float = 0.0,
+        conf_failure_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self.socket_path = os.path.join(socket_dir, interface)
+        # コマンド1件あたりの応答遅延（秒）
+        self.command_latency = command_latency
+        # DPP_AUTH_INITから結果イベントまでの時間（秒）。0の場合は応答直後にイベントを送る
+        self.exchange_time = exchange_time
+        # DPP-AUTH-INIT-FAILED / DPP-CONF-FAILED を返す割合と、結果イベントを送らない割合
+        self.auth_failure_rate = auth_failure_rate
+        self.conf_failure_rate = conf_failure_rate
+        self.timeout_rate = timeout_rate
+        self.commands = 0
+        self.exchanges = 0
+        self.busy_rejections = 0
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self.configurators = set()
+        # STATUS で返す動作チャンネル
+        self.channel = "1"
+        # STA-FIRST / STA-NEXT で返す接続中ステーションのMACアドレス
+        self.stations: List[str] = []
+        self.monitors = set()
+        self._events = []
+        self._exchange_until = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.socket_path)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._sock is not None:
+            # 受信待ちのスレッドを起こしてからソケットを閉じる
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._thread.join()
+            self._sock.close()
+            self._sock = None
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def _exchange_events(self) -> List[str]:
+        """DPP交換の結果として送るイベント（失敗率に応じて選ぶ）"""
+        r = self._random.random()
+        if r < self.timeout_rate:
+            return []
+        r -= self.timeout_rate
+        if r < self.auth_failure_rate:
+            return ["<3>DPP-AUTH-INIT-FAILED"]
+        r -= self.auth_failure_rate
+        if r < self.conf_failure_rate:
+            return ["<3>DPP-AUTH-SUCCESS init=1", "<3>DPP-CONF-FAILED"]
+        return ["<3>DPP-AUTH-SUCCESS init=1", "<3>DPP-CONF-SENT"]
+
+    def handle(self, command: str, addr: str) -> str:
+        name, _, params = command.partition(" ")
+        if name == "DPP_CONFIGURATOR_ADD":
+            configurator_id = str(next(self._ids))
+            self.configurators.add(configurator_id)
+            return configurator_id
+        if name == "DPP_CONFIGURATOR_GET_KEY":
+            return "30770201" if params.strip() in self.configurators else "FAIL"
+        if name == "DPP_QR_CODE":
+            return str(next(self._ids))
+        if name == "DPP_AUTH_INIT":
+            args = dict(arg.split("=", 1) for arg in params.split(" ") if "=" in arg)
+            if args.get("configurator") not in self.configurators:
+                return "FAIL"
+            now = time.monotonic()
+            if now < self._exchange_until:
+                # 実行中のDPP交換がある
+                self.busy_rejections += 1
+                return "FAIL"
+            self.exchanges += 1
+            events = self._exchange_events()
+            if self.exchange_time > 0:
+                self._exchange_until = now + self.exchange_time
+                self._timer = threading.Timer(self.exchange_time, self._send_events, args=(events,))
+                self._timer.daemon = True
+                self._timer.start()
+            else:
+                self._events.extend(events)
+            return "OK"
+        if name == "STA-FIRST":
+            return self._station(0)
+        if name == "STA-NEXT":
+            try:
+                return self._station(self.stations.index(params.strip()) + 1)
+            except ValueError:
+                return "FAIL"
+        if name == "ATTACH":
+            self.monitors.add(addr)
+            return "OK"
+        if name == "DETACH":
+            self.monitors.discard(addr)
+            return "OK"
+        if name == "PING":
+            return "PONG"
+        if name == "STATUS":
+            return f"state=ENABLED\nchannel={self.channel}\n"
+        return "UNKNOWN COMMAND"
+
+    def _station(self, index: int) -> str:
+        if index >= len(self.stations):
+            return ""
+        return f"{self.stations[index]}\nflags=[AUTH][ASSOC][AUTHORIZED]\naid={index + 1}\nconnected_time={index}\n"
+
+    def _send_events(self, events: List[str]):
+        sock = self._sock
+        if sock is None:
+            return
+        for event in events:
+            for monitor in list(self.monitors):
+                try:
+                    sock.sendto(event.encode(), monitor)
+                except OSError:
+                    self.monitors.discard(monitor)
+
+    def _serve(self):
+        sock = self._sock
+        while True:
+            try:
+                data, addr = sock.recvfrom(4096)
+            except OSError:
+                return
+            if addr is None:
+                # shutdown() による終了
+                return
+            self.commands += 1
+            self._events = []
+            if self.command_latency > 0:
+                time.sleep(self.command_latency)
+            response = self.handle(data.decode(errors="replace"), addr)
+            try:
+                sock.sendto(response.encode(), addr)
+            except OSError:
+                pass
+            # 応答の後にイベントを送信する
+            self._send_events(self._events)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """疑似hostapdの動作を指定するオプション（ベンチマークと共通）"""
+    parser.add_argument("--command-latency", type=float, default=0.0, help="コマンドの応答遅延（秒）")
+    parser.add_argument("--exchange-time", type=float, default=0.0, help="DPP交換にかかる時間（秒）")
+    parser.add_argument("--auth-failure-rate", type=float, default=0.0, help="DPP-AUTH-INIT-FAILEDになる割合")
+    parser.add_argument("--conf-failure-rate", type=float, default=0.0, help="DPP-CONF-FAILEDになる割合")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="結果イベントが届かない割合")
+    parser.add_argument("--seed", type=int, default=None, help="失敗を決める乱数のシード")
+
+
+def from_arguments(args, socket_dir: str, interface: str) -> FakeHostapd:
+    return FakeHostapd(
+        socket_dir,
+        interface,
+        command_latency=args.command_latency,
+        exchange_time=args.exchange_time,
+        auth_failure_rate=args.auth_failure_rate,
+        conf_failure_rate=args.conf_failure_rate,
+        timeout_rate=args.timeout_rate,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="疑似hostapd制御ソケット")
+    parser.add_argument("--socket-dir", default="/tmp/hostapd", help="制御ソケットを作成するディレクトリ")
+    parser.add_argument("--interface", default="test", help="インターフェース名（カンマ区切りで複数指定可）")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    os.makedirs(args.socket_dir, exist_ok=True)
+    servers = [from_arguments(args, args.socket_dir, interface) for interface in args.interface.split(",")]
+    for server in servers:
+        server.start()
+        print(f"listening: {server.socket_path}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+書き込み（POST /api/devices/new）を並行して流しながら GET /api/devices の応答時間を計測する
+
+    cd backend
+    python -m benchmarks.load_get_devices --seed 5000 --readers 8 --writers 4 --duration 10
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+
+import uvicorn
+
+from app import database
+from app.config import settings
+
+from .fake_hostapd import FakeHostapd, sample_bootstrap_key
+
+INTERFACE = "load0"
+
+
+def seed(count: int):
+    devices_data = [
+        {
+            "mac_address": f"02:10:00:{i // 65536:02x}:{i // 256 % 256:02x}:{i % 256:02x}",
+            "channel": "81/1",
+            "key": "MDkwEwYHKoZIzj0CAQYIKoZIzj0DAQcDIgADload",
+            "ssid": "load",
+            "password": "password",
+            "status": "configured",
+        }
+        for i in range(count)
+    ]
+    for start in range(0, count, 1000):
+        database.create_devices(devices_data[start:start + 1000])
+
+
+def reader(base_url: str, limit: int, stop: threading.Event, timings: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        with urllib.request.urlopen(f"{base_url}/api/devices?limit={limit}") as response:
+            response.read()
+        timings.append(time.perf_counter() - start)
+
+
+def writer(base_url: str, index: int, stop: threading.Event, counter: list):
+    n = 0
+    while not stop.is_set():
+        body = json.dumps({
+            "mac_address": f"02:20:{index:02x}:{n // 65536 % 256:02x}:{n // 256 % 256:02x}:{n % 256:02x}",
+            "channel": "81/1",
+            "key": sample_bootstrap_key(n),
+            "ssid": "load",
+            "password": "password",
+        }).encode()
+        request = urllib.request.Request(
+            f"{base_url}/api/devices/new", data=body, headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request) as response:
+            response.read()
+        counter.append(1)
+        n += 1
+
+
+def measure(base_url: str, args, writers: int) -> tuple:
+    stop = threading.Event()
+    timings: list = []
+    writes: list = []
+    threads = [
+        threading.Thread(target=reader, args=(base_url, args.limit, stop, timings))
+        for _ in range(args.readers)
+    ] + [
+        threading.Thread(target=writer, args=(base_url, i, stop, writes))
+        for i in range(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return timings, len(writes)
+
+
+def report(label: str, timings: list, writes: int, duration: float):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(
+        f"{label:<12} reads={len(timings):<6} writes/s={writes / duration:8.1f} "
+        f"p50={statistics.median(timings) * 1000:8.2f}ms "
+        f"p99={p99 * 1000:8.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="書き込み負荷時のデバイス一覧取得の応答時間計測")
+    parser.add_argument("--seed", type=int, default=5000, help="事前に登録するデバイス数")
+    parser.add_argument("--limit", type=int, default=100, help="一覧取得の1ページあたりの件数")
+    parser.add_argument("--readers", type=int, default=8, help="一覧取得を行うスレッド数")
+    parser.add_argument("--writers", type=int, default=4, help="デバイス登録を行うスレッド数")
+    parser.add_argument("--duration", type=float, default=10.0, help="各計測の時間（秒）")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as socket_dir:
+        database.DATABASE_FILE = os.path.join(socket_dir, "load.db")
+        settings.hostapd_socket_dir = socket_dir
+        settings.dpp_interface = INTERFACE
+        hostapd = FakeHostapd(socket_dir, INTERFACE)
+        hostapd.start()
+
+        from main import app
+
+        server = uvicorn.Server(uvicorn.Config(app, port=args.port, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+        try:
+            seed(args.seed)
+            base_url = f"http://127.0.0.1:{args.port}"
+            report("idle", *measure(base_url, args, 0), args.duration)
+            report("under-write", *measure(base_url, args, args.writers), args.duration)
+        finally:
+            server.should_exit = True
+            thread.join()
+            hostapd.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,35 @@
+import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
-from app.database import init_database
-from app.routers import devices
+from app.database import close_database, init_database, open_database
+from app.dpp_events import start_event_monitors, stop_event_monitors
+from app.hostapd import close_hostapd_clients
+from app.jobs import recover_interrupted_devices, start_provisioning_workers, stop_provisioning_workers
+from app.routers import devices, metrics, profiles
+from app.stations import start_station_reconciler, stop_station_reconciler
+from app.tracing import LOG_FORMAT, install_log_record_factory
+
+install_log_record_factory()
+logging.basicConfig(level=settings.log_level, format=LOG_FORMAT)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    open_database()
     init_database()
+    recover_interrupted_devices()
+    start_event_monitors()
+    start_provisioning_workers()
+    start_station_reconciler()
     yield
+    stop_station_reconciler()
+    stop_provisioning_workers()
+    stop_event_monitors()
+    close_hostapd_clients()
+    close_database()
 
 
 app = FastAPI(title=settings.app_name, version=settings.version, lifespan=lifespan)
@@ -26,6 +45,8 @@ app.add_middleware(
 
 # ルーターの登録
 app.include_router(devices.router)
+app.include_router(metrics.router)
+app.include_router(profiles.router)
 
 
 @app.get("/")
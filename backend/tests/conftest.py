@@ -0,0 +1,48 @@
+import pytest
+
+from app import database, dpp, dpp_events, jobs
+from app.config import settings
+from app.hostapd import close_hostapd_clients
+from benchmarks.fake_hostapd import FakeHostapd, sample_bootstrap_key
+
+
+def device_data(index: int, **fields) -> dict:
+    """テスト用のデバイス（番号ごとに異なるMACアドレスとブートストラップ鍵）"""
+    return {
+        "mac_address": f"0200000000{index:02x}",
+        "channel": "81/1",
+        "key": sample_bootstrap_key(index),
+        "ssid": "test",
+        "password": "password",
+        **fields,
+    }
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_FILE", str(tmp_path / "test.db"))
+    database.open_database()
+    database.init_database()
+    yield
+    database.close_database()
+
+
+@pytest.fixture
+def hostapd(db, tmp_path, monkeypatch):
+    """疑似hostapdの1インターフェースでプロビジョニングワーカーを動かす"""
+    monkeypatch.setattr(settings, "hostapd_socket_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "dpp_interfaces", ["test0"])
+    monkeypatch.setattr(settings, "dpp_mode", "inprocess")
+    monkeypatch.setattr(settings, "dpp_timeout", 2)
+    monkeypatch.setattr(settings, "dpp_max_attempts", 2)
+    monkeypatch.setattr(settings, "dpp_retry_base_delay", 0.05)
+    monkeypatch.setattr(settings, "dpp_retry_max_delay", 0.1)
+    # 前のテストの疑似hostapdで作成したConfiguratorを使わない
+    monkeypatch.setattr(dpp, "_configurators", {})
+    server = FakeHostapd(str(tmp_path), "test0")
+    server.start()
+    yield server
+    jobs.stop_provisioning_workers()
+    dpp_events.stop_event_monitors()
+    close_hostapd_clients()
+    server.stop()
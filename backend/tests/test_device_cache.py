@@ -0,0 +1,45 @@
+from app import database
+
+from .conftest import device_data
+
+
+def _cached(device_id):
+    return database._device_cache.get(device_id)
+
+
+def test_create_and_update_write_through(db):
+    device_id = database.create_device(device_data(1, name="before"))
+    assert _cached(device_id)["name"] == "before"
+
+    updated = database.update_device(device_id, {"name": "after"})
+    assert updated["name"] == "after"
+    assert _cached(device_id)["name"] == "after"
+    assert database.get_device_by_id(device_id)["name"] == "after"
+
+
+def test_read_fills_cache(db):
+    device_id = database.create_device(device_data(1))
+    database._device_cache.clear()
+
+    assert database.get_device_by_id(device_id)["id"] == device_id
+    assert _cached(device_id) is not None
+
+
+def test_import_invalidates_cached_device(db):
+    device_id = database.create_device(device_data(1, name="scanned"))
+    assert _cached(device_id) is not None
+
+    database.import_devices([device_data(1, name="imported")])
+    assert _cached(device_id) is None
+    assert database.get_device_by_id(device_id)["name"] == "imported"
+
+
+def test_station_status_invalidates_cached_device(db):
+    device_id = database.create_device(device_data(1, status="configured"))
+    assert _cached(device_id)["status"] == "configured"
+
+    database.apply_station_status([(device_id, "online", "2026-01-01T00:00:00")])
+    assert _cached(device_id) is None
+    device = database.get_device_by_id(device_id)
+    assert device["status"] == "online"
+    assert device["last_seen"] == "2026-01-01T00:00:00"
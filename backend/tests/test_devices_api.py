@@ -0,0 +1,70 @@
+from fastapi.testclient import TestClient
+
+from app import database
+from main import app
+
+from .conftest import device_data
+
+
+def test_list_formats_return_the_same_devices(db):
+    database.import_devices([device_data(index, status="configured") for index in range(3)])
+    client = TestClient(app)
+
+    typed = client.get("/api/devices").json()
+    fast = client.get("/api/devices", params={"format": "fast"}).json()
+
+    assert typed == fast
+    assert [device["mac_address"] for device in typed["data"]] == [f"0200000000{i:02x}" for i in (2, 1, 0)]
+    assert client.get("/api/devices", params={"fields": "id,status"}).json()["data"][0] == {
+        "id": typed["data"][0]["id"], "status": "configured"
+    }
+    response = client.get("/api/devices", params={"format": "xml"})
+    assert response.status_code == 400
+    assert response.json()["detail"]["error_code"] == "INVALID_FORMAT"
+
+
+def test_since_rejects_filters_and_wraps_database_errors(db, monkeypatch):
+    client = TestClient(app)
+    next_since = client.get("/api/devices").json()["next_since"]
+
+    response = client.get("/api/devices", params={"since": next_since, "status": "configured", "room": "101"})
+    assert response.status_code == 400
+    assert response.json()["detail"]["error_code"] == "INVALID_PARAMETERS"
+    assert "status, room" in response.json()["detail"]["error"]
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(database, "query_device_rows_since", fail)
+    response = client.get("/api/devices", params={"since": next_since})
+    assert response.status_code == 500
+    assert response.json()["detail"]["error_code"] == "INTERNAL_SERVER_ERROR"
+
+
+def test_update_device_validates_before_writing_and_reports_missing_device(db):
+    device_id = database.create_device(device_data(4))
+    client = TestClient(app)
+
+    response = client.put(f"/api/devices/{device_id}", json={"name": "kitchen", "status": "configured"})
+    assert response.status_code == 200
+    assert response.json()["data"]["name"] == "kitchen"
+    assert database.get_device_by_id(device_id)["status"] == "configured"
+
+    assert client.put(f"/api/devices/{device_id}", json={}).json()["detail"]["error_code"] == "NO_UPDATE_DATA"
+    response = client.put(f"/api/devices/{device_id}", json={"status": "unknown"})
+    assert response.json()["detail"]["error_code"] == "INVALID_STATUS"
+    response = client.put(f"/api/devices/{device_id + 1}", json={"name": "missing"})
+    assert response.status_code == 404
+    assert response.json()["detail"]["error_code"] == "DEVICE_NOT_FOUND"
+
+
+def test_created_range_is_parsed_as_iso_datetime(db):
+    database.import_devices([device_data(index) for index in range(2)])
+    client = TestClient(app)
+
+    assert len(client.get("/api/devices", params={"created_from": "2000-01-01"}).json()["data"]) == 2
+    assert client.get("/api/devices", params={"created_before": "2000-01-01 00:00"}).json()["data"] == []
+    assert len(client.get("/api/devices", params={"created_from": "2000-01-01T00:00:00Z"}).json()["data"]) == 2
+    response = client.get("/api/devices", params={"created_from": "yesterday"})
+    assert response.status_code == 400
+    assert response.json()["detail"]["error_code"] == "INVALID_DATE"
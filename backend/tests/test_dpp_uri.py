@@ -0,0 +1,83 @@
+import base64
+
+import pytest
+
+from app.dpp_uri import DppUriError, normalize_mac_prefix, parse_channel_list, parse_device_fields, parse_dpp_uri
+from benchmarks.fake_hostapd import sample_bootstrap_key
+
+KEY = sample_bootstrap_key(1)
+
+# AlgorithmIdentifier { id-ecPublicKey, prime256v1 }
+_P256_ALGORITHM = bytes.fromhex("301306072a8648ce3d020106082a8648ce3d030107")
+
+
+def _p256_key(point: bytes) -> str:
+    """点をprime256v1のSubjectPublicKeyInfoにしてbase64で返す"""
+    body = _P256_ALGORITHM + b"\x03" + bytes([len(point) + 1]) + b"\x00" + point
+    return base64.b64encode(b"\x30" + bytes([len(body)]) + body).decode()
+
+
+def test_parse_normalizes_fields():
+    uri = parse_dpp_uri(f"DPP:V:2;C:81/01,81/1,115/36;M:02:00:00:AA:BB:CC;I:sensor;K:{KEY};;")
+    assert uri.channel == "81/1,115/36"
+    assert uri.mac_address == "020000aabbcc"
+    assert uri.key == KEY
+    assert uri.curve == "prime256v1"
+    assert uri.info == "sensor"
+    assert uri.version == 2
+
+
+def test_parse_accepts_uncompressed_point():
+    assert parse_dpp_uri(f"DPP:C:81/1;M:020000aabbcc;K:{_p256_key(bytes([4]) + bytes(64))};;").curve == "prime256v1"
+
+
+def test_parse_device_fields_matches_uri():
+    assert parse_device_fields("02-00-00-aa-bb-cc", "81/1", KEY) == parse_dpp_uri(
+        f"DPP:C:81/1;M:020000aabbcc;K:{KEY};;"
+    )
+
+
+@pytest.mark.parametrize("uri", [
+    "",
+    f"C:81/1;M:020000aabbcc;K:{KEY};;",
+    f"DPP:C:81/1;M:020000aabbcc;K:{KEY};",
+    f"DPP:M:020000aabbcc;K:{KEY};;",
+    f"DPP:C:81/1;K:{KEY};;",
+    "DPP:C:81/1;M:020000aabbcc;;",
+    f"DPP:C:81/1;C:81/6;M:020000aabbcc;K:{KEY};;",
+    f"DPP:C:81;M:020000aabbcc;K:{KEY};;",
+    f"DPP:C:81/256;M:020000aabbcc;K:{KEY};;",
+    f"DPP:C:81/1;M:020000aabbc;K:{KEY};;",
+    f"DPP:C:81/1;M:020000aabbzz;K:{KEY};;",
+    f"DPP:V:x;C:81/1;M:020000aabbcc;K:{KEY};;",
+    "DPP:C:81/1;M:020000aabbcc;K:not-base64!;;",
+    # base64だがSubjectPublicKeyInfoではない
+    "DPP:C:81/1;M:020000aabbcc;K:AAAA;;",
+    # 点の長さが曲線と一致しない
+    f"DPP:C:81/1;M:020000aabbcc;K:{_p256_key(bytes([2]) + bytes(31))};;",
+    f"DPP:C:81/1;M:020000aabbcc;K:{_p256_key(bytes([5]) + bytes(32))};;",
+])
+def test_parse_rejects_invalid_uri(uri):
+    with pytest.raises(DppUriError):
+        parse_dpp_uri(uri)
+
+
+def test_rejected_uri_is_rejected_again_from_cache():
+    uri = "DPP:C:81/1;M:020000aabbcc;K:AAAA;;"
+    for _ in range(2):
+        with pytest.raises(DppUriError):
+            parse_dpp_uri(uri)
+
+
+def test_parse_channel_list_rejects_out_of_range():
+    with pytest.raises(DppUriError):
+        parse_channel_list("0/1")
+
+
+def test_normalize_mac_prefix():
+    assert normalize_mac_prefix("02:00:AA") == "0200aa"
+    assert normalize_mac_prefix("02-00") == "0200"
+    with pytest.raises(DppUriError):
+        normalize_mac_prefix("02:zz")
+    with pytest.raises(DppUriError):
+        normalize_mac_prefix("02" * 7)
@@ -0,0 +1,80 @@
+import threading
+
+from app import database, jobs
+
+from .conftest import device_data
+
+
+def test_failed_job_retries_then_dead_letters_and_requeues(hostapd):
+    hostapd.conf_failure_rate = 1.0
+    job = jobs.enqueue_new_device(device_data(1))
+    assert job.done.wait(10)
+
+    assert job.status == "failed"
+    assert job.attempts == 2
+    assert database.get_device_by_id(job.device_id)["status"] == "dead_letter"
+    assert [attempt["success"] for attempt in database.get_provisioning_attempts(job.device_id)] == [False, False]
+
+    hostapd.conf_failure_rate = 0.0
+    (requeued,) = jobs.requeue_dead_letter_devices([job.device_id])
+    assert requeued.device_id == job.device_id
+    assert requeued.done.wait(10)
+
+    assert requeued.status == "completed"
+    assert requeued.attempts == 1
+    assert database.get_device_by_id(job.device_id)["status"] == "configured"
+    # dead_letterではなくなったデバイスは再投入しない
+    assert jobs.requeue_dead_letter_devices([job.device_id]) == []
+
+
+def test_concurrent_enqueue_of_same_device_shares_one_job(hostapd):
+    # DPP交換が終わるまでジョブを実行中のままにする
+    hostapd.exchange_time = 0.5
+    barrier = threading.Barrier(8)
+    results = []
+
+    def enqueue():
+        barrier.wait()
+        results.append(jobs.enqueue_new_device(device_data(2)))
+
+    threads = [threading.Thread(target=enqueue) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({job.job_id for job in results}) == 1
+    assert results[0].done.wait(10)
+    assert results[0].status == "completed"
+    assert hostapd.exchanges == 1
+    devices, _ = database.query_devices()
+    assert len(devices) == 1
+
+    # 完了後の再スキャンは同じ設定で構成済みのため新たなDPP交換を行わない
+    again = jobs.enqueue_new_device(device_data(2))
+    assert again.job_id != results[0].job_id
+    assert again.done.is_set()
+    assert hostapd.exchanges == 1
+
+
+def test_stop_dead_letters_waiting_jobs_without_running_them(hostapd):
+    hostapd.exchange_time = 0.5
+    enqueued = [jobs.enqueue_new_device(device_data(index)) for index in range(3, 8)]
+
+    jobs.stop_provisioning_workers()
+
+    assert all(job.done.is_set() for job in enqueued)
+    # 停止時に実行中だったジョブだけが最後まで処理される
+    assert hostapd.exchanges == 1
+    statuses = sorted(database.get_device_by_id(job.device_id)["status"] for job in enqueued)
+    assert statuses == ["configured"] + ["dead_letter"] * 4
+
+
+def test_recover_interrupted_devices_dead_letters_configuring_rows(db):
+    configuring = database.create_device({**device_data(9), "status": "configuring"})
+    configured = database.create_device({**device_data(10), "status": "configured"})
+
+    assert jobs.recover_interrupted_devices() == 1
+
+    assert database.get_device_by_id(configuring)["status"] == "dead_letter"
+    assert database.get_device_by_id(configured)["status"] == "configured"
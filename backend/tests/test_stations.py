@@ -0,0 +1,39 @@
+from app import database
+from app.stations import StationReconciler
+
+from .conftest import device_data
+
+
+class _Stations:
+    def __init__(self, macs):
+        self.macs = macs
+
+    def iter_stations(self):
+        return ((mac, {}) for mac in self.macs)
+
+    def close(self):
+        pass
+
+
+def test_online_last_seen_is_written_every_n_syncs(db):
+    device_id = database.create_device(device_data(1, status="configured"))
+    reconciler = StationReconciler(["test0"], interval=1, last_seen_write_every=3)
+    reconciler._clients["test0"] = _Stations(["02:00:00:00:00:01"])
+
+    assert reconciler.sync_once() == 1
+    first_seen = database.get_device_by_id(device_id)["last_seen"]
+    assert database.get_device_by_id(device_id)["status"] == "online"
+
+    # 照合2回目はメモリ上だけで更新し、3回目にDBへ書き込む
+    assert reconciler.sync_once() == 0
+    assert database.get_device_by_id(device_id)["last_seen"] == first_seen
+    assert reconciler.sync_once() == 0
+    last_seen = database.get_device_by_id(device_id)["last_seen"]
+    assert last_seen > first_seen
+    assert last_seen == reconciler._devices[device_id].last_seen
+
+    reconciler._clients["test0"] = _Stations([])
+    assert reconciler.sync_once() == 1
+    device = database.get_device_by_id(device_id)
+    assert device["status"] == "offline"
+    assert device["last_seen"] == last_seen
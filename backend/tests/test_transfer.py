@@ -0,0 +1,37 @@
+import io
+import json
+
+from fastapi.testclient import TestClient
+
+from app import database
+from app.transfer import import_device_stream
+from main import app
+
+from .conftest import device_data
+
+
+def _ndjson(*records) -> io.BytesIO:
+    return io.BytesIO(''.join(json.dumps(record) + '\n' for record in records).encode())
+
+
+def test_import_rejects_invalid_key_configuring_status_and_unknown_profile(db):
+    profile = TestClient(app).post(
+        "/api/profiles", json={"name": "office", "ssid": "office", "password": "password"}
+    ).json()["data"]
+
+    result = import_device_stream(_ndjson(
+        device_data(1, profile_id=profile["id"]),
+        device_data(2, key="bm90IGEga2V5"),
+        device_data(3, status="configuring"),
+        device_data(4, profile_id=profile["id"] + 1),
+        device_data(5, profile_id="office"),
+    ), "ndjson")
+
+    assert result["imported"] == 1
+    assert result["skipped"] == 4
+    assert [error.split(":")[0] for error in result["errors"]] == ["2行目", "3行目", "4行目", "5行目"]
+    assert "認証情報プロファイルが見つかりません" in result["errors"][2]
+    devices, _ = database.query_devices()
+    assert [(device["mac_address"], device["profile_id"]) for device in devices] == [
+        ("020000000001", profile["id"])
+    ]
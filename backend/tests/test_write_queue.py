@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+from app.database import WriteQueue
+
+
+def _insert(conn, on_commit, value, committed):
+    conn.execute("INSERT INTO items (value) VALUES (?)", (value,))
+    on_commit.append(lambda: committed.append(value))
+    return value
+
+
+def _insert_then_fail(conn, on_commit, value, committed):
+    _insert(conn, on_commit, value, committed)
+    raise ValueError("書き込みに失敗しました")
+
+
+@pytest.fixture
+def database_file(tmp_path):
+    path = str(tmp_path / "write.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (value TEXT)")
+    conn.close()
+    return path
+
+
+def test_failed_write_does_not_roll_back_batch(database_file):
+    write_queue = WriteQueue(database_file, max_batch=16)
+    committed = []
+    # 書き込みスレッドの開始前に投入し、1回のコミットにまとめる
+    futures = [
+        write_queue.submit(_insert, "a", committed),
+        write_queue.submit(_insert_then_fail, "b", committed),
+        write_queue.submit(_insert, "c", committed),
+    ]
+    write_queue.start()
+    try:
+        assert futures[0].result(timeout=5) == "a"
+        with pytest.raises(ValueError):
+            futures[1].result(timeout=5)
+        assert futures[2].result(timeout=5) == "c"
+    finally:
+        write_queue.stop()
+
+    conn = sqlite3.connect(database_file)
+    values = [row[0] for row in conn.execute("SELECT value FROM items ORDER BY rowid")]
+    conn.close()
+    assert values == ["a", "c"]
+    # 取り消した書き込みのコミット後の処理は実行しない
+    assert committed == ["a", "c"]
+
+
+def test_submit_from_writer_thread_is_rejected(database_file):
+    write_queue = WriteQueue(database_file, max_batch=16)
+    write_queue.start()
+    try:
+        future = write_queue.submit(lambda conn, on_commit: write_queue.submit(_insert, "x", []))
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    finally:
+        write_queue.stop()
@@ -1,2 +1,4 @@
 # provisioning_cli package
-from .hostapd_client import HostapdClient
+from .async_client import AsyncHostapdClient, AsyncHostapdMonitor
+from .hostapd_client import HostapdClient, format_command, parse_station
+from .monitor import HostapdMonitor, parse_event
@@ -0,0 +1,320 @@
+"""
+hostapdと同じホストで動かすプロビジョニングエージェント
+バックエンドからのHTTP(JSON)リクエストを受けてDPPプロビジョニングを実行し、結果イベントまで待って応答する
+
+    AGENT_TOKEN=secret python -m provisioning_cli.agent --name ap1 --interfaces wlan0 --rooms 101,102 \
+        --listen 0.0.0.0:8700 --tls-cert agent.pem --tls-key agent.key
+
+ループバック以外のアドレスで待ち受ける場合はトークン（--token または AGENT_TOKEN）が必須
+リクエストにはWi-Fiのパスワード（conf_json）が含まれるため、APの外から接続する場合はTLSを使用する
+
+GET  /status    : エージェント名、部屋、インターフェースごとの動作チャンネルと負荷
+POST /provision : {"interface", "qr_code", "conf_json", "timeout"} -> {"success", "message"}
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from .hostapd_client import HostapdClient, format_command
+from .monitor import HostapdMonitor, parse_event
+
+logger = logging.getLogger("provisioning_cli.agent")
+
+# DPP交換の最終結果を表すイベント
+_SUCCESS_EVENTS = {"DPP-CONF-SENT"}
+_FAILURE_EVENTS = {"DPP-AUTH-INIT-FAILED", "DPP-CONF-FAILED", "DPP-FAIL", "DPP-NOT-COMPATIBLE"}
+
+
+class _Exchange:
+    def __init__(self, bootstrap_id):
+        self.bootstrap_id = bootstrap_id
+        self.result = None
+        self.done = threading.Event()
+
+
+class InterfaceWorker:
+    """1つのhostapdインターフェースでDPP交換を1つずつ実行する"""
+
+    def __init__(self, interface, socket_dir):
+        self.interface = interface
+        self.socket_dir = socket_dir
+        self.client = HostapdClient(interface, socket_dir=socket_dir)
+        self.waiting = 0
+        self.running = 0
+        self._configurator_id = None
+        self._exchange = None
+        # hostapdは1インターフェースにつき1つのDPP交換しか処理できない
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._monitor, name=f"agent-events-{interface}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.client.close()
+
+    def command(self, *args, timeout=10):
+        response = self.client.send_command(format_command(list(args)), timeout=timeout).strip()
+        return response != "FAIL", response
+
+    def channel(self):
+        """hostapdの STATUS から動作チャンネルを取得（取得できなければNone）"""
+        try:
+            ok, response = self.command("STATUS", timeout=2)
+        except (OSError, TimeoutError):
+            return None
+        for line in response.splitlines():
+            if line.startswith("channel="):
+                return line.split("=", 1)[1]
+        return None
+
+    def provision(self, qr_code, conf_json, timeout):
+        with self._counter_lock:
+            self.waiting += 1
+        with self._lock:
+            with self._counter_lock:
+                self.waiting -= 1
+                self.running += 1
+            try:
+                return self._provision(qr_code, conf_json, timeout)
+            finally:
+                with self._counter_lock:
+                    self.running -= 1
+
+    def _configurator(self, refresh=False):
+        if self._configurator_id is not None and not refresh:
+            return self._configurator_id
+        ok, response = self.command("DPP_CONFIGURATOR_ADD")
+        if not ok:
+            raise RuntimeError(f"DPP_CONFIGURATOR_ADD failed: {response}")
+        self._configurator_id = response
+        return response
+
+    def _provision(self, qr_code, conf_json, timeout):
+        configurator_id = self._configurator()
+        for attempt in range(2):
+            ok, bootstrap_id = self.command("DPP_QR_CODE", qr_code)
+            if not ok:
+                return False, f"DPP_QR_CODE failed: {bootstrap_id}"
+
+            exchange = _Exchange(bootstrap_id)
+            self._exchange = exchange
+            try:
+                ok, response = self.command(
+                    "DPP_AUTH_INIT", f"peer={bootstrap_id}", f"configurator={configurator_id}",
+                    f"conf_json={conf_json}", timeout=timeout
+                )
+                if ok:
+                    if not exchange.done.wait(timeout):
+                        return False, "DPP result event timed out"
+                    return exchange.result
+            finally:
+                self._exchange = None
+
+            # hostapdの再起動でConfiguratorが失われた場合は作り直して一度だけ再試行する
+            if attempt == 0 and not self.command("DPP_CONFIGURATOR_GET_KEY", configurator_id)[0]:
+                configurator_id = self._configurator(refresh=True)
+                continue
+            return False, f"DPP_AUTH_INIT failed: {response}"
+        return False, "DPP_AUTH_INIT failed"
+
+    def _monitor(self):
+        monitor = None
+        while not self._stop.is_set():
+            if monitor is None:
+                try:
+                    monitor = HostapdMonitor(self.interface, socket_dir=self.socket_dir)
+                    monitor.attach()
+                except OSError as e:
+                    logger.warning(f"ATTACH failed: interface={self.interface}, {e}")
+                    monitor = None
+                    self._stop.wait(5.0)
+                    continue
+            try:
+                line = monitor.recv_event(timeout=1.0)
+            except OSError as e:
+                logger.warning(f"event monitor disconnected: interface={self.interface}, {e}")
+                monitor.close()
+                monitor = None
+                continue
+            if line is not None:
+                self._dispatch(line)
+        if monitor is not None:
+            monitor.close()
+
+    def _dispatch(self, line):
+        name, params = parse_event(line)
+        if name in _SUCCESS_EVENTS:
+            result = (params.get("conf_status", "0") == "0", line)
+        elif name in _FAILURE_EVENTS:
+            result = (False, line)
+        else:
+            return
+        exchange = self._exchange
+        # peerを含まないイベントは実行中の交換に対するもの
+        if exchange is None or params.get("peer", exchange.bootstrap_id) != exchange.bootstrap_id:
+            return
+        exchange.result = result
+        exchange.done.set()
+
+
+class ProvisioningAgent:
+    def __init__(self, name, interfaces, socket_dir="/var/run/hostapd", rooms=()):
+        self.name = name
+        self.rooms = list(rooms)
+        self.workers = {interface: InterfaceWorker(interface, socket_dir) for interface in interfaces}
+        self.started_at = time.time()
+
+    def start(self):
+        for worker in self.workers.values():
+            worker.start()
+
+    def stop(self):
+        for worker in self.workers.values():
+            worker.stop()
+
+    def status(self):
+        return {
+            "name": self.name,
+            "rooms": self.rooms,
+            "uptime": time.time() - self.started_at,
+            "interfaces": {
+                interface: {
+                    "channel": worker.channel(),
+                    "running": worker.running,
+                    "waiting": worker.waiting,
+                }
+                for interface, worker in self.workers.items()
+            },
+        }
+
+    def provision(self, request):
+        worker = self.workers.get(request.get("interface"))
+        if worker is None:
+            return False, f"unknown interface: {request.get('interface')}"
+        try:
+            return worker.provision(request["qr_code"], request["conf_json"], float(request.get("timeout", 30)))
+        except (OSError, TimeoutError, RuntimeError) as e:
+            return False, f"hostapd error: {e}"
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+def make_server(agent, host, port, token=None):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _authorized(self):
+            if token and not hmac.compare_digest(self.headers.get("X-Agent-Token", ""), token):
+                self._reply(401, {"error": "unauthorized"})
+                return False
+            return True
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            if self.path == "/status":
+                self._reply(200, agent.status())
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            if self.path != "/provision":
+                self._reply(404, {"error": "not found"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except ValueError:
+                self._reply(400, {"error": "invalid json"})
+                return
+            correlation_id = request.get("correlation_id") or "-"
+            success, message = agent.provision(request)
+            logger.info(
+                f"[{correlation_id}] provision interface={request.get('interface')} success={success} {message}"
+            )
+            self._reply(200, {"success": success, "message": message})
+
+    return _ThreadingHTTPServer((host, port), Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="hostapdの隣で動かすDPPプロビジョニングエージェント")
+    parser.add_argument("--name", required=True, help="エージェント名（バックエンドの PROVISIONING_AGENTS と一致させる）")
+    parser.add_argument("--interfaces", required=True, help="DPPに使用するインターフェース（カンマ区切り）")
+    parser.add_argument("--rooms", default="", help="このAPが担当する部屋（カンマ区切り）")
+    parser.add_argument("--socket-dir", default="/var/run/hostapd", help="hostapd制御ソケットのディレクトリ")
+    parser.add_argument("--listen", default="127.0.0.1:8700", help="待ち受けるアドレスとポート")
+    parser.add_argument(
+        "--token", default=os.environ.get("AGENT_TOKEN"),
+        help="リクエストの X-Agent-Token ヘッダに要求する値（既定は環境変数 AGENT_TOKEN）"
+    )
+    parser.add_argument("--tls-cert", help="HTTPSで待ち受ける場合のサーバー証明書（PEM）")
+    parser.add_argument("--tls-key", help="サーバー証明書の秘密鍵（PEM、証明書と同じファイルの場合は省略）")
+    args = parser.parse_args()
+
+    host, _, port = args.listen.rpartition(":")
+    host = host or "127.0.0.1"
+    if not args.token and not is_loopback(host):
+        parser.error("ループバック以外のアドレスで待ち受ける場合は --token（または AGENT_TOKEN）を指定してください")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    agent = ProvisioningAgent(
+        args.name,
+        [name.strip() for name in args.interfaces.split(",") if name.strip()],
+        socket_dir=args.socket_dir,
+        rooms=[room.strip() for room in args.rooms.split(",") if room.strip()],
+    )
+    server = make_server(agent, host, int(port), args.token)
+    if args.tls_cert:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(args.tls_cert, args.tls_key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    elif not is_loopback(host):
+        logger.warning("TLSなしで待ち受けています。Wi-Fiのパスワードを含むリクエストが平文で送信されます")
+    agent.start()
+    logger.info(f"agent {args.name} listening on {args.listen}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        agent.stop()
+
+
+if __name__ == "__main__":
+    main()
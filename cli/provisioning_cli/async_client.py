@@ -0,0 +1,184 @@
+import asyncio
+import os
+
+from .hostapd_client import DEFAULT_RECV_BUFFER_SIZE, _Connection, parse_station
+
+
+def _open_connection(socket_path, recv_buffer_size=DEFAULT_RECV_BUFFER_SIZE):
+    conn = _Connection(socket_path, recv_buffer_size)
+    conn.sock.setblocking(False)
+    return conn
+
+
+async def _recv(loop, conn):
+    """データグラムが届くまで待ってから、_Connection.recv で応答全体を受信する"""
+    fd = conn.sock.fileno()
+    readable = loop.create_future()
+
+    def on_readable():
+        loop.remove_reader(fd)
+        if not readable.done():
+            readable.set_result(None)
+
+    loop.add_reader(fd, on_readable)
+    try:
+        await readable
+    finally:
+        # close() でソケットが閉じられていれば（fileno() == -1）監視は外されている
+        if conn.sock.fileno() == fd:
+            loop.remove_reader(fd)
+    return conn.recv()
+
+
+class AsyncHostapdClient:
+    """
+    HostapdClientのasyncio版
+    コマンドごとに接続を1本使うため、同時に複数のコマンドを送信できる（最大 max_connections）
+    タイムアウトやキャンセルで応答を受け取らなかった接続は、遅れて届く応答を
+    次のコマンドが受け取らないよう破棄する
+    """
+
+    def __init__(self, interface, socket_dir="/var/run/hostapd", max_connections=4,
+                 recv_buffer_size=DEFAULT_RECV_BUFFER_SIZE):
+        self.interface = interface
+        self.socket_path = f"{socket_dir}/{interface}"
+        self.max_connections = max_connections
+        self.recv_buffer_size = recv_buffer_size
+        # hostapdの再起動などで接続を張り直した回数
+        self.reconnects = 0
+        self._idle = []
+        self._slots = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    async def send_command(self, cmd, timeout=5):
+        if not os.path.exists(self.socket_path):
+            raise FileNotFoundError(f"hostapd control socket not found: {self.socket_path}")
+        if self._slots is None:
+            # イベントループ上で生成する（Python 3.9以前はループに紐付くため）
+            self._slots = asyncio.Semaphore(self.max_connections)
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else _open_connection(self.socket_path, self.recv_buffer_size)
+            try:
+                try:
+                    await loop.sock_sendall(conn.sock, cmd.encode())
+                except (ConnectionRefusedError, ConnectionResetError, FileNotFoundError):
+                    # hostapdが再起動して接続先が変わった場合は一度だけ張り直す
+                    conn.close()
+                    conn = _open_connection(self.socket_path, self.recv_buffer_size)
+                    self.reconnects += 1
+                    await loop.sock_sendall(conn.sock, cmd.encode())
+                response = await asyncio.wait_for(_recv(loop, conn), timeout)
+            except asyncio.TimeoutError:
+                conn.close()
+                raise TimeoutError("Timeout waiting for response from hostapd")
+            except BaseException:
+                # キャンセルを含め、応答を受け取れなかった接続は再利用しない
+                conn.close()
+                raise
+            self._idle.append(conn)
+            return response.decode(errors="replace")
+
+    async def iter_stations(self, timeout=5):
+        """STA-FIRST / STA-NEXT で接続中のステーションを1台ずつ (MACアドレス, 情報) として返す"""
+        station = parse_station(await self.send_command("STA-FIRST", timeout))
+        while station is not None:
+            yield station
+            station = parse_station(await self.send_command(f"STA-NEXT {station[0]}", timeout))
+
+    def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class AsyncHostapdMonitor:
+    """
+    HostapdMonitorのasyncio版
+    `async for line in monitor` でイベント行を受信できる（close()で終了する）
+    """
+
+    def __init__(self, interface, socket_dir="/var/run/hostapd"):
+        self.interface = interface
+        self.socket_path = f"{socket_dir}/{interface}"
+        self._conn = None
+        self._waiter = None
+
+    async def __aenter__(self):
+        await self.attach()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._conn is None:
+            raise StopAsyncIteration
+        try:
+            return await self.recv_event()
+        except asyncio.CancelledError:
+            if self._conn is None:
+                # close() による終了
+                raise StopAsyncIteration
+            raise
+
+    async def attach(self, timeout=5):
+        if not os.path.exists(self.socket_path):
+            raise FileNotFoundError(f"hostapd control socket not found: {self.socket_path}")
+        loop = asyncio.get_running_loop()
+        self._conn = _open_connection(self.socket_path)
+        try:
+            await loop.sock_sendall(self._conn.sock, b"ATTACH")
+            data = await asyncio.wait_for(_recv(loop, self._conn), timeout)
+        except asyncio.TimeoutError:
+            self.close()
+            raise TimeoutError("Timeout waiting for ATTACH response from hostapd")
+        except BaseException:
+            self.close()
+            raise
+        response = data.decode(errors="replace").strip()
+        if response != "OK":
+            self.close()
+            raise ConnectionError(f"ATTACH failed: {response}")
+
+    async def recv_event(self, timeout=None):
+        # イベント行（"<3>DPP-CONF-SENT" など）の優先度を除いて返す。タイムアウト時はNone
+        loop = asyncio.get_running_loop()
+        while True:
+            self._waiter = asyncio.ensure_future(_recv(loop, self._conn))
+            try:
+                data = await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self._waiter = None
+            line = data.decode(errors="replace").strip()
+            if line.startswith("<") and ">" in line:
+                return line.split(">", 1)[1]
+            # PINGに対するPONGなどコマンド応答は読み捨てる
+
+    def ping(self):
+        # hostapdが終了していれば ConnectionRefusedError などが送出される
+        self._conn.sock.send(b"PING")
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._waiter is not None:
+            # 受信待ちの async for を終了させる
+            self._waiter.get_loop().remove_reader(conn.sock.fileno())
+            self._waiter.cancel()
+        try:
+            conn.sock.send(b"DETACH")
+        except OSError:
+            pass
+        conn.close()
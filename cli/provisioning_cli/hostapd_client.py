@@ -1,32 +1,154 @@
-import socket
+import itertools
 import os
+import socket
+import sys
+import threading
 
-class HostapdClient:
-    def __init__(self, interface, socket_dir="/var/run/hostapd"):
-        self.interface = interface
-        self.socket_path = f"{socket_dir}/{interface}"
-        self.local_socket_path = f"/tmp/hostapd_cli_{os.getpid()}"
-        self.sock = None
 
-    def send_command(self, cmd, timeout=5):
-        if not os.path.exists(self.socket_path):
-            raise FileNotFoundError(f"hostapd control socket not found: {self.socket_path}")
+def format_command(args):
+    # conf_json=... の値をシングルクォートで囲む
+    command_args = []
+    for arg in args:
+        if arg.startswith("conf_json=") and not arg.startswith("conf_json='"):
+            key, val = arg.split("=", 1)
+            if not (val.startswith("'") and val.endswith("'")):
+                val = f"'{val}'"
+            command_args.append(f"{key}={val}")
+        else:
+            command_args.append(arg)
+    return " ".join(command_args)
+
+
+_connection_ids = itertools.count()
+
+# 受信前にデータグラムの実サイズを取得できない環境（Linux以外）での受信バッファサイズ
+DEFAULT_RECV_BUFFER_SIZE = 65536
+
+# Linuxでは MSG_PEEK|MSG_TRUNC で切り詰め前のデータグラム長が返る
+_PEEK_SIZE = sys.platform.startswith("linux")
+
+
+def parse_station(response):
+    # STA-FIRST / STA-NEXT の応答 -> (MACアドレス, {"aid": "1", ...})。ステーションが無ければNone
+    mac, _, rest = response.partition("\n")
+    mac = mac.strip()
+    if not mac or mac == "FAIL":
+        return None
+    info = {}
+    for line in rest.splitlines():
+        key, sep, val = line.partition("=")
+        if sep:
+            info[key] = val
+    return mac, info
+
+
+class _Connection:
+    """hostapd制御ソケットに接続済みの1本のデータグラムソケット"""
+
+    def __init__(self, socket_path, recv_buffer_size=DEFAULT_RECV_BUFFER_SIZE):
+        # 同一プロセス内の複数接続が衝突しないよう、接続ごとに一意なローカルパスを使う
+        self.local_socket_path = f"/tmp/hostapd_cli_{os.getpid()}_{next(_connection_ids)}"
         try:
             os.unlink(self.local_socket_path)
         except FileNotFoundError:
             pass
+        self.recv_buffer_size = recv_buffer_size
+        self._probe = bytearray(1)
         self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
         try:
             self.sock.bind(self.local_socket_path)
-            self.sock.settimeout(timeout)
-            self.sock.sendto(cmd.encode(), self.socket_path)
-            response, _ = self.sock.recvfrom(4096)
-            return response.decode(errors="replace")
-        except socket.timeout:
-            raise TimeoutError("Timeout waiting for response from hostapd")
-        finally:
-            self.sock.close()
+            self.sock.connect(socket_path)
+        except OSError:
+            self.close()
+            raise
+
+    def send(self, cmd, timeout):
+        self.sock.settimeout(timeout)
+        self.sock.send(cmd.encode())
+
+    def recv(self):
+        # 応答全体が入る長さで受信する（固定長のバッファでは大きな応答が黙って切り詰められる）
+        if _PEEK_SIZE:
+            size = self.sock.recv_into(self._probe, 1, socket.MSG_PEEK | socket.MSG_TRUNC)
+        else:
+            size = self.recv_buffer_size
+        return self.sock.recv(max(size, 1))
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.unlink(self.local_socket_path)
+        except FileNotFoundError:
+            pass
+
+
+class HostapdClient:
+    def __init__(self, interface, socket_dir="/var/run/hostapd", max_connections=4,
+                 recv_buffer_size=DEFAULT_RECV_BUFFER_SIZE):
+        self.interface = interface
+        self.socket_path = f"{socket_dir}/{interface}"
+        self.max_connections = max_connections
+        self.recv_buffer_size = recv_buffer_size
+        # hostapdの再起動などで接続を張り直した回数
+        self.reconnects = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def send_command(self, cmd, timeout=5):
+        if not os.path.exists(self.socket_path):
+            raise FileNotFoundError(f"hostapd control socket not found: {self.socket_path}")
+        with self._slots:
+            conn = self._checkout()
             try:
-                os.unlink(self.local_socket_path)
-            except FileNotFoundError:
-                pass
+                try:
+                    conn.send(cmd, timeout)
+                except (ConnectionRefusedError, ConnectionResetError, FileNotFoundError):
+                    # hostapdが再起動して接続先が変わった場合は一度だけ張り直す
+                    conn.close()
+                    conn = _Connection(self.socket_path, self.recv_buffer_size)
+                    with self._lock:
+                        self.reconnects += 1
+                    conn.send(cmd, timeout)
+                response = conn.recv()
+            except socket.timeout:
+                # 遅れて届く応答を次のコマンドが受け取らないよう接続を破棄する
+                conn.close()
+                raise TimeoutError("Timeout waiting for response from hostapd")
+            except OSError:
+                conn.close()
+                raise
+            self._checkin(conn)
+            return response.decode(errors="replace")
+
+    def iter_stations(self, timeout=5):
+        """
+        STA-FIRST / STA-NEXT で接続中のステーションを1台ずつ (MACアドレス, 情報) として返す
+        一覧全体を1つの文字列にまとめないため、ステーション数が多くてもメモリ使用量は一定
+        """
+        station = parse_station(self.send_command("STA-FIRST", timeout))
+        while station is not None:
+            yield station
+            station = parse_station(self.send_command(f"STA-NEXT {station[0]}", timeout))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _Connection(self.socket_path, self.recv_buffer_size)
+
+    def _checkin(self, conn):
+        with self._lock:
+            self._idle.append(conn)
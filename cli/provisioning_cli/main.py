@@ -1,32 +1,34 @@
 import sys
-from .hostapd_client import HostapdClient
+from .hostapd_client import HostapdClient, format_command
 
 def main():
     import argparse
     parser = argparse.ArgumentParser(description="hostapd制御ソケットにコマンドを送信する最小ツール")
+    parser.add_argument("--socket-dir", default="/var/run/hostapd", help="hostapd制御ソケットのディレクトリ")
+    parser.add_argument("--correlation-id", help="呼び出し元の処理を識別するID（エラー出力に付与）")
+    parser.add_argument("--stations", action="store_true", help="接続中のステーションを1台ずつ取得して1行ずつ出力する")
+    parser.add_argument("--recv-buffer-size", type=int, help="応答の受信バッファサイズ（Linux以外で大きな応答を受け取る場合）")
+    parser.add_argument("--stdin", action="store_true", help="コマンド文字列を標準入力から読み込む（パスワードをプロセスの引数に含めない場合）")
     parser.add_argument("interface", help="hostapdインターフェース名 (例: wlan0)")
     parser.add_argument("command", help="hostapdに送るコマンド文字列 (例: DPP_BOOTSTRAP_GEN type=qrcode)", nargs=argparse.REMAINDER)
     args = parser.parse_args()
 
-    # conf_json=... の値をシングルクォートで囲む
-    command_args = []
-    for arg in args.command:
-        if arg.startswith("conf_json=") and not arg.startswith("conf_json='"):
-            key, val = arg.split("=", 1)
-            if not (val.startswith("'") and val.endswith("'")):
-                val = f"'{val}'"
-            command_args.append(f"{key}={val}")
-        else:
-            command_args.append(arg)
-    command_str = " ".join(command_args)
+    command_str = sys.stdin.read().strip() if args.stdin else format_command(args.command)
 
-    client = HostapdClient(args.interface)
-    try:
-        response = client.send_command(command_str)
-        print(response)
-    except Exception as e:
-        print(f"エラー: {e}", file=sys.stderr)
-        sys.exit(1)
+    options = {"recv_buffer_size": args.recv_buffer_size} if args.recv_buffer_size else {}
+    with HostapdClient(args.interface, socket_dir=args.socket_dir, max_connections=1, **options) as client:
+        try:
+            if args.stations:
+                # "<MAC> key=value ..." の形式でステーションごとに出力する
+                for mac, info in client.iter_stations():
+                    print(" ".join([mac] + [f"{key}={val}" for key, val in info.items()]))
+            else:
+                response = client.send_command(command_str)
+                print(response)
+        except Exception as e:
+            prefix = f"[{args.correlation_id}] " if args.correlation_id else ""
+            print(f"{prefix}エラー: {e}", file=sys.stderr)
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,75 @@
+import os
+import socket
+
+from .hostapd_client import _Connection
+
+
+def parse_event(line):
+    # "DPP-AUTH-INIT-FAILED peer=3 iter=0" -> ("DPP-AUTH-INIT-FAILED", {"peer": "3", "iter": "0"})
+    name, _, rest = line.partition(" ")
+    params = {}
+    for token in rest.split():
+        if "=" in token:
+            key, val = token.split("=", 1)
+            params[key] = val
+    return name, params
+
+
+class HostapdMonitor:
+    """ATTACHした制御ソケットでhostapdの非同期イベントを受信する"""
+
+    def __init__(self, interface, socket_dir="/var/run/hostapd"):
+        self.interface = interface
+        self.socket_path = f"{socket_dir}/{interface}"
+        self._conn = None
+
+    def __enter__(self):
+        self.attach()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def attach(self, timeout=5):
+        if not os.path.exists(self.socket_path):
+            raise FileNotFoundError(f"hostapd control socket not found: {self.socket_path}")
+        self._conn = _Connection(self.socket_path)
+        try:
+            self._conn.send("ATTACH", timeout)
+            response = self._conn.recv().decode(errors="replace").strip()
+        except socket.timeout:
+            self.close()
+            raise TimeoutError("Timeout waiting for ATTACH response from hostapd")
+        except OSError:
+            self.close()
+            raise
+        if response != "OK":
+            self.close()
+            raise ConnectionError(f"ATTACH failed: {response}")
+
+    def recv_event(self, timeout=None):
+        # イベント行（"<3>DPP-CONF-SENT" など）の優先度を除いて返す。タイムアウト時はNone
+        self._conn.sock.settimeout(timeout)
+        while True:
+            try:
+                data = self._conn.recv()
+            except socket.timeout:
+                return None
+            line = data.decode(errors="replace").strip()
+            if line.startswith("<") and ">" in line:
+                return line.split(">", 1)[1]
+            # PINGに対するPONGなどコマンド応答は読み捨てる
+
+    def ping(self):
+        # hostapdが終了していれば ConnectionRefusedError などが送出される
+        self._conn.sock.send(b"PING")
+
+    def close(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.sock.send(b"DETACH")
+        except OSError:
+            pass
+        self._conn.close()
+        self._conn = None
@@ -18,7 +18,7 @@ export function EditDeviceModal({ device, isOpen, onClose, onSave }: EditDeviceM
   const [name, setName] = useState('');
   const [room, setRoom] = useState('');
   const [desc, setDesc] = useState('');
-  const [status, setStatus] = useState<'scanned' | 'configuring' | 'configured' | 'error'>('scanned');
+  const [status, setStatus] = useState<'scanned' | 'configuring' | 'configured' | 'error' | 'dead_letter' | 'online' | 'offline'>('scanned');
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
@@ -128,7 +128,7 @@ export function EditDeviceModal({ device, isOpen, onClose, onSave }: EditDeviceM
           <select
             id="status"
             value={status}
-            onChange={(e) => setStatus(e.target.value as 'scanned' | 'configuring' | 'configured' | 'error')}
+            onChange={(e) => setStatus(e.target.value as 'scanned' | 'configuring' | 'configured' | 'error' | 'dead_letter' | 'online' | 'offline')}
             className="mt-1 block w-full rounded-md border-gray-300 shadow-sm focus:border-indigo-500 focus:ring-indigo-500 sm:text-sm"
             disabled={isLoading}
           >
@@ -136,6 +136,9 @@ export function EditDeviceModal({ device, isOpen, onClose, onSave }: EditDeviceM
             <option value="configuring">Configuring</option>
             <option value="configured">Configured</option>
             <option value="error">Error</option>
+            <option value="dead_letter">Retries exhausted</option>
+            <option value="online">Online</option>
+            <option value="offline">Offline</option>
           </select>
         </div>
         <div className="flex justify-end space-x-2">
@@ -6,7 +6,7 @@ import type { Device } from '@/lib/types';
 import { EditDeviceModal } from './EditDeviceModal';
 import { Button } from './shadcn/ui/button';
 import { HoverCard, HoverCardContent, HoverCardTrigger } from './shadcn/ui/hover-card';
-import { Check, X } from 'lucide-react';
+import { Check, Wifi, WifiOff, X } from 'lucide-react';
 
 interface HistoryTableProps {
     history: Device[];
@@ -108,13 +108,27 @@ export function HistoryTable({ history, newDevices = [], onSave }: HistoryTableP
                                                         Allready configured
                                                     </HoverCardContent>
                                                 </HoverCard>
-                                            ) : item.status === 'error' ? (
+                                            ) : item.status === 'online' || item.status === 'offline' ? (
+                                                <HoverCard>
+                                                    <HoverCardTrigger>
+                                                        {item.status === 'online' ? (
+                                                            <Wifi className="ml-3 h-4 w-4 text-green-500" />
+                                                        ) : (
+                                                            <WifiOff className="ml-3 h-4 w-4 text-gray-400" />
+                                                        )}
+                                                    </HoverCardTrigger>
+                                                    <HoverCardContent>
+                                                        {item.status === 'online' ? 'Online' : 'Offline'}
+                                                        {item.last_seen ? ` (last seen ${item.last_seen})` : ''}
+                                                    </HoverCardContent>
+                                                </HoverCard>
+                                            ) : item.status === 'error' || item.status === 'dead_letter' ? (
                                                 <HoverCard>
                                                     <HoverCardTrigger>
                                                         <X className="ml-3 h-4 w-4 text-red-500" />
                                                     </HoverCardTrigger>
                                                     <HoverCardContent>
-                                                        Error
+                                                        {item.status === 'dead_letter' ? 'Retries exhausted' : 'Error'}
                                                     </HoverCardContent>
                                                 </HoverCard>
 
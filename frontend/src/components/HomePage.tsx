@@ -1,14 +1,17 @@
 'use client';
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { ConfigForm } from '@/components/ConfigForm';
 import { QRScanner } from '@/components/QRScanner';
 import { HistoryTable } from '@/components/HistoryTable';
 import { ScannedDevicesTable } from '@/components/ScannedDevicesTable';
 import { Layout } from '@/components/Layout';
-import { getDevicesClient, createNewDevice } from '@/lib/api';
+import { getDevicesClient, createNewDevice, getProvisioningJob, subscribeDeviceEvents } from '@/lib/api';
 import { DemoManager } from '@/lib/demo';
 import type { WiFiConfig, Device, QRData, CreateDeviceRequest } from '@/lib/types';
 
+// POST /new の応答より先に届いたステータスを保持する最大件数
+const MAX_RECEIVED_STATUSES = 1000;
+
 interface HomePageProps {
     initialHistory: Device[];
 }
@@ -19,15 +22,90 @@ export default function HomePage({ initialHistory }: HomePageProps) {
     const [wifiConfig, setWifiConfig] = useState<WiFiConfig>({ ssid: '', password: '' });
     const [error, setError] = useState<string | null>(null);
 
+    const mountedRef = useRef(true);
+    // 終了を待っているプロビジョニングジョブ: デバイスID -> ジョブID
+    const pendingJobsRef = useRef(new Map<number, string>());
+    // イベントで受け取った最新のステータス: デバイスID -> ステータス
+    const receivedStatusRef = useRef(new Map<number, Device['status']>());
+
     // クライアントサイドでデモモードの初期化を行う
     useEffect(() => {
+        mountedRef.current = true;
         if (DemoManager.isDemoMode()) {
             DemoManager.initializeDemoData();
             const demoHistory = DemoManager.getHistory();
             setHistory(demoHistory);
         }
+        return () => {
+            mountedRef.current = false;
+        };
     }, []);
 
+    // ジョブの状態をポーリングせず、デバイスイベント（SSE）でステータスの変化を受け取る
+    useEffect(() => {
+        return subscribeDeviceEvents(
+            (event) => {
+                if (event.event === 'updated' && event.fields.status) {
+                    applyDeviceStatus(event.id, event.fields.status);
+                }
+            },
+            async () => {
+                try {
+                    const refreshedDevices = await getDevicesClient();
+                    if (mountedRef.current) setHistory(refreshedDevices);
+                } catch (error) {
+                    console.error('デバイスリストの再取得に失敗:', error);
+                }
+            }
+        );
+    }, []);
+
+    const reportJobFailure = async (jobId: string) => {
+        try {
+            const job = await getProvisioningJob(jobId);
+            if (mountedRef.current) setError(`デバイス設定に失敗しました: ${job.message}`);
+        } catch (error) {
+            // 終了済みのジョブは一定数を超えると破棄される
+            console.error('プロビジョニングジョブの取得に失敗:', error);
+            if (mountedRef.current) setError('デバイス設定に失敗しました');
+        }
+    };
+
+    const finishPendingJob = (deviceId: number, status: Device['status']) => {
+        const jobId = pendingJobsRef.current.get(deviceId);
+        if (jobId === undefined || status === 'configuring') return;
+        pendingJobsRef.current.delete(deviceId);
+        if (status === 'dead_letter') {
+            reportJobFailure(jobId);
+        }
+    };
+
+    const applyDeviceStatus = (deviceId: number, status: Device['status']) => {
+        const received = receivedStatusRef.current;
+        received.delete(deviceId);
+        received.set(deviceId, status);
+        if (received.size > MAX_RECEIVED_STATUSES) {
+            received.delete(received.keys().next().value as number);
+        }
+        setHistory(prev => prev.map(d =>
+            d.id === deviceId ? { ...d, status } : d
+        ));
+        finishPendingJob(deviceId, status);
+    };
+
+    // POST /new は"configuring"で応答するため、ジョブが終了するまでイベントで履歴のステータスを更新する
+    const watchProvisioningJob = (deviceId: number, jobId: string) => {
+        pendingJobsRef.current.set(deviceId, jobId);
+        // 応答より先にイベントが届いていた場合はそのステータスを反映する
+        const status = receivedStatusRef.current.get(deviceId);
+        if (status !== undefined) {
+            setHistory(prev => prev.map(d =>
+                d.id === deviceId ? { ...d, status } : d
+            ));
+            finishPendingJob(deviceId, status);
+        }
+    };
+
     const handleScan = (data: QRData) => {
         if (!data.mac_address || !data.channel || !data.key) {
             setError('QRコードのデータ形式が正しくありません');
@@ -59,6 +137,7 @@ export default function HomePage({ initialHistory }: HomePageProps) {
 
         try {
             const createRequest: CreateDeviceRequest = {
+                uri: targetDevice.uri,
                 mac_address: targetDevice.mac_address,
                 channel: targetDevice.channel,
                 key: targetDevice.key,
@@ -81,6 +160,9 @@ export default function HomePage({ initialHistory }: HomePageProps) {
                 setHistory(prev => [newHistoryDevice, ...prev]);
                 setScannedDevices(prev => prev.filter(d => d.mac_address !== mac_address));
                 setError(null);
+                if (response.data.job_id) {
+                    watchProvisioningJob(response.data.id, response.data.job_id);
+                }
             }
         } catch (error) {
             // エラー時: ステータスをエラーに変更
@@ -103,6 +185,7 @@ export default function HomePage({ initialHistory }: HomePageProps) {
             const results = await Promise.allSettled(
                 scannedDevices.map(device =>
                     createNewDevice({
+                        uri: device.uri,
                         mac_address: device.mac_address,
                         channel: device.channel,
                         key: device.key,
@@ -114,10 +197,14 @@ export default function HomePage({ initialHistory }: HomePageProps) {
 
             const successfulDevices: Device[] = [];
             const failedDevices: string[] = [];
+            const startedJobs: [number, string][] = [];
 
             results.forEach((result, index) => {
                 if (result.status === 'fulfilled' && result.value.success) {
                     const device = scannedDevices[index];
+                    if (result.value.data.job_id) {
+                        startedJobs.push([result.value.data.id, result.value.data.job_id]);
+                    }
                     successfulDevices.push({
                         ...device,
                         id: result.value.data.id,
@@ -135,6 +222,8 @@ export default function HomePage({ initialHistory }: HomePageProps) {
             if (successfulDevices.length > 0) {
                 setHistory(prev => [...successfulDevices, ...prev]);
             }
+            // historyに追加した後で監視を始める（既に届いたステータスを反映するため）
+            startedJobs.forEach(([deviceId, jobId]) => watchProvisioningJob(deviceId, jobId));
 
             // 成功したデバイスをscannedDevicesから削除
             setScannedDevices(prev =>
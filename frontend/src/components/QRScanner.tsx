@@ -28,6 +28,7 @@ export function QRScanner({ onQrDetected }: QRScannerProps) {
                 channel: channelMatch[1],
                 mac_address: macMatch[1],
                 key: keyMatch[1],
+                uri: text.trim(),
             };
         }
         return null;
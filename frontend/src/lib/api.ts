@@ -1,4 +1,6 @@
-import type { Device, ApiResponse, CreateDeviceRequest, CreateDeviceResponse } from './types';
+import type {
+    Device, ApiResponse, CreateDeviceRequest, CreateDeviceResponse, DeviceEvent, ProvisioningJob
+} from './types';
 import { DemoManager } from './demo';
 
 const API_BASE_URL = process.env.API_BASE_URL === undefined
@@ -117,4 +119,60 @@ export async function createNewDevice(request: CreateDeviceRequest): Promise<Cre
         console.error('Error creating new device:', error);
         throw error;
     }
-}
\ No newline at end of file
+}
+
+export async function getProvisioningJob(jobId: string): Promise<ProvisioningJob> {
+    const response = await fetch(`${API_BASE_URL}/api/devices/jobs/${jobId}`, {
+        cache: 'no-store',
+    });
+
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const result: ApiResponse<ProvisioningJob> = await response.json();
+
+    if (!result.success || !result.data) {
+        throw new Error(result.error || 'ジョブ取得に失敗しました');
+    }
+
+    return result.data;
+}
+
+// デバイスの作成・更新イベントを購読し、購読を解除する関数を返す
+// 取りこぼし（resyncイベントまたは再接続）があった場合はonResyncで一覧の再取得を促す
+export function subscribeDeviceEvents(
+    onEvent: (event: DeviceEvent) => void,
+    onResync: () => void
+): () => void {
+    if (DemoManager.isDemoMode()) {
+        // デモモード: 配信するイベントはない
+        return () => {};
+    }
+
+    const source = new EventSource(`${API_BASE_URL}/api/devices/events`);
+    let disconnected = false;
+    const handleEvent = (message: MessageEvent) => {
+        try {
+            onEvent(JSON.parse(message.data) as DeviceEvent);
+        } catch (error) {
+            console.error('Error parsing device event:', error);
+        }
+    };
+
+    source.addEventListener('created', handleEvent);
+    source.addEventListener('updated', handleEvent);
+    source.addEventListener('resync', () => onResync());
+    source.onerror = () => {
+        // EventSourceが自動で再接続する
+        disconnected = true;
+    };
+    source.onopen = () => {
+        if (disconnected) {
+            disconnected = false;
+            onResync();
+        }
+    };
+
+    return () => source.close();
+}
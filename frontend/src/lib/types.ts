@@ -2,6 +2,8 @@ export interface BasicDeviceInfo {
     mac_address: string;
     channel: string;
     key: string;
+    // QRコードのDPP URI（サーバー側で検証する）
+    uri?: string;
 }
 
 export interface ExtraDeviceInfo {
@@ -9,10 +11,13 @@ export interface ExtraDeviceInfo {
     date: string;
     name: string;
     ssid: string;
-    status: 'scanned' | 'configuring' | 'configured' | 'error';
+    status: 'scanned' | 'configuring' | 'configured' | 'error' | 'dead_letter' | 'online' | 'offline';
     password: string;
     room: string;
     desc: string;
+    last_seen: string | null;
+    // 認証情報プロファイルを使用したデバイスはパスワードを持たない
+    profile_id: number | null;
 }
 
 export type Device = BasicDeviceInfo & Partial<ExtraDeviceInfo>;
@@ -21,6 +26,7 @@ export interface QRData {
     mac_address: string;
     channel: string;
     key: string;
+    uri?: string;
     pincode?: string;
 }
 
@@ -36,11 +42,13 @@ export interface ApiResponse<T> {
 }
 
 export interface CreateDeviceRequest {
+    uri?: string;
     mac_address: string;
     channel: string;
     key: string;
     ssid: string;
     password: string;
+    profile_id?: number;
 }
 
 export interface CreateDeviceResponseData {
@@ -49,6 +57,7 @@ export interface CreateDeviceResponseData {
     status: string;
     message: string;
     date: string;
+    job_id?: string;
 }
 
 export interface CreateDeviceResponse {
@@ -57,6 +66,15 @@ export interface CreateDeviceResponse {
     error?: string;
 }
 
+export interface ProvisioningJob {
+    job_id: string;
+    device_id: number;
+    status: 'queued' | 'running' | 'retrying' | 'completed' | 'failed';
+    message: string;
+    attempts: number;
+    finished_at?: string | null;
+}
+
 export type CameraStatus = 'idle' | 'starting' | 'scanning' | 'error';
 
 export interface Appstate {
@@ -65,4 +83,8 @@ export interface Appstate {
     loading: boolean;
     error: string | null;
     newDevices: Device[] | null;
-}
\ No newline at end of file
+}
+// GET /api/devices/events で配信されるイベント
+export type DeviceEvent =
+    | { event: 'created'; id: number; mac_address: string; status: Device['status']; updated_at: string }
+    | { event: 'updated'; id: number; fields: Partial<Device>; updated_at: string };